@@ -1,21 +1,108 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional
 
 class Settings(BaseSettings):
+    # 向量存储配置
+    vector_store_backend: str = "chroma"  # 可选: chroma, numpy, ivf, hnsw, binary
+    shard_count: int = 1  # 分片数，大于1时按分片布局存储并并发搜索
+    shard_routing: str = "hash"  # 分片路由方式: hash（按文档ID哈希）, source_file（同一文件的块在同一分片）
+    insert_batch_size: int = 256  # 批量插入时每次写入向量存储的文档数
+    snapshot_part_size: int = 50000  # 快照每个分卷的文档数
+    document_list_max_limit: int = 100  # 文档列表每页最大条数
+    document_preview_chars: int = 200  # 文档列表中内容预览的字符数
+    batch_search_max_questions: int = 500  # 批量检索接口单次最多的问题数
+    batch_generation_concurrency: int = 4  # 批量检索生成答案时的最大并发LLM请求数
+    min_relevance_score: float = 0.0  # 检索结果的最低余弦相似度，低于该值的文档不用于生成答案
+    metadata_index_fields: List[str] = ["source_file", "file_type", "product"]  # 可用于过滤查询的元数据字段
+    compaction_deleted_ratio: float = 0.2  # 已删除行占比达到该值时后台压缩索引
+    compaction_min_deleted: int = 100  # 已删除行少于该数量时不压缩
+    
     # ChromaDB配置
     chroma_db_path: str = "./chroma_db"  # ChromaDB存储路径
     
+    # NumPy平面索引配置
+    numpy_index_path: str = "./data/numpy_index"  # 内存映射索引文件目录
+    
+    # IVF索引配置（基于NumPy平面索引的存储）
+    ivf_nlist: int = 0  # 簇数量，0表示按 4*sqrt(N) 自动选择
+    ivf_nprobe: int = 8  # 默认每次查询扫描的簇数量
+    ivf_min_train_size: int = 1000  # 少于该数量时使用精确搜索
+    ivf_train_sample_per_list: int = 64  # 每个簇的训练样本数
+    ivf_train_iterations: int = 10  # k-means迭代次数
+    ivf_retrain_growth: float = 2.0  # 数据量达到上次训练时的倍数后重新训练
+    ivf_retrain_drift: float = 1.5  # 新数据量化误差超过训练时误差的倍数后重新训练
+    
+    # HNSW图索引配置（基于NumPy平面索引的存储）
+    hnsw_m: int = 16  # 每个节点的邻居数（第0层为2M）
+    hnsw_ef_construction: int = 100  # 构建时的候选列表大小
+    hnsw_ef_search: int = 64  # 默认查询时的候选列表大小
+    hnsw_save_interval: int = 1000  # 累计插入多少个节点后保存一次图
+    
+    # 二值量化索引配置（基于NumPy平面索引的存储）
+    binary_rerank_factor: int = 20  # 汉明距离粗筛保留 top_k 的多少倍候选用于精确重排
+    
+    # 近重复块检测配置（加载文档时）
+    dedup_enabled: bool = True
+    dedup_threshold: float = 0.8  # 签名估计的Jaccard相似度达到该值视为近重复
+    dedup_num_perm: int = 128  # MinHash排列数
+    dedup_bands: int = 32  # LSH的band数（每个band的行数 = 排列数 / band数）
+    dedup_shingle_size: int = 5  # 字符n-gram长度
+    dedup_state_path: str = "./data/dedup_state.npz"  # 签名和链接关系的持久化文件
+    
+    # 混合检索配置（BM25关键词检索 + 向量检索，倒数排名融合）
+    hybrid_search_enabled: bool = False  # 请求未指定 hybrid 时的默认值；已有知识库启用前先运行 scripts/build_lexical_index.py 建立BM25索引
+    lexical_index_path: str = "./data/lexical_index"  # BM25倒排索引目录
+    bm25_k1: float = 1.2  # 词频饱和参数
+    bm25_b: float = 0.75  # 文档长度归一化参数
+    rrf_k: int = 60  # 倒数排名融合的平滑常数
+    hybrid_candidate_factor: int = 3  # 两路检索各召回 top_k 的多少倍候选参与融合
+    bm25_min_score: float = 1.0  # 只由关键词命中的文档（没有余弦相似度，不受 min_score 约束）需要达到的BM25分数
+    
+    # 重排配置（第一阶段召回候选后用交叉编码器精排）
+    rerank_enabled: bool = False  # 请求未指定 rerank 时的默认值
+    rerank_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    rerank_candidates: int = 20  # 第一阶段召回的候选数（不少于 top_k）
+    rerank_batch_size: int = 32  # 交叉编码器每次前向计算的 (问题, 文档) 对数
+    rerank_cache_size: int = 10000  # (问题, 文档) 分数的内存LRU最大条目数
+    
+    # MMR多样化配置（减少相邻重叠块重复占用上下文）
+    mmr_lambda: Optional[float] = None  # 请求未指定 mmr_lambda 时的默认值，None表示不做MMR；越小越偏向多样性
+    mmr_candidate_factor: int = 4  # MMR从 top_k 的多少倍候选中选择
+    
+    # 语义答案缓存配置（相似问题直接返回已生成的答案）
+    answer_cache_enabled: bool = True
+    answer_cache_threshold: float = 0.95  # 问题向量的余弦相似度达到该值视为同一问题
+    answer_cache_ttl_seconds: float = 3600.0  # 条目有效期（秒）
+    answer_cache_size: int = 1000  # 最大条目数
+    
+    # 相邻块扩展配置（用小块精确检索，再取同一文件的前后块作为上下文）
+    context_expansion_neighbors: int = 0  # 请求未指定 expand_neighbors 时的默认值，0表示不扩展
+    context_expansion_max_neighbors: int = 5  # 请求允许的最大扩展块数（每侧）
+    
     # Ollama配置
     ollama_base_url: str = "http://localhost:11434"
     ollama_model: str = "llama3.1"
     
     # 嵌入模型配置
     embedding_model: str = "paraphrase-albert-small-v2"
+    tfidf_state_path: str = "./data/tfidf_state.npz"  # 简单嵌入服务TF-IDF状态文件
+    tfidf_drift_warning_threshold: float = 0.1  # 增量更新后IDF相对拟合时的漂移超过该比例时记录警告
+    embedding_batch_size: int = 64  # 批量嵌入时每次前向计算的文本数
+    embedding_batch_window_ms: float = 5.0  # 查询嵌入微批处理的收集窗口（毫秒）
+    embedding_batch_max_size: int = 32  # 查询嵌入微批处理的最大批次
+    
+    # 嵌入缓存配置
+    embedding_cache_enabled: bool = True
+    embedding_cache_size: int = 10000  # 内存LRU最大条目数
+    embedding_cache_path: str = "./data/embedding_cache.sqlite3"  # 磁盘缓存路径，留空则只使用内存缓存
     
     # 应用配置
     max_documents: int = 5
     vector_dimension: int = 768
     
+    # 启动配置
+    service_ready_timeout: float = 120.0  # 请求等待后台加载的服务就绪的最长时间（秒）
+    
     # 生成参数
     max_tokens: int = 1024
     temperature: float = 0.1
@@ -1,5 +1,11 @@
 from fastapi import FastAPI
-from app.routes import documents, query
+from app.routes import documents, query, search
+from app.services.answer_cache import answer_cache
+from app.services.embedding_service import embedding_service
+from app.services.embedding_dispatcher import embedding_dispatcher
+from app.services.lexical_index import lexical_index
+from app.services.rerank_service import rerank_service
+from app.utils.lazy_service import get_services_status, load_all_in_background
 import logging
 
 # 配置日志
@@ -13,14 +19,19 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# 启动时初始化（ChromaDB自动初始化，无需手动操作）
+# 启动时初始化：嵌入模型、向量数据库和Ollama连接在后台加载，不阻塞端口绑定
 @app.on_event("startup")
 async def startup_event():
     try:
-        logger.info("应用启动完成，ChromaDB已就绪")
+        load_all_in_background()
+        logger.info("应用启动完成，服务组件正在后台加载")
     except Exception as e:
         logger.error(f"启动时初始化失败: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await embedding_dispatcher.close()
+
 # 健康检查端点
 @app.get("/")
 async def root():
@@ -28,11 +39,31 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    components = get_services_status()
+    states = [component["state"] for component in components.values()]
+    if all(state == "ready" for state in states):
+        status = "healthy"
+    elif "failed" in states:
+        status = "degraded"
+    else:
+        status = "starting"
+    return {"status": status, "components": components}
+
+# 运行指标端点
+@app.get("/metrics")
+async def metrics():
+    return {
+        "embedding_cache": embedding_service.get_cache_stats() if embedding_service.is_ready() else {"loaded": False},
+        "embedding_dispatcher": embedding_dispatcher.get_stats(),
+        "lexical_index": lexical_index.get_stats() if lexical_index.is_ready() else {"loaded": False},
+        "rerank": rerank_service.get_stats() if rerank_service.is_ready() else {"loaded": False},
+        "answer_cache": answer_cache.get_stats()
+    }
 
 # 注册路由
 app.include_router(documents.router, prefix="/api/v1", tags=["文档管理"])
 app.include_router(query.router, prefix="/api/v1", tags=["问答"])
+app.include_router(search.router, prefix="/api/v1", tags=["检索"])
 
 if __name__ == "__main__":
     import uvicorn
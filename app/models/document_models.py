@@ -0,0 +1,151 @@
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Any, Dict, List, Literal, Optional
+
+
+class DocumentCreate(BaseModel):
+    """创建文档的请求体"""
+    content: str
+    metadata: Optional[Dict[str, Any]] = Field(default_factory=dict)
+
+
+class Document(BaseModel):
+    """知识库中的文档（文本块）"""
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: Optional[str] = Field(default=None, alias="_id")
+    content: str
+    metadata: Optional[Dict[str, Any]] = Field(default_factory=dict)
+    embedding: Optional[List[float]] = None
+    score: Optional[float] = None  # 检索结果的余弦相似度，非检索场景为None
+    rerank_score: Optional[float] = None  # 交叉编码器的相关度分数，未重排时为None
+
+
+class DocumentSummary(BaseModel):
+    """文档列表项：只包含元数据和内容预览，不含嵌入向量"""
+    id: str
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+    content_preview: str
+    content_length: int
+
+
+class DocumentPage(BaseModel):
+    """基于游标的文档分页"""
+    items: List[DocumentSummary]
+    next_cursor: Optional[str] = None  # 为None时表示没有下一页
+    total: int
+
+
+class BulkInsertError(BaseModel):
+    """批量插入中单个文档的错误"""
+    index: int
+    error: str
+
+
+class BulkInsertResult(BaseModel):
+    """批量插入结果"""
+    ids: List[Optional[str]]  # 与输入一一对应，插入失败的位置为None
+    errors: List[BulkInsertError] = Field(default_factory=list)
+
+    @property
+    def inserted_count(self) -> int:
+        return sum(1 for doc_id in self.ids if doc_id is not None)
+
+
+class DeleteResult(BaseModel):
+    """删除结果"""
+    deleted_count: int
+
+
+class ReplaceResult(BaseModel):
+    """按来源文件替换的结果：先写入新块，成功后删除旧块"""
+    source_file: str
+    deleted_count: int
+    inserted: BulkInsertResult
+
+
+class QueryRequest(BaseModel):
+    """问答请求"""
+    question: str
+    top_k: int = 5
+    # 召回/延迟提示：fast 更快、accurate 召回更高；仅近似索引后端使用
+    recall_hint: Optional[Literal["fast", "balanced", "accurate"]] = None
+    # 元数据过滤：{"字段": 值} 或 {"字段": [值1, 值2]}（任一取值），多个字段同时满足
+    filters: Optional[Dict[str, Any]] = None
+    # 最低相似度分数，低于该分数的文档不进入提示词；为None时使用配置的默认值
+    min_score: Optional[float] = None
+    # 是否同时使用BM25关键词检索并与向量检索融合；为None时使用配置的默认值
+    hybrid: Optional[bool] = None
+    # 是否先召回更多候选再用交叉编码器重排，只保留前 top_k 个；为None时使用配置的默认值
+    rerank: Optional[bool] = None
+    # MMR多样化的lambda（0-1，越小越偏向多样性），用于去掉内容重叠的相邻块；为None时使用配置的默认值
+    mmr_lambda: Optional[float] = None
+    # 每个命中块向前后各扩展的相邻块数（同一文件），连续的块合并为一段；为None时使用配置的默认值
+    expand_neighbors: Optional[int] = None
+
+
+class SearchRequest(BaseModel):
+    """仅检索请求（不调用LLM）"""
+    question: str
+    top_k: int = 5
+    recall_hint: Optional[Literal["fast", "balanced", "accurate"]] = None
+    filters: Optional[Dict[str, Any]] = None
+    min_score: Optional[float] = None
+    hybrid: Optional[bool] = None
+    rerank: Optional[bool] = None
+    mmr_lambda: Optional[float] = None
+    expand_neighbors: Optional[int] = None
+
+
+class SearchResult(BaseModel):
+    """检索结果"""
+    document_id: str
+    content: str
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+    score: float
+    rank: int
+    rerank_score: Optional[float] = None
+
+
+class SearchResponse(BaseModel):
+    """仅检索响应"""
+    question: str
+    results: List[SearchResult]
+    processing_time: float
+    timings: Dict[str, float] = Field(default_factory=dict)  # 各阶段耗时（秒）
+
+
+class QueryResponse(BaseModel):
+    """问答响应"""
+    answer: str
+    question: str
+    source_documents: List[SearchResult]
+    confidence: float
+    processing_time: float
+    total_documents_retrieved: int
+    timings: Dict[str, float] = Field(default_factory=dict)  # 各阶段耗时（秒）
+    cache_hit: bool = False  # 答案是否来自语义答案缓存
+
+
+class BatchSearchRequest(BaseModel):
+    """批量检索请求"""
+    questions: List[str]
+    top_k: int = 5
+    recall_hint: Optional[Literal["fast", "balanced", "accurate"]] = None
+    filters: Optional[Dict[str, Any]] = None
+    min_score: Optional[float] = None
+    # 为True时对每个问题调用LLM生成答案（并发数受配置限制）
+    generate_answers: bool = False
+
+
+class BatchSearchItem(BaseModel):
+    """单个问题的检索结果"""
+    question: str
+    results: List[SearchResult]
+    answer: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchSearchResponse(BaseModel):
+    """批量检索响应"""
+    items: List[BatchSearchItem]
+    processing_time: float
@@ -1,8 +1,15 @@
-from fastapi import APIRouter, HTTPException, status
-from app.models.document_models import Document, DocumentCreate
+from fastapi import APIRouter, HTTPException, Query, status
+from app.models.document_models import BulkInsertResult, DeleteResult, Document, DocumentCreate, DocumentPage, ReplaceResult
 from app.services.vector_store import vector_store
 from app.services.embedding_service import embedding_service
-from typing import List
+from app.services.answer_cache import answer_cache
+from app.services.lexical_index import lexical_index
+from app.services.near_duplicate_index import forget_documents
+from app.config.settings import settings
+from app.utils.lazy_service import ServiceNotReadyError, wait_for_services
+from app.utils.pagination import InvalidCursorError
+from typing import List, Optional
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,17 +22,27 @@ async def create_document(document: DocumentCreate):
     添加新文档到知识库
     """
     try:
-        # 生成文档的向量嵌入
-        embedding = embedding_service.get_embedding(document.content)
+        await wait_for_services(embedding_service, vector_store, lexical_index, timeout=settings.service_ready_timeout)
+        
+        # 嵌入和写入都是同步的CPU/IO操作，放到线程池执行以免阻塞事件循环
+        loop = asyncio.get_running_loop()
+        embedding = await loop.run_in_executor(None, embedding_service.get_embedding, document.content)
         
         # 存储到向量数据库
-        document_id = vector_store.insert_document(document, embedding)
+        result = await loop.run_in_executor(None, vector_store.insert_documents, [document], [embedding])
+        if result.errors:
+            raise RuntimeError(result.errors[0].error)
+        document_id = result.ids[0]
+        await loop.run_in_executor(None, lexical_index.add_documents, result.ids, [document])
+        answer_cache.bump_version()
         
         return {
             "message": "文档添加成功",
             "document_id": document_id,
             "content_length": len(document.content)
         }
+    except ServiceNotReadyError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except Exception as e:
         logger.error(f"添加文档失败: {e}")
         raise HTTPException(
@@ -33,25 +50,111 @@ async def create_document(document: DocumentCreate):
             detail=f"文档添加失败: {str(e)}"
         )
 
-@router.get("/documents/", response_model=List[Document])
-async def list_documents(limit: int = 10, skip: int = 0):
+@router.post("/documents/batch", response_model=BulkInsertResult, status_code=status.HTTP_201_CREATED)
+async def create_documents(documents: List[DocumentCreate]):
+    """
+    批量添加文档：一次批量生成嵌入，按批写入向量数据库，返回每个文档的ID和单项错误
+    """
+    try:
+        await wait_for_services(embedding_service, vector_store, lexical_index, timeout=settings.service_ready_timeout)
+        if not documents:
+            return BulkInsertResult(ids=[])
+        
+        # 批量嵌入和写入都是同步的CPU/IO操作，放到线程池执行以免阻塞事件循环
+        loop = asyncio.get_running_loop()
+        contents = [document.content for document in documents]
+        embeddings = await loop.run_in_executor(None, embedding_service.get_embeddings_batch, contents)
+        result = await loop.run_in_executor(None, vector_store.insert_documents, documents, embeddings)
+        await loop.run_in_executor(None, lexical_index.add_documents, result.ids, documents)
+        if result.inserted_count:
+            answer_cache.bump_version()
+        
+        logger.info(f"批量添加文档: 成功 {result.inserted_count}/{len(documents)}")
+        return result
+    except ServiceNotReadyError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception as e:
+        logger.error(f"批量添加文档失败: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"批量添加文档失败: {str(e)}"
+        )
+
+def _delete_documents(ids: List[str]) -> int:
+    deleted = vector_store.delete_documents(ids)
+    forget_documents(ids)
+    lexical_index.remove(ids)
+    answer_cache.invalidate_chunks(ids)
+    return deleted
+
+@router.put("/documents/", response_model=ReplaceResult)
+async def replace_source_file(documents: List[DocumentCreate], source_file: str = Query(..., min_length=1)):
     """
-    获取文档列表（主要用于调试）
+    替换某个来源文件的全部文档块：先写入新块，写入成功后再删除旧块，查询期间不会出现该文件没有内容的窗口
     """
     try:
-        # 注意：这里只是简单查询，不涉及向量搜索
-        cursor = vector_store.collection.find().skip(skip).limit(limit)
-        documents = []
+        await wait_for_services(embedding_service, vector_store, lexical_index, timeout=settings.service_ready_timeout)
+        for document in documents:
+            document.metadata = {**(document.metadata or {}), "source_file": source_file}
         
-        for doc in cursor:
-            documents.append(Document(
-                _id=str(doc["_id"]),
-                content=doc["content"],
-                metadata=doc.get("metadata", {}),
-                embedding=doc.get("embedding")
-            ))
+        loop = asyncio.get_running_loop()
+        old_ids = await loop.run_in_executor(None, vector_store.get_source_file_ids, source_file)
+        result = BulkInsertResult(ids=[])
+        if documents:
+            embeddings = await loop.run_in_executor(None, embedding_service.get_embeddings_batch, [document.content for document in documents])
+            result = await loop.run_in_executor(None, vector_store.insert_documents, documents, embeddings)
+        if result.errors:
+            # 新块没有全部写入时撤销已写入的新块并保留旧块，避免文件内容残缺
+            await loop.run_in_executor(None, vector_store.delete_documents, [doc_id for doc_id in result.ids if doc_id])
+            raise RuntimeError(f"{len(result.errors)} 个新文档块写入失败，已保留原有文档块")
+        await loop.run_in_executor(None, lexical_index.add_documents, result.ids, documents)
+        answer_cache.bump_version()
         
-        return documents
+        deleted = await loop.run_in_executor(None, _delete_documents, old_ids)
+        logger.info(f"替换来源文件 {source_file}: 删除 {deleted} 个旧块，写入 {result.inserted_count} 个新块")
+        return ReplaceResult(source_file=source_file, deleted_count=deleted, inserted=result)
+    except ServiceNotReadyError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception as e:
+        logger.error(f"替换来源文件失败: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"替换来源文件失败: {str(e)}"
+        )
+
+@router.delete("/documents/", response_model=DeleteResult)
+async def delete_source_file(source_file: str = Query(..., min_length=1)):
+    """
+    删除某个来源文件的全部文档块
+    """
+    try:
+        await wait_for_services(vector_store, lexical_index, timeout=settings.service_ready_timeout)
+        loop = asyncio.get_running_loop()
+        ids = await loop.run_in_executor(None, vector_store.get_source_file_ids, source_file)
+        deleted = await loop.run_in_executor(None, _delete_documents, ids)
+        return DeleteResult(deleted_count=deleted)
+    except ServiceNotReadyError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception as e:
+        logger.error(f"删除来源文件失败: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"删除来源文件失败: {str(e)}"
+        )
+
+@router.get("/documents/", response_model=DocumentPage)
+async def list_documents(limit: int = Query(20, ge=1), cursor: Optional[str] = None):
+    """
+    分页获取文档列表：返回ID、元数据和内容预览（不含嵌入向量），
+    将响应中的 next_cursor 作为下一次请求的 cursor 获取下一页
+    """
+    try:
+        await wait_for_services(vector_store, timeout=settings.service_ready_timeout)
+        return vector_store.list_documents(cursor=cursor, limit=min(limit, settings.document_list_max_limit))
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except ServiceNotReadyError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except Exception as e:
         logger.error(f"获取文档列表失败: {e}")
         raise HTTPException(
@@ -65,26 +168,48 @@ async def get_document(document_id: str):
     根据ID获取特定文档
     """
     try:
-        from bson import ObjectId
-        doc = vector_store.collection.find_one({"_id": ObjectId(document_id)})
+        await wait_for_services(vector_store, timeout=settings.service_ready_timeout)
         
+        doc = vector_store.get_document(document_id)
         if not doc:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="文档不存在"
             )
         
-        return Document(
-            _id=str(doc["_id"]),
-            content=doc["content"],
-            metadata=doc.get("metadata", {}),
-            embedding=doc.get("embedding")
-        )
+        return doc
     except HTTPException:
         raise
+    except ServiceNotReadyError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except Exception as e:
         logger.error(f"获取文档失败: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"获取文档失败: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.delete("/documents/{document_id}", response_model=DeleteResult)
+async def delete_document(document_id: str):
+    """
+    根据ID删除文档
+    """
+    try:
+        await wait_for_services(vector_store, lexical_index, timeout=settings.service_ready_timeout)
+        deleted = await asyncio.get_running_loop().run_in_executor(None, _delete_documents, [document_id])
+        if not deleted:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="文档不存在"
+            )
+        return DeleteResult(deleted_count=deleted)
+    except HTTPException:
+        raise
+    except ServiceNotReadyError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception as e:
+        logger.error(f"删除文档失败: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"删除文档失败: {str(e)}"
+        )
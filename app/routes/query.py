@@ -1,8 +1,18 @@
 from fastapi import APIRouter, HTTPException
-from app.models.document_models import QueryRequest, QueryResponse, SearchResult, Document
+from app.models.document_models import QueryRequest, QueryResponse
+from app.config.settings import settings
+from app.services.answer_cache import answer_cache
+from app.services.embedding_dispatcher import embedding_dispatcher
 from app.services.embedding_service import embedding_service
+from app.services.retriever import retrieve
 from app.services.vector_store import vector_store
 from app.services.llm_service import llm_service
+from app.services.ollama_http_service import FailedAnswer
+from app.utils.lazy_service import ServiceNotReadyError, wait_for_services
+from app.utils.metadata_filter import parse_filters
+from app.utils.retrieval import source_chunk_ids, to_search_results
+import asyncio
+import json
 import logging
 import time
 
@@ -31,20 +41,74 @@ async def query_knowledge_base(request: QueryRequest):
                 detail="top_k 参数必须在 1-20 之间"
             )
         
-        logger.info(f"处理问题: {request.question}")
+        if request.mmr_lambda is not None and not 0.0 <= request.mmr_lambda <= 1.0:
+            raise HTTPException(
+                status_code=400,
+                detail="mmr_lambda 参数必须在 0-1 之间"
+            )
+        
+        if request.expand_neighbors is not None and not 0 <= request.expand_neighbors <= settings.context_expansion_max_neighbors:
+            raise HTTPException(
+                status_code=400,
+                detail=f"expand_neighbors 参数必须在 0-{settings.context_expansion_max_neighbors} 之间"
+            )
         
-        # 1. 将问题转换为向量
-        query_embedding = embedding_service.get_embedding(request.question)
+        try:
+            filters = parse_filters(request.filters, settings.metadata_index_fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        # 2. 向量相似度搜索
-        relevant_docs = vector_store.similarity_search(
-            query_embedding, 
-            top_k=request.top_k
+        logger.info(f"处理问题: {request.question}")
+        
+        # 0. 等待依赖服务就绪（应用刚启动时模型可能仍在后台加载）
+        await wait_for_services(
+            embedding_service, vector_store,
+            timeout=settings.service_ready_timeout
         )
         
-        logger.info(f"检索到 {len(relevant_docs)} 个相关文档")
+        # 1. 将问题转换为向量（并发请求由调度器合并为批量计算）
+        timings = {}
+        embedding_started = time.time()
+        query_embedding = await embedding_dispatcher.embed(request.question)
+        timings["embedding"] = time.time() - embedding_started
         
-        # 3. 如果没有找到相关文档
+        # 2. 语义答案缓存：相似问题在相同请求参数下直接返回已生成的答案
+        cache_params = json.dumps(request.model_dump(exclude={"question"}), sort_keys=True, ensure_ascii=False)
+        corpus_version = None
+        if settings.answer_cache_enabled:
+            # 语料版本由各存储的提交点得出，其他进程的写入和删除同样使缓存失效
+            corpus_version = answer_cache.current_version()
+            cached = answer_cache.get(query_embedding, cache_params, version=corpus_version)
+            if cached is not None:
+                logger.info(f"答案缓存命中（相似度 {cached['similarity']:.4f}）")
+                return QueryResponse(
+                    answer=cached["answer"],
+                    question=request.question,
+                    source_documents=cached["source_documents"],
+                    confidence=cached["confidence"],
+                    processing_time=time.time() - start_time,
+                    total_documents_retrieved=len(cached["source_documents"]),
+                    timings=timings,
+                    cache_hit=True
+                )
+        
+        # 3. 检索，混合检索时同时进行关键词检索并融合；低相关度的文档被丢弃，避免无关内容进入提示词
+        # 启用重排时先召回更多候选，交叉编码器精排后只把最相关的 top_k 个送入提示词
+        relevant_docs = await retrieve(
+            request.question,
+            top_k=request.top_k,
+            recall_hint=request.recall_hint,
+            filters=filters,
+            min_score=request.min_score,
+            hybrid=request.hybrid,
+            rerank=request.rerank,
+            mmr_lambda=request.mmr_lambda,
+            neighbors=request.expand_neighbors,
+            timings=timings,
+            query_embedding=query_embedding
+        )
+        
+        # 4. 没有足够相关的文档时直接返回，不调用LLM
         if not relevant_docs:
             end_time = time.time()
             return QueryResponse(
@@ -53,27 +117,34 @@ async def query_knowledge_base(request: QueryRequest):
                 source_documents=[],
                 confidence=0.0,
                 processing_time=end_time - start_time,
-                total_documents_retrieved=0
+                total_documents_retrieved=0,
+                timings=timings
             )
         
-        # 4. 使用LLM基于检索到的文档生成答案
-        answer = llm_service.generate_answer(request.question, relevant_docs)
+        # 5. 使用LLM基于检索到的文档生成答案（只有需要生成时才等待LLM服务）
+        # 生成是阻塞的网络/CPU调用，放到线程池执行，不阻塞事件循环上的其他请求和嵌入批处理窗口
+        await wait_for_services(llm_service, timeout=settings.service_ready_timeout)
+        generation_started = time.time()
+        answer = await asyncio.get_running_loop().run_in_executor(None, llm_service.generate_answer, request.question, relevant_docs)
+        timings["generation"] = time.time() - generation_started
         
-        # 5. 计算简单的置信度（基于检索到的文档数量）
+        # 6. 计算简单的置信度（基于检索到的文档数量）
         confidence = min(len(relevant_docs) / request.top_k, 1.0)
         
         end_time = time.time()
         
-        # 转换文档格式为SearchResult
-        search_results = []
-        for i, doc in enumerate(relevant_docs):
-            search_results.append(SearchResult(
-                document_id=doc.id,
-                content=doc.content,
-                metadata=doc.metadata or {},
-                score=1.0 - (i * 0.1),  # 简单模拟分数
-                rank=i + 1
-            ))
+        # 转换文档格式为SearchResult（使用向量存储返回的真实相似度分数）
+        search_results = to_search_results(relevant_docs)
+        
+        # 7. 保存到答案缓存（生成失败的说明文字不缓存），引用的文档块更新或删除时失效
+        if settings.answer_cache_enabled and not isinstance(answer, FailedAnswer):
+            answer_cache.put(
+                query_embedding,
+                cache_params,
+                {"answer": answer, "source_documents": search_results, "confidence": round(confidence, 2)},
+                source_chunk_ids(relevant_docs),
+                version=corpus_version
+            )
         
         return QueryResponse(
             answer=answer,
@@ -81,11 +152,14 @@ async def query_knowledge_base(request: QueryRequest):
             source_documents=search_results,
             confidence=round(confidence, 2),
             processing_time=end_time - start_time,
-            total_documents_retrieved=len(relevant_docs)
+            total_documents_retrieved=len(relevant_docs),
+            timings=timings
         )
         
     except HTTPException:
         raise
+    except ServiceNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"处理查询失败: {e}")
         raise HTTPException(
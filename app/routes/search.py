@@ -0,0 +1,159 @@
+from fastapi import APIRouter, HTTPException
+from app.models.document_models import BatchSearchItem, BatchSearchRequest, BatchSearchResponse, Document, SearchRequest, SearchResponse
+from app.config.settings import settings
+from app.services.embedding_service import embedding_service
+from app.services.retriever import retrieve
+from app.services.vector_store import vector_store
+from app.services.llm_service import llm_service
+from app.utils.lazy_service import ServiceNotReadyError, wait_for_services
+from app.utils.metadata_filter import parse_filters
+from app.utils.retrieval import filter_by_score, to_search_results
+from typing import List
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+async def _generate_answers(questions: List[str], batches: List[List[Document]], items: List[BatchSearchItem]):
+    """以有限并发为每个问题生成答案，单个问题失败只记录在对应结果中"""
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max(1, settings.batch_generation_concurrency))
+
+    async def _generate(index: int):
+        docs = batches[index]
+        if not docs:
+            items[index].answer = "抱歉，在知识库中没有找到与您问题相关的信息。"
+            return
+        async with semaphore:
+            try:
+                items[index].answer = await loop.run_in_executor(None, llm_service.generate_answer, questions[index], docs)
+            except Exception as e:
+                logger.error(f"生成答案失败: {e}")
+                items[index].error = f"生成答案失败: {str(e)}"
+
+    await asyncio.gather(*(_generate(index) for index in range(len(questions))))
+
+
+@router.post("/search/", response_model=SearchResponse)
+async def search(request: SearchRequest):
+    """
+    仅检索接口 - 返回带真实相似度分数的排序结果，不调用LLM
+    """
+    try:
+        start_time = time.time()
+
+        if not request.question.strip():
+            raise HTTPException(status_code=400, detail="问题不能为空")
+        if request.top_k <= 0 or request.top_k > 20:
+            raise HTTPException(status_code=400, detail="top_k 参数必须在 1-20 之间")
+        if request.mmr_lambda is not None and not 0.0 <= request.mmr_lambda <= 1.0:
+            raise HTTPException(status_code=400, detail="mmr_lambda 参数必须在 0-1 之间")
+        if request.expand_neighbors is not None and not 0 <= request.expand_neighbors <= settings.context_expansion_max_neighbors:
+            raise HTTPException(
+                status_code=400,
+                detail=f"expand_neighbors 参数必须在 0-{settings.context_expansion_max_neighbors} 之间"
+            )
+
+        try:
+            filters = parse_filters(request.filters, settings.metadata_index_fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        await wait_for_services(embedding_service, vector_store, timeout=settings.service_ready_timeout)
+
+        timings = {}
+        docs = await retrieve(
+            request.question,
+            top_k=request.top_k,
+            recall_hint=request.recall_hint,
+            filters=filters,
+            min_score=request.min_score,
+            hybrid=request.hybrid,
+            rerank=request.rerank,
+            mmr_lambda=request.mmr_lambda,
+            neighbors=request.expand_neighbors,
+            timings=timings
+        )
+
+        return SearchResponse(
+            question=request.question,
+            results=to_search_results(docs),
+            processing_time=time.time() - start_time,
+            timings=timings
+        )
+
+    except HTTPException:
+        raise
+    except ServiceNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"检索失败: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"检索时发生错误: {str(e)}"
+        )
+
+
+@router.post("/search/batch", response_model=BatchSearchResponse)
+async def batch_search(request: BatchSearchRequest):
+    """
+    批量检索接口 - 一次批量嵌入全部问题，一次多向量检索，返回每个问题带分数的排序结果
+    """
+    try:
+        start_time = time.time()
+
+        if not request.questions:
+            raise HTTPException(status_code=400, detail="问题列表不能为空")
+        if len(request.questions) > settings.batch_search_max_questions:
+            raise HTTPException(
+                status_code=400,
+                detail=f"单次最多 {settings.batch_search_max_questions} 个问题"
+            )
+        if any(not question.strip() for question in request.questions):
+            raise HTTPException(status_code=400, detail="问题不能为空")
+        if request.top_k <= 0 or request.top_k > 20:
+            raise HTTPException(status_code=400, detail="top_k 参数必须在 1-20 之间")
+
+        try:
+            filters = parse_filters(request.filters, settings.metadata_index_fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        services = [embedding_service, vector_store] + ([llm_service] if request.generate_answers else [])
+        await wait_for_services(*services, timeout=settings.service_ready_timeout)
+
+        # 批量嵌入和检索都是同步计算，放到线程池执行以免阻塞事件循环
+        loop = asyncio.get_running_loop()
+        embeddings = await loop.run_in_executor(None, embedding_service.get_embeddings_batch, request.questions)
+        batches = await loop.run_in_executor(
+            None,
+            lambda: vector_store.batch_similarity_search(
+                embeddings, top_k=request.top_k, recall_hint=request.recall_hint, filters=filters
+            )
+        )
+        batches = [filter_by_score(docs, request.min_score) for docs in batches]
+
+        items = [
+            BatchSearchItem(question=question, results=to_search_results(docs))
+            for question, docs in zip(request.questions, batches)
+        ]
+        if request.generate_answers:
+            await _generate_answers(request.questions, batches, items)
+
+        logger.info(f"批量检索完成: {len(request.questions)} 个问题")
+        return BatchSearchResponse(items=items, processing_time=time.time() - start_time)
+
+    except HTTPException:
+        raise
+    except ServiceNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"批量检索失败: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"批量检索时发生错误: {str(e)}"
+        )
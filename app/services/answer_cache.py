@@ -0,0 +1,204 @@
+from app.config.settings import settings
+from app.services.lexical_index import lexical_index
+from app.services.vector_store import vector_store
+from app.utils.vector_ops import ArrayLike, prepare_query
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerCache:
+    """
+    语义答案缓存
+    以问题向量为键：过去问题的向量保存在一个小的内存矩阵中，新问题与全部条目一次矩阵乘法比较，
+    相似度达到阈值且请求参数相同时直接返回已生成的答案，不再调用LLM
+    每个条目记录生成答案时使用的文档块ID，这些块被更新或删除时条目失效；语料版本变化时全部失效
+    条目保存在当前进程内，语料版本在查找和保存时由 version_source 读取各存储的提交点得出，
+    其他进程的写入、删除和压缩同样使条目失效
+    """
+
+    def __init__(
+        self,
+        capacity: Optional[int] = None,
+        threshold: Optional[float] = None,
+        ttl_seconds: Optional[float] = None,
+        version_source: Optional[Callable[[], Any]] = None
+    ):
+        self.capacity = max(1, settings.answer_cache_size if capacity is None else capacity)
+        self.threshold = settings.answer_cache_threshold if threshold is None else threshold
+        self.ttl_seconds = settings.answer_cache_ttl_seconds if ttl_seconds is None else ttl_seconds
+        self.version_source = version_source
+
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None  # (容量, 维度)，首次写入时按问题向量维度分配
+        self._valid = np.zeros(self.capacity, dtype=bool)
+        self._expires = np.zeros(self.capacity, dtype=np.float64)
+        self._last_used = np.zeros(self.capacity, dtype=np.float64)
+        self._params: List[Optional[str]] = [None] * self.capacity
+        self._entries: List[Optional[Dict[str, Any]]] = [None] * self.capacity
+        self._chunk_slots: Dict[str, Set[int]] = {}
+        self.corpus_version = 0  # 本进程内语料写入（新增文档）的次数
+        self._version: Optional[Tuple[int, Any]] = None  # 当前条目对应的 (写入次数, 存储提交点)
+        # 最近失效的文档块ID -> 失效序号，进行中的请求保存答案前据此复查引用的块
+        self._invalidation_seq = 0
+        self._invalidated: Dict[str, int] = {}
+        self._invalidated_floor = 0  # 不大于该序号的失效记录已被清理
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _remove_slot(self, slot: int):
+        entry = self._entries[slot]
+        if entry is not None:
+            for chunk_id in entry["chunk_ids"]:
+                slots = self._chunk_slots.get(chunk_id)
+                if slots is not None:
+                    slots.discard(slot)
+                    if not slots:
+                        del self._chunk_slots[chunk_id]
+        self._valid[slot] = False
+        self._params[slot] = None
+        self._entries[slot] = None
+
+    def _clear(self):
+        self._vectors = None
+        self._valid[:] = False
+        self._params = [None] * self.capacity
+        self._entries = [None] * self.capacity
+        self._chunk_slots.clear()
+
+    def current_version(self) -> Tuple[int, int, Any]:
+        """当前语料版本 (本进程写入次数, 失效序号, 各存储的提交点)，提交点在调用时读取"""
+        external = self.version_source() if self.version_source is not None else None
+        with self._lock:
+            return self.corpus_version, self._invalidation_seq, external
+
+    def _sync_version(self, version: Tuple[int, int, Any]):
+        """写入次数或存储提交点与条目对应的版本不同时，全部条目失效（调用方持有锁）"""
+        key = (version[0], version[2])
+        if self._version is not None and key != self._version:
+            self.invalidations += int(self._valid.sum())
+            self._clear()
+        self._version = key
+
+    def get(self, question_embedding: ArrayLike, params: str, version: Optional[Tuple[int, int, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        查找与问题足够相似、请求参数相同且未过期的条目，返回其保存的内容
+        version 为调用方刚读取的语料版本（之后传给 put），为None时在此读取
+        """
+        now = time.time()
+        version = self.current_version() if version is None else version
+        with self._lock:
+            self._sync_version(version)
+            if self._vectors is None or not self._valid.any():
+                self.misses += 1
+                return None
+            query = prepare_query(question_embedding, self._vectors.shape[1])
+            scores = self._vectors @ query
+            usable = self._valid & (self._expires > now)
+            usable &= np.fromiter((p == params for p in self._params), dtype=bool, count=self.capacity)
+            scores[~usable] = -np.inf
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                self.misses += 1
+                return None
+            self._last_used[slot] = now
+            self.hits += 1
+            return {**self._entries[slot]["payload"], "similarity": float(scores[slot])}
+
+    def put(
+        self,
+        question_embedding: ArrayLike,
+        params: str,
+        payload: Dict[str, Any],
+        chunk_ids: Iterable[str],
+        version: Optional[Tuple[int, int, Any]] = None
+    ):
+        """
+        保存一个答案；已满时优先替换过期条目，否则替换最久未使用的条目
+        version 为开始检索时的语料版本：期间语料已变化，或引用的文档块已失效时不保存
+        """
+        now = time.time()
+        vector = np.asarray(question_embedding, dtype=np.float32).ravel()
+        chunk_ids = [chunk_id for chunk_id in chunk_ids if chunk_id]
+        current = self.current_version()
+        with self._lock:
+            if version is not None:
+                if (version[0], version[2]) != (current[0], current[2]) or version[1] < self._invalidated_floor:
+                    return
+                if any(self._invalidated.get(chunk_id, 0) > version[1] for chunk_id in chunk_ids):
+                    return
+            self._sync_version(current)
+            if self._vectors is None or self._vectors.shape[1] != len(vector):
+                self._clear()
+                self._vectors = np.zeros((self.capacity, len(vector)), dtype=np.float32)
+            free = np.flatnonzero(~self._valid | (self._expires <= now))
+            slot = int(free[0]) if len(free) else int(np.argmin(self._last_used))
+            self._remove_slot(slot)
+
+            self._vectors[slot] = prepare_query(vector, len(vector))
+            self._valid[slot] = True
+            self._expires[slot] = now + self.ttl_seconds
+            self._last_used[slot] = now
+            self._params[slot] = params
+            self._entries[slot] = {"payload": payload, "chunk_ids": chunk_ids}
+            for chunk_id in chunk_ids:
+                self._chunk_slots.setdefault(chunk_id, set()).add(slot)
+
+    def invalidate_chunks(self, chunk_ids: Iterable[str]) -> int:
+        """文档块被更新或删除时，使引用它们的条目失效，返回失效的条目数"""
+        with self._lock:
+            self._invalidation_seq += 1
+            if len(self._invalidated) > self.capacity * 10:
+                self._invalidated.clear()
+                self._invalidated_floor = self._invalidation_seq - 1
+            slots = set()
+            for chunk_id in chunk_ids:
+                self._invalidated[chunk_id] = self._invalidation_seq
+                slots.update(self._chunk_slots.get(chunk_id, ()))
+            for slot in slots:
+                self._remove_slot(slot)
+            self.invalidations += len(slots)
+        if slots:
+            logger.info(f"答案缓存失效 {len(slots)} 个条目")
+        return len(slots)
+
+    def bump_version(self):
+        """语料发生变化（如写入新文档）时提升版本，全部条目失效"""
+        with self._lock:
+            self.invalidations += int(self._valid.sum())
+            self.corpus_version += 1
+            self._version = None
+            self._clear()
+
+    def get_stats(self) -> dict:
+        """获取缓存状态和命中率"""
+        total = self.hits + self.misses
+        with self._lock:
+            entries = int((self._valid & (self._expires > time.time())).sum())
+        return {
+            "entries": entries,
+            "capacity": self.capacity,
+            "corpus_version": self.corpus_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+            "invalidations": self.invalidations,
+        }
+
+
+def _store_commit_points() -> tuple:
+    """向量存储和BM25索引的提交点（尚未加载或没有提交点的服务记为None）"""
+    return tuple(
+        service.commit_point() if service.is_ready() and hasattr(service.get_instance(), "commit_point") else None
+        for service in (vector_store, lexical_index)
+    )
+
+
+# 全局答案缓存实例
+answer_cache = AnswerCache(version_source=_store_commit_points)
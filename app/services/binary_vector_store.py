@@ -0,0 +1,150 @@
+from app.config.settings import settings
+from app.services.numpy_vector_store import IndexState, NumpyVectorStore
+from app.utils.vector_ops import binary_codes, hamming_distances, recall_multiplier, top_k_indices
+from typing import Optional, Tuple
+import numpy as np
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class BinaryIndexState(IndexState):
+    """二值索引的状态：常驻内存的比特码"""
+
+    def __init__(self, index_path: str, generation: int = 0):
+        super().__init__(index_path, generation)
+        self.codes = np.empty((0, 0), dtype=np.uint8)
+        self.code_count = 0
+
+
+class BinaryVectorStore(NumpyVectorStore):
+    """
+    二值量化索引
+    每个向量按符号位压缩为比特码（768维为96字节，约为float32的1/32），常驻内存；
+    查询时先用异或 + popcount 计算汉明距离做粗筛，再对少量候选读取内存映射的float向量精确重排
+    """
+
+    CODES_FILE = "binary_codes.bin"
+    INITIAL_CODE_CAPACITY = 1024
+    SCAN_BLOCK_SIZE = 65536
+    EXACT_BATCH_SEARCH = False
+    STATE_CLASS = BinaryIndexState
+
+    def __init__(self, index_path: Optional[str] = None, dimension: Optional[int] = None):
+        self.rerank_factor = settings.binary_rerank_factor
+        # 父类构造时即加载比特码，码长需要先确定
+        self.code_bytes = binary_codes(np.zeros((1, dimension or settings.vector_dimension), dtype=np.float32)).shape[1]
+        super().__init__(index_path, dimension)
+
+    # ---- 比特码 ----
+
+    def _reserve_codes(self, state: BinaryIndexState, required: int):
+        """内存中的比特码数组按倍增方式扩容"""
+        if required <= state.codes.shape[0]:
+            return
+        capacity = max(self.INITIAL_CODE_CAPACITY, state.codes.shape[0] * 2, required)
+        codes = np.zeros((capacity, self.code_bytes), dtype=np.uint8)
+        if state.code_count:
+            codes[:state.code_count] = state.codes[:state.code_count]
+        state.codes = codes
+
+    def _encode_rows(self, state: BinaryIndexState, start: int, end: int):
+        """由内存映射的float向量计算 [start, end) 行的比特码"""
+        self._reserve_codes(state, end)
+        for block_start in range(start, end, self.SCAN_BLOCK_SIZE):
+            block_end = min(end, block_start + self.SCAN_BLOCK_SIZE)
+            state.codes[block_start:block_end] = binary_codes(np.asarray(state.vectors[block_start:block_end]))
+        state.code_count = end
+
+    # ---- 持久化 ----
+
+    def _persisted_code_rows(self) -> int:
+        path = self._path(self.CODES_FILE)
+        return os.path.getsize(path) // self.code_bytes if os.path.exists(path) else 0
+
+    def _save_codes(self, state: BinaryIndexState):
+        """把尚未写入文件的比特码追加到文件末尾；只在持有写锁的写入进程中调用"""
+        persisted = self._persisted_code_rows()
+        if persisted >= state.code_count:
+            return
+        with open(self._path(self.CODES_FILE), "r+b" if persisted else "wb") as f:
+            f.seek(persisted * self.code_bytes)
+            f.write(state.codes[persisted:state.code_count].tobytes())
+            f.truncate()
+
+    def _load_index(self, state: BinaryIndexState):
+        """读取已保存的比特码，文件之后追加的行由float向量补算"""
+        persisted = min(self._persisted_code_rows(), state.count)
+        if persisted:
+            codes = np.fromfile(self._path(self.CODES_FILE), dtype=np.uint8, count=persisted * self.code_bytes)
+            self._reserve_codes(state, persisted)
+            state.codes[:persisted] = codes.reshape(persisted, self.code_bytes)
+            state.code_count = persisted
+        if state.count > state.code_count:
+            self._encode_rows(state, state.code_count, state.count)
+        logger.info(f"已加载二值索引: {state.code_count} 个比特码，每个 {self.code_bytes} 字节")
+
+    # ---- 父类扩展点 ----
+
+    def _on_rows_appended(self, state: BinaryIndexState, start: int, end: int):
+        if end > state.code_count:
+            self._encode_rows(state, state.code_count, end)
+        # 比特码文件在元数据提交之后追加，中途中断时下次加载会补算缺失的行
+        if state.writable:
+            self._save_codes(state)
+
+    def _write_compacted_index(self, state: BinaryIndexState, target_path: str, keep: np.ndarray):
+        with self._lock:
+            keep = keep[keep < state.code_count]
+            with open(os.path.join(target_path, self.CODES_FILE), "wb") as f:
+                f.write(state.codes[keep].tobytes())
+
+    def _hamming_rerank(self, state: BinaryIndexState, query: np.ndarray, top_k: int, codes: np.ndarray, rows: Optional[np.ndarray], candidates: int) -> Tuple[np.ndarray, np.ndarray]:
+        """汉明距离粗筛出candidates个候选，再用float向量精确重排；rows为None时codes对应全部行"""
+        # 分块计算以限制临时数组大小
+        query_code = binary_codes(query.reshape(1, -1))[0]
+        distances = np.empty(len(codes), dtype=np.int32)
+        for block_start in range(0, len(codes), self.SCAN_BLOCK_SIZE):
+            block = codes[block_start:block_start + self.SCAN_BLOCK_SIZE]
+            distances[block_start:block_start + len(block)] = hamming_distances(block, query_code)
+
+        # 按行号排序后读取float向量，使内存映射的访问尽量顺序
+        selected = np.sort(np.argpartition(distances, candidates - 1)[:candidates])
+        selected = selected if rows is None else rows[selected]
+        scores = state.vectors[selected] @ query
+        best = top_k_indices(scores, top_k)
+        return selected[best], scores[best]
+
+    def _rerank_count(self, top_k: int, recall_hint: Optional[str], rerank_candidates: Optional[int] = None) -> int:
+        candidates = rerank_candidates or int(round(top_k * self.rerank_factor * recall_multiplier(recall_hint)))
+        return max(candidates, top_k)
+
+    def _search_rows(self, state: BinaryIndexState, query: np.ndarray, top_k: int, recall_hint: Optional[str] = None, rerank_candidates: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            count = state.count
+            codes = state.codes[:count]
+
+        candidates = self._rerank_count(top_k, recall_hint, rerank_candidates)
+        if candidates >= count:
+            return super()._search_rows(state, query, top_k)
+        return self._hamming_rerank(state, query, top_k, codes, None, candidates)
+
+    def _search_candidates(self, state: BinaryIndexState, query: np.ndarray, top_k: int, candidates: np.ndarray, recall_hint: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        rerank = self._rerank_count(top_k, recall_hint)
+        if rerank >= len(candidates):
+            return super()._search_candidates(state, query, top_k, candidates)
+        with self._lock:
+            codes = state.codes[candidates]
+        return self._hamming_rerank(state, query, top_k, codes, candidates, rerank)
+
+    def get_index_stats(self) -> dict:
+        """获取二值索引状态"""
+        state = self._state
+        return {
+            "count": state.count,
+            "code_bytes": self.code_bytes,
+            "codes_memory_bytes": state.code_count * self.code_bytes,
+            "float_bytes": state.count * self.dimension * 4,
+            "rerank_factor": self.rerank_factor,
+        }
@@ -1,14 +1,20 @@
-import chromadb
 from app.config.settings import settings
-from app.models.document_models import Document, DocumentCreate
-from typing import List, Optional
+from app.models.document_models import BulkInsertError, BulkInsertResult, Document, DocumentCreate, DocumentPage, DocumentSummary
+from app.utils.metadata_filter import Filters, to_chroma_where
+from app.utils.pagination import content_preview, cursor_index, decode_cursor, encode_cursor
+from app.utils.retrieval import mmr_candidate_count, mmr_documents
+from app.utils.vector_ops import as_float32_matrix, fit_dimension, iter_batches
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
 import logging
 import uuid
 
 logger = logging.getLogger(__name__)
 
 class ChromaVectorStore:
-    def __init__(self):
+    def __init__(self, db_path: Optional[str] = None, collection_name: str = "documents"):
+        self.db_path = db_path or settings.chroma_db_path
+        self.collection_name = collection_name
         self.client = None
         self.collection = None
         self._setup_client()
@@ -16,17 +22,19 @@ class ChromaVectorStore:
     def _setup_client(self):
         """设置ChromaDB客户端和集合"""
         try:
+            import chromadb
+            
             # 创建持久化客户端
-            self.client = chromadb.PersistentClient(path=settings.chroma_db_path)
-            logger.info(f"ChromaDB客户端初始化成功，存储路径: {settings.chroma_db_path}")
+            self.client = chromadb.PersistentClient(path=self.db_path)
+            logger.info(f"ChromaDB客户端初始化成功，存储路径: {self.db_path}")
             
             # 获取或创建集合
             try:
-                self.collection = self.client.get_collection("documents")
+                self.collection = self.client.get_collection(self.collection_name)
                 logger.info("找到现有的文档集合")
             except Exception:
                 self.collection = self.client.create_collection(
-                    name="documents",
+                    name=self.collection_name,
                     metadata={"description": "文档向量存储"}
                 )
                 logger.info("创建新的文档集合")
@@ -54,8 +62,56 @@ class ChromaVectorStore:
             logger.error(f"插入文档失败: {e}")
             raise
     
-    def similarity_search(self, query_embedding: List[float], top_k: int = 5) -> List[Document]:
-        """向量相似度搜索"""
+    def insert_documents(self, documents: List[DocumentCreate], embeddings, batch_size: Optional[int] = None, ids: Optional[List[str]] = None) -> BulkInsertResult:
+        """
+        批量插入文档和向量，每批一次collection.add；某批失败时逐条重试以定位出错的文档
+        
+        Args:
+            ids: 指定文档ID（如迁移已有数据时保留原ID），默认自动生成
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32).tolist()
+        if len(documents) != len(embeddings):
+            raise ValueError(f"文档数 {len(documents)} 与向量数 {len(embeddings)} 不一致")
+
+        new_ids = list(ids) if ids else [str(uuid.uuid4()) for _ in documents]
+        ids: List[Optional[str]] = [None] * len(documents)
+        errors: List[BulkInsertError] = []
+
+        for _, batch in iter_batches(list(range(len(documents))), batch_size or settings.insert_batch_size):
+            try:
+                self.collection.add(
+                    ids=[new_ids[i] for i in batch],
+                    embeddings=[embeddings[i] for i in batch],
+                    documents=[documents[i].content for i in batch],
+                    metadatas=[documents[i].metadata for i in batch]
+                )
+                for i in batch:
+                    ids[i] = new_ids[i]
+                continue
+            except Exception as e:
+                logger.warning(f"批量插入失败（批次大小 {len(batch)}），改为逐条插入: {e}")
+
+            for i in batch:
+                try:
+                    self.collection.add(
+                        ids=[new_ids[i]],
+                        embeddings=[embeddings[i]],
+                        documents=[documents[i].content],
+                        metadatas=[documents[i].metadata]
+                    )
+                    ids[i] = new_ids[i]
+                except Exception as e:
+                    errors.append(BulkInsertError(index=i, error=str(e)))
+
+        logger.info(f"批量插入完成: 成功 {len(documents) - len(errors)}，失败 {len(errors)}")
+        return BulkInsertResult(ids=ids, errors=errors)
+    
+    def similarity_search(self, query_embedding: List[float], top_k: int = 5, recall_hint: Optional[str] = None, filters: Optional[Filters] = None, mmr_lambda: Optional[float] = None, include_embeddings: bool = False) -> List[Document]:
+        """
+        向量相似度搜索（ChromaDB的HNSW搜索参数按集合配置，召回提示不生效）
+        元数据过滤条件转换为where，由ChromaDB在向量搜索前按元数据筛选
+        mmr_lambda 不为None时多召回候选并连同嵌入向量返回，再做MMR选择
+        """
         try:
             # 确保向量维度正确
             if len(query_embedding) != settings.vector_dimension:
@@ -67,10 +123,12 @@ class ChromaVectorStore:
                     query_embedding = query_embedding + [0.0] * (settings.vector_dimension - len(query_embedding))
             
             # 执行搜索
+            with_embeddings = include_embeddings or mmr_lambda is not None
             results = self.collection.query(
                 query_embeddings=[query_embedding],
-                n_results=top_k,
-                include=["documents", "metadatas", "distances"]
+                n_results=mmr_candidate_count(top_k) if mmr_lambda is not None else top_k,
+                where=to_chroma_where(filters),
+                include=["documents", "metadatas", "distances"] + (["embeddings"] if with_embeddings else [])
             )
             
             documents = []
@@ -81,19 +139,23 @@ class ChromaVectorStore:
                     metadata = results['metadatas'][0][i] if results['metadatas'] else {}
                     distance = results['distances'][0][i] if results['distances'] else 0.0
                     
-                    # 将距离转换为相似度分数 (1 - 标准化距离)
-                    score = 1.0 - (distance / 2.0)  # 假设最大距离为2.0
+                    # 向量已归一化，集合默认的平方L2距离 d = 2 - 2cos，因此 1 - d/2 即余弦相似度
+                    score = 1.0 - (distance / 2.0)
                     
                     doc = Document(
                         id=doc_id,
                         content=content,
                         metadata=metadata,
-                        embedding=None  # 不返回嵌入向量以节省带宽
+                        # 默认不返回嵌入向量以节省带宽
+                        embedding=[float(x) for x in results['embeddings'][0][i]] if with_embeddings else None,
+                        score=score
                     )
                     documents.append(doc)
                     
                     logger.debug(f"检索到文档: {doc_id}, 分数: {score:.4f}")
             
+            if mmr_lambda is not None:
+                documents = mmr_documents(query_embedding, documents, top_k, mmr_lambda, keep_embeddings=include_embeddings)
             logger.info(f"相似度搜索完成，找到 {len(documents)} 个文档")
             return documents
             
@@ -101,16 +163,141 @@ class ChromaVectorStore:
             logger.error(f"相似度搜索失败: {e}")
             return []
     
+    def batch_similarity_search(self, query_embeddings, top_k: int = 5, recall_hint: Optional[str] = None, filters: Optional[Filters] = None) -> List[List[Document]]:
+        """多个查询向量一次collection.query，返回每个查询带分数的文档列表"""
+        if len(query_embeddings) == 0:
+            return []
+        try:
+            queries = fit_dimension(as_float32_matrix(query_embeddings), settings.vector_dimension).tolist()
+            results = self.collection.query(
+                query_embeddings=queries,
+                n_results=top_k,
+                where=to_chroma_where(filters),
+                include=["documents", "metadatas", "distances"]
+            )
+            
+            batches = []
+            for q in range(len(queries)):
+                hits = []
+                for i, doc_id in enumerate(results['ids'][q] if results['ids'] else []):
+                    distance = results['distances'][q][i] if results['distances'] else 0.0
+                    hits.append(Document(
+                        id=doc_id,
+                        content=results['documents'][q][i],
+                        metadata=(results['metadatas'][q][i] if results['metadatas'] else None) or {},
+                        embedding=None,
+                        score=1.0 - (distance / 2.0)  # 与单条搜索相同的距离到相似度分数的转换
+                    ))
+                batches.append(hits)
+            
+            logger.info(f"批量相似度搜索完成，查询数: {len(queries)}")
+            return batches
+            
+        except Exception as e:
+            logger.error(f"批量相似度搜索失败: {e}")
+            return [[] for _ in range(len(query_embeddings))]
+    
     def get_document_count(self) -> int:
         """获取文档数量"""
         try:
-            # ChromaDB没有直接的count方法，我们可以通过查询空字符串来获取数量
-            results = self.collection.get()
-            return len(results['ids']) if results['ids'] else 0
+            # count() 直接读取集合的记录数，不加载任何文档内容
+            return self.collection.count()
         except Exception as e:
             logger.error(f"获取文档数量失败: {e}")
             return 0
     
+    def get_source_file_ids(self, source_file: str) -> List[str]:
+        """获取某个来源文件的全部文档ID"""
+        return self.collection.get(where={"source_file": source_file}, include=[])["ids"]
+    
+    def delete_documents(self, ids: List[str]) -> int:
+        """按ID删除文档（ChromaDB自行回收空间），返回实际删除的数量"""
+        if not ids:
+            return 0
+        existing = self.collection.get(ids=list(ids), include=[])["ids"]
+        if existing:
+            self.collection.delete(ids=existing)
+        logger.info(f"已删除 {len(existing)} 个文档")
+        return len(existing)
+    
+    def get_document(self, doc_id: str) -> Optional[Document]:
+        """根据ID获取文档"""
+        results = self.collection.get(ids=[doc_id], include=["documents", "metadatas"])
+        if not results['ids']:
+            return None
+        return Document(
+            id=results['ids'][0],
+            content=results['documents'][0],
+            metadata=results['metadatas'][0] if results['metadatas'] else {},
+            embedding=None
+        )
+    
+    def get_documents(self, ids: List[str], include_embeddings: bool = False) -> List[Document]:
+        """按ID批量获取文档（保持输入顺序，不存在的ID跳过）"""
+        if not ids:
+            return []
+        results = self.collection.get(ids=list(ids), include=["documents", "metadatas"] + (["embeddings"] if include_embeddings else []))
+        embeddings = results['embeddings'] if include_embeddings else [None] * len(results['ids'])
+        found = {
+            doc_id: Document(id=doc_id, content=content, metadata=metadata or {}, embedding=[float(x) for x in embedding] if embedding is not None else None)
+            for doc_id, content, metadata, embedding in zip(results['ids'], results['documents'], results['metadatas'] or [None] * len(results['ids']), embeddings)
+        }
+        return [found[doc_id] for doc_id in ids if doc_id in found]
+    
+    def get_chunks(self, keys: List[Tuple[str, int]]) -> List[Document]:
+        """按 (来源文件, 块序号) 批量获取文档块，一次collection.get完成"""
+        if not keys:
+            return []
+        by_file = {}
+        for source_file, chunk_index in keys:
+            by_file.setdefault(source_file, []).append(chunk_index)
+        clauses = [{"$and": [{"source_file": source_file}, {"chunk_index": {"$in": indices}}]} for source_file, indices in by_file.items()]
+        results = self.collection.get(where=clauses[0] if len(clauses) == 1 else {"$or": clauses}, include=["documents", "metadatas"])
+        return [
+            Document(id=doc_id, content=content, metadata=metadata or {}, embedding=None)
+            for doc_id, content, metadata in zip(results['ids'], results['documents'], results['metadatas'] or [None] * len(results['ids']))
+        ]
+    
+    def list_documents(self, cursor: Optional[str] = None, limit: int = 20, preview_chars: Optional[int] = None) -> DocumentPage:
+        """
+        分页列出文档（不加载嵌入向量），游标记录下一页的偏移量
+        ChromaDB没有按ID续读的接口，游标只是编码后的偏移量，每页需要跳过前面的 offset 条记录，
+        代价随页码增长为 O(offset)；需要遍历全部文档时使用 iter_records
+        """
+        preview_chars = preview_chars or settings.document_preview_chars
+        offset = cursor_index(decode_cursor(cursor), "offset", cursor)
+        results = self.collection.get(limit=limit, offset=offset, include=["documents", "metadatas"])
+        
+        items = []
+        for i, doc_id in enumerate(results['ids'] or []):
+            content = results['documents'][i] or ""
+            items.append(DocumentSummary(
+                id=doc_id,
+                metadata=(results['metadatas'][i] if results['metadatas'] else None) or {},
+                content_preview=content_preview(content, preview_chars),
+                content_length=len(content)
+            ))
+        
+        total = self.get_document_count()
+        next_offset = offset + len(items)
+        next_cursor = encode_cursor({"offset": next_offset}) if len(items) == limit and next_offset < total else None
+        return DocumentPage(items=items, next_cursor=next_cursor, total=total)
+    
+    def iter_records(self, batch_size: Optional[int] = None) -> Iterator[Tuple[List[str], List[DocumentCreate], np.ndarray]]:
+        """按批遍历全部文档及其向量，返回 (ID列表, 文档列表, 向量矩阵)，用于迁移和导出"""
+        batch_size = batch_size or settings.insert_batch_size
+        offset = 0
+        while True:
+            results = self.collection.get(limit=batch_size, offset=offset, include=["documents", "metadatas", "embeddings"])
+            if not results['ids']:
+                return
+            documents = [
+                DocumentCreate(content=content or "", metadata=metadata or {})
+                for content, metadata in zip(results['documents'], results['metadatas'] or [None] * len(results['ids']))
+            ]
+            yield list(results['ids']), documents, np.asarray(results['embeddings'], dtype=np.float32)
+            offset += len(results['ids'])
+    
     def get_all_documents(self, limit: int = 10) -> List[Document]:
         """获取所有文档（用于调试）"""
         try:
@@ -131,6 +318,3 @@ class ChromaVectorStore:
         except Exception as e:
             logger.error(f"获取所有文档失败: {e}")
             return []
-
-# 全局ChromaDB向量存储实例
-chroma_vector_store = ChromaVectorStore()
\ No newline at end of file
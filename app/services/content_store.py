@@ -0,0 +1,169 @@
+from collections import OrderedDict
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+import logging
+import os
+import threading
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+class ContentStore:
+    """
+    压缩的文档内容存储
+    文本按块（约64KB未压缩）用zlib压缩后追加写入 content.bin，content.idx 为每行记录一个定长索引项
+    (块偏移, 块压缩长度, 块内起点, 块内长度)，常驻内存的只有索引项；
+    读取时按块分组，每个块只读取并解压一次，最近使用的块保留在LRU缓存中
+    行号与所属向量存储的行号一致，提交点（已提交行数）由所属存储维护
+    """
+
+    DATA_FILE = "content.bin"
+    INDEX_FILE = "content.idx"
+    ENTRY_DTYPE = np.dtype([("block", "<u8"), ("size", "<u4"), ("start", "<u4"), ("length", "<u4")])
+    BLOCK_BYTES = 1 << 16
+    CACHE_BLOCKS = 64
+    COMPRESSION_LEVEL = 6
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries = np.empty(0, dtype=self.ENTRY_DTYPE)
+        self._count = 0
+        self._cache: "OrderedDict[int, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 读取句柄在加载或写入数据后立即打开并一直复用：文件被压缩替换后，旧状态的读取仍指向原文件
+        self._data_file = None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def exists(self) -> bool:
+        return os.path.exists(self._path(self.INDEX_FILE))
+
+    def _open_data_file(self):
+        if self._data_file is None:
+            self._data_file = open(self._path(self.DATA_FILE), "rb")
+
+    def _reserve(self, required: int):
+        if required <= len(self._entries):
+            return
+        entries = np.empty(max(1024, len(self._entries) * 2, required), dtype=self.ENTRY_DTYPE)
+        entries[:self._count] = self._entries[:self._count]
+        self._entries = entries
+
+    def refresh(self, count: int):
+        """读取其他进程追加的索引项，直到count条"""
+        with self._lock:
+            if count <= self._count:
+                return
+            item_size = self.ENTRY_DTYPE.itemsize
+            with open(self._path(self.INDEX_FILE), "rb") as f:
+                f.seek(self._count * item_size)
+                data = f.read((count - self._count) * item_size)
+            new_entries = np.frombuffer(data, dtype=self.ENTRY_DTYPE)
+            if len(new_entries) != count - self._count:
+                raise ValueError(f"内容索引只有 {self._count + len(new_entries)} 条，少于已提交的 {count} 条")
+            self._reserve(count)
+            self._entries[self._count:count] = new_entries
+            self._count = count
+            self._open_data_file()
+
+    def append(self, texts: Sequence[str], committed: int):
+        """
+        追加一批文本，行号从committed开始；调用方需持有写锁，并在之后提交行数
+        先截断上次未提交（写入中断）的尾部数据
+        """
+        self.refresh(committed)
+        with self._lock:
+            self._count = committed
+            data_end = 0
+            if committed:
+                last = self._entries[committed - 1]
+                data_end = int(last["block"]) + int(last["size"])
+            for name, size in ((self.DATA_FILE, data_end), (self.INDEX_FILE, committed * self.ENTRY_DTYPE.itemsize)):
+                path = self._path(name)
+                if os.path.exists(path) and os.path.getsize(path) > size:
+                    os.truncate(path, size)
+                    self._cache.clear()
+
+            entries = np.zeros(len(texts), dtype=self.ENTRY_DTYPE)
+            with open(self._path(self.DATA_FILE), "ab") as f:
+                offset = data_end
+                block: List[bytes] = []
+                block_rows: List[int] = []
+                block_bytes = 0
+
+                def _flush():
+                    nonlocal offset, block, block_rows, block_bytes
+                    compressed = zlib.compress(b"".join(block), self.COMPRESSION_LEVEL)
+                    f.write(compressed)
+                    entries["block"][block_rows] = offset
+                    entries["size"][block_rows] = len(compressed)
+                    offset += len(compressed)
+                    block, block_rows, block_bytes = [], [], 0
+
+                for i, text in enumerate(texts):
+                    raw = text.encode("utf-8")
+                    if block and block_bytes + len(raw) > self.BLOCK_BYTES:
+                        _flush()
+                    entries["start"][i] = block_bytes
+                    entries["length"][i] = len(raw)
+                    block.append(raw)
+                    block_rows.append(i)
+                    block_bytes += len(raw)
+                if block:
+                    _flush()
+
+            with open(self._path(self.INDEX_FILE), "ab") as f:
+                f.write(entries.tobytes())
+
+            self._reserve(committed + len(texts))
+            self._entries[committed:committed + len(texts)] = entries
+            self._count = committed + len(texts)
+            self._open_data_file()
+
+    def _read_blocks(self, blocks: List[Tuple[int, int]]) -> Dict[int, bytes]:
+        """读取并解压缺失的块（按文件偏移顺序），返回 {块偏移: 解压后的数据}"""
+        raw_blocks = {}
+        missing = []
+        for offset, size in blocks:
+            if offset in self._cache:
+                self._cache.move_to_end(offset)
+                raw_blocks[offset] = self._cache[offset]
+            else:
+                missing.append((offset, size))
+
+        if missing:
+            self._open_data_file()
+            for offset, size in sorted(missing):
+                self._data_file.seek(offset)
+                raw_blocks[offset] = zlib.decompress(self._data_file.read(size))
+                self._cache[offset] = raw_blocks[offset]
+            while len(self._cache) > self.CACHE_BLOCKS:
+                self._cache.popitem(last=False)
+        return raw_blocks
+
+    def get_many(self, rows: Sequence[int]) -> List[str]:
+        """按行号批量读取文本，同一块内的多行只解压一次"""
+        with self._lock:
+            entries = self._entries[np.asarray(rows, dtype=np.int64)].tolist()
+            raw_blocks = self._read_blocks(list(dict.fromkeys((block, size) for block, size, _, _ in entries)))
+        return [raw_blocks[block][start:start + length].decode("utf-8") for block, _, start, length in entries]
+
+    def get(self, row: int) -> str:
+        return self.get_many([row])[0]
+
+    def get_stats(self) -> dict:
+        """获取内容存储状态"""
+        with self._lock:
+            raw_bytes = int(self._entries["length"][:self._count].sum(dtype=np.int64))
+        data_path = self._path(self.DATA_FILE)
+        compressed_bytes = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+        return {
+            "rows": self._count,
+            "raw_bytes": raw_bytes,
+            "compressed_bytes": compressed_bytes,
+            "compression_ratio": round(raw_bytes / compressed_bytes, 2) if compressed_bytes else None,
+            "index_memory_bytes": self._count * self.ENTRY_DTYPE.itemsize,
+            "cached_blocks": len(self._cache),
+        }
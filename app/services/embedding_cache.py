@@ -0,0 +1,222 @@
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    两级嵌入缓存：内存LRU + SQLite磁盘缓存
+    键为 (模型名称, 规范化文本哈希)，磁盘层可在重启后保留，并可被多个uvicorn worker共享
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_memory_items: int = 10000):
+        self.db_path = db_path
+        self.max_memory_items = max_memory_items
+        self.model_name: Optional[str] = None
+
+        self._memory: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # ---- 键与模型命名空间 ----
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """规范化文本：去除首尾空白并合并连续空白"""
+        return " ".join(text.split())
+
+    @classmethod
+    def text_hash(cls, text: str) -> str:
+        """计算规范化文本的哈希"""
+        return hashlib.sha256(cls.normalize_text(text).encode("utf-8")).hexdigest()
+
+    def set_model(self, model_name: str):
+        """设置当前模型；模型切换时旧模型的键全部失效"""
+        with self._lock:
+            if self.model_name is not None and self.model_name != model_name:
+                self.invalidations += len(self._memory)
+                self._memory.clear()
+                logger.info(f"嵌入模型由 {self.model_name} 切换为 {model_name}，缓存键已失效")
+            self.model_name = model_name
+
+    # ---- 磁盘层 ----
+
+    def _get_connection(self) -> Optional[sqlite3.Connection]:
+        """获取SQLite连接（fork后的子进程会重新建立连接）"""
+        if not self.db_path:
+            return None
+
+        if self._conn is not None and self._conn_pid == os.getpid():
+            return self._conn
+
+        try:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            # WAL模式允许多个进程同时读、单个进程写
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, "
+                "text_hash TEXT NOT NULL, "
+                "dim INTEGER NOT NULL, "
+                "vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash))"
+            )
+            conn.commit()
+
+            self._conn = conn
+            self._conn_pid = os.getpid()
+            logger.info(f"嵌入磁盘缓存已打开: {self.db_path}")
+        except Exception as e:
+            logger.error(f"打开嵌入磁盘缓存失败，仅使用内存缓存: {e}")
+            self.db_path = None
+            self._conn = None
+
+        return self._conn
+
+    def _disk_get_many(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        conn = self._get_connection()
+        if conn is None or not hashes:
+            return {}
+
+        found = {}
+        try:
+            # SQLite单条语句的参数数量有限，分批查询
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model_name] + batch
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"读取嵌入磁盘缓存失败: {e}")
+        return found
+
+    def _disk_put_many(self, items: List[Tuple[str, np.ndarray]]):
+        conn = self._get_connection()
+        if conn is None or not items:
+            return
+
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector) VALUES (?, ?, ?, ?)",
+                [(self.model_name, text_hash, len(vector), vector.tobytes()) for text_hash, vector in items]
+            )
+            conn.commit()
+        except Exception as e:
+            logger.warning(f"写入嵌入磁盘缓存失败: {e}")
+
+    # ---- 内存层 ----
+
+    def _memory_put(self, key: Tuple[str, str], vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    # ---- 公共接口 ----
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """批量查询缓存，未命中的位置返回None"""
+        if self.model_name is None:
+            return [None] * len(texts)
+
+        hashes = [self.text_hash(text) for text in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+
+        with self._lock:
+            for i, text_hash in enumerate(hashes):
+                key = (self.model_name, text_hash)
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = vector
+                    self.memory_hits += 1
+                else:
+                    missing.setdefault(text_hash, []).append(i)
+
+            if missing:
+                found = self._disk_get_many(list(missing.keys()))
+                for text_hash, positions in missing.items():
+                    vector = found.get(text_hash)
+                    if vector is None:
+                        self.misses += len(positions)
+                        continue
+                    self._memory_put((self.model_name, text_hash), vector)
+                    self.disk_hits += len(positions)
+                    for i in positions:
+                        results[i] = vector
+
+        return results
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """查询单条缓存"""
+        return self.get_many([text])[0]
+
+    def put_many(self, texts: List[str], vectors: List[np.ndarray]):
+        """批量写入缓存（内存层和磁盘层）"""
+        if self.model_name is None or not texts:
+            return
+
+        items = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                text_hash = self.text_hash(text)
+                vector = np.array(vector, dtype=np.float32)
+                vector.flags.writeable = False
+                self._memory_put((self.model_name, text_hash), vector)
+                items.append((text_hash, vector))
+            self._disk_put_many(items)
+
+    def put(self, text: str, vector: np.ndarray):
+        """写入单条缓存"""
+        self.put_many([text], [vector])
+
+    def clear(self):
+        """清空内存层和磁盘层"""
+        with self._lock:
+            self._memory.clear()
+            conn = self._get_connection()
+            if conn is not None:
+                conn.execute("DELETE FROM embeddings")
+                conn.commit()
+
+    def get_stats(self) -> Dict[str, object]:
+        """获取缓存统计信息"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "model": self.model_name,
+            "memory_items": len(self._memory),
+            "max_memory_items": self.max_memory_items,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "disk_path": self.db_path,
+        }
@@ -0,0 +1,137 @@
+from app.config.settings import settings
+from app.services.embedding_service import embedding_service
+import numpy as np
+from typing import Callable, List, Optional, Tuple
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingDispatcher:
+    """
+    异步微批处理嵌入调度器
+    将一个小时间窗口内到达的并发嵌入请求合并为一次批量encode，再分别唤醒各调用方
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], np.ndarray],
+        window_ms: Optional[float] = None,
+        max_batch_size: Optional[int] = None
+    ):
+        self.embed_batch = embed_batch
+        self.window = (settings.embedding_batch_window_ms if window_ms is None else window_ms) / 1000.0
+        self.max_batch_size = max(1, max_batch_size or settings.embedding_batch_max_size)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.total_batches = 0
+        self.total_items = 0
+        self.total_queue_delay = 0.0
+        self.max_queue_delay = 0.0
+        self.total_encode_time = 0.0
+
+    def _ensure_worker(self):
+        """在当前事件循环中启动后台批处理任务"""
+        loop = asyncio.get_running_loop()
+        if self._worker is not None and not self._worker.done() and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._worker = loop.create_task(self._run())
+
+    async def embed(self, text: str) -> List[float]:
+        """提交单条文本，等待所在批次完成后返回其向量"""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((text, future, time.perf_counter()))
+        return await future
+
+    async def _collect_batch(self) -> List[Tuple[str, asyncio.Future, float]]:
+        """收集一个批次：等待首个请求，然后在时间窗口内继续收集直到达到批次上限"""
+        first = await self._queue.get()
+        batch = [first]
+        deadline = first[2] + self.window
+
+        while len(batch) < self.max_batch_size:
+            # 已经在队列中的请求无需等待
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            await self._process_batch(batch)
+
+    async def _process_batch(self, batch: List[Tuple[str, asyncio.Future, float]]):
+        texts = [text for text, _, _ in batch]
+        started = time.perf_counter()
+
+        for _, _, enqueued_at in batch:
+            delay = started - enqueued_at
+            self.total_queue_delay += delay
+            self.max_queue_delay = max(self.max_queue_delay, delay)
+
+        try:
+            # 模型前向计算是CPU密集的同步调用，放到线程池执行以免阻塞事件循环
+            embeddings = await self._loop.run_in_executor(None, self.embed_batch, texts)
+        except Exception as e:
+            logger.error(f"批量嵌入失败（批次大小 {len(batch)}）: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.total_encode_time += time.perf_counter() - started
+            self.total_batches += 1
+            self.total_items += len(batch)
+
+        for (_, future, _), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(np.asarray(embedding).tolist())
+
+    async def close(self):
+        """停止后台批处理任务"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    def get_stats(self) -> dict:
+        """获取批处理指标"""
+        batches = self.total_batches
+        items = self.total_items
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_batch_size": self.max_batch_size,
+            "batches": batches,
+            "items": items,
+            "avg_batch_size": round(items / batches, 2) if batches else 0.0,
+            "batch_fill_ratio": round(items / (batches * self.max_batch_size), 4) if batches else 0.0,
+            "avg_queue_delay_ms": round(self.total_queue_delay / items * 1000.0, 3) if items else 0.0,
+            "max_queue_delay_ms": round(self.max_queue_delay * 1000.0, 3),
+            "avg_encode_ms": round(self.total_encode_time / batches * 1000.0, 3) if batches else 0.0,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+
+# 全局嵌入调度器实例
+embedding_dispatcher = EmbeddingDispatcher(lambda texts: embedding_service.get_embeddings_batch(texts))
@@ -1,27 +1,35 @@
 from app.config.settings import settings
 import numpy as np
-from typing import List
+from typing import List, Optional
 import logging
+import importlib.util
 import os
 import shutil
 
 logger = logging.getLogger(__name__)
 
-# 尝试导入sentence-transformers，失败时使用简单版本
-try:
-    from sentence_transformers import SentenceTransformer
-    SENTENCE_TRANSFORMERS_AVAILABLE = True
-except ImportError:
-    SENTENCE_TRANSFORMERS_AVAILABLE = False
+# 只检查sentence-transformers是否安装；真正的导入（连同torch）推迟到加载模型时
+SENTENCE_TRANSFORMERS_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
+if not SENTENCE_TRANSFORMERS_AVAILABLE:
     logger.warning("sentence-transformers 不可用，将使用简单嵌入服务")
 
 # 导入简单嵌入服务作为备选
 from app.services.simple_embedding_service import simple_embedding_service
+from app.services.embedding_cache import EmbeddingCache
+from app.utils.vector_ops import as_float32_matrix, iter_batches, normalize_rows
+from app.utils.lazy_service import LazyService
 
 class EmbeddingService:
     def __init__(self):
         self.model = None
+        self.model_name = None
         self.use_simple = False
+        self.cache = None
+        if settings.embedding_cache_enabled:
+            self.cache = EmbeddingCache(
+                db_path=settings.embedding_cache_path or None,
+                max_memory_items=settings.embedding_cache_size
+            )
         self._load_model_with_fallback()
     
     def _load_model_with_fallback(self):
@@ -68,7 +76,12 @@ class EmbeddingService:
                 if attempt > 0:
                     self._clear_model_cache()
                 
+                from sentence_transformers import SentenceTransformer
                 self.model = SentenceTransformer(model_name)
+                self.model_name = model_name
+                # 缓存键按模型名称隔离，切换到备选模型时旧键随之失效
+                if self.cache is not None:
+                    self.cache.set_model(model_name)
                 logger.info(f"嵌入模型 {model_name} 加载成功")
                 return True
                 
@@ -96,35 +109,59 @@ class EmbeddingService:
     
     def get_embedding(self, text: str) -> List[float]:
         """获取文本的向量嵌入"""
-        if self.use_simple or self.model is None:
-            return simple_embedding_service.get_embedding(text)
-        else:
-            try:
-                embedding = self.model.encode(text)
-                embedding = embedding / np.linalg.norm(embedding)
-                return embedding.tolist()
-            except Exception as e:
-                logger.error(f"sentence-transformers 嵌入失败，回退到简单版本: {e}")
-                return simple_embedding_service.get_embedding(text)
+        return self.get_embeddings_batch([text])[0].tolist()
     
-    def get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+    def get_embeddings_batch(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        """
+        批量获取向量嵌入
+        
+        Returns:
+            形状为 (len(texts), 维度) 的连续float32矩阵，每行已L2归一化
+        """
         if self.use_simple or self.model is None:
-            return simple_embedding_service.get_embeddings_batch(texts)
-        else:
-            try:
-                embeddings = self.model.encode(texts)
-                # 修复：embeddings 已经是列表，不需要调用 tolist()
-                normalized_embeddings = []
-                for emb in embeddings:
-                    normalized_emb = emb / np.linalg.norm(emb)
-                    normalized_embeddings.append(normalized_emb.tolist())
-                return normalized_embeddings
-            except Exception as e:
-                logger.error(f"sentence-transformers 批量嵌入失败，回退到简单版本: {e}")
-                return simple_embedding_service.get_embeddings_batch(texts)
+            return simple_embedding_service.get_embeddings_batch(texts, batch_size)
+        
+        try:
+            batch_size = batch_size or settings.embedding_batch_size
+            dimension = self.model.get_sentence_embedding_dimension()
+            embeddings = np.empty((len(texts), dimension), dtype=np.float32)
+            
+            # 简单嵌入服务的结果会随拟合状态变化，只缓存模型生成的向量
+            cached = self.cache.get_many(texts) if self.cache is not None else [None] * len(texts)
+            missing = []
+            for i, emb in enumerate(cached):
+                if emb is None:
+                    missing.append(i)
+                else:
+                    embeddings[i] = emb
+            
+            for _, batch_indices in iter_batches(missing, batch_size):
+                batch_texts = [texts[i] for i in batch_indices]
+                batch_embeddings = self.model.encode(
+                    batch_texts,
+                    batch_size=batch_size,
+                    convert_to_numpy=True,
+                    show_progress_bar=False
+                )
+                batch_embeddings = normalize_rows(as_float32_matrix(batch_embeddings))
+                embeddings[batch_indices] = batch_embeddings
+                
+                if self.cache is not None:
+                    self.cache.put_many(batch_texts, list(batch_embeddings))
+            
+            return embeddings
+        except Exception as e:
+            logger.error(f"sentence-transformers 批量嵌入失败，回退到简单版本: {e}")
+            return simple_embedding_service.get_embeddings_batch(texts, batch_size)
+    
+    def get_cache_stats(self) -> dict:
+        """获取嵌入缓存统计信息"""
+        if self.cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.cache.get_stats()}
 
-# 临时解决方案：强制使用简单嵌入服务
-embedding_service = EmbeddingService()
+# 全局嵌入服务实例（延迟加载，首次使用或应用启动后在后台构造）
+embedding_service = LazyService("embedding_service", EmbeddingService)
 
 # from app.services.simple_embedding_service import simple_embedding_service
 # embedding_service = simple_embedding_service
@@ -0,0 +1,478 @@
+from app.config.settings import settings
+from app.services.numpy_vector_store import IndexState, NumpyVectorStore
+from app.utils.vector_ops import recall_multiplier, top_k_indices
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import atexit
+import copy
+import heapq
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class HNSWIndexState(IndexState):
+    """HNSW图的状态：第0层邻接表、节点层数、上层邻接表和入口点"""
+
+    def __init__(self, index_path: str, generation: int = 0, m0: int = 0):
+        super().__init__(index_path, generation)
+        self.layer0 = np.full((0, m0), -1, dtype=np.int32)
+        self.levels = np.zeros(0, dtype=np.int8)
+        self.upper: List[Dict[int, np.ndarray]] = []  # 第 l 层（l >= 1）存放于 upper[l - 1]
+        self.graph_count = 0
+        self.entry_point = -1
+        self.max_level = -1
+        self.unsaved = 0
+        self.graph_version = 0
+        self.graph_mtime: Optional[float] = None  # 已加载（或本进程写入）的图状态文件的修改时间
+
+
+class HNSWVectorStore(NumpyVectorStore):
+    """
+    纯Python/NumPy实现的HNSW图索引
+    第0层邻接表保存在 (容量, 2M) 的int32数组中，上层节点较少，按层保存为 (节点数组, 邻接矩阵)；
+    图文件在启动时以写时复制方式内存映射，插入为增量操作无需重建，距离计算按邻居列表向量化
+    只有写入进程向图中插入节点并定期保存；其他进程加载已保存的图，对图之后追加的行做暴力搜索，
+    图状态文件变化时重新加载写入进程保存的图
+    向量使用余弦相似度（向量已归一化，即内积），越大越相近
+    """
+
+    LAYER0_FILE = "hnsw_layer0.npy"
+    LEVELS_FILE = "hnsw_levels.npy"
+    UPPER_NODES_FILE = "hnsw_upper_nodes_{}.npy"
+    UPPER_LINKS_FILE = "hnsw_upper_links_{}.npy"
+    GRAPH_STATE_FILE = "hnsw_state.json"
+    EXACT_BATCH_SEARCH = False
+
+    def __init__(self, index_path: Optional[str] = None, dimension: Optional[int] = None):
+        self.m = settings.hnsw_m
+        self.m0 = self.m * 2
+        self.ef_construction = settings.hnsw_ef_construction
+        self.ef_search = settings.hnsw_ef_search
+        self._level_mult = 1.0 / np.log(max(self.m, 2))
+        self._rng = np.random.default_rng(100)
+        self._is_writer = False
+
+        super().__init__(index_path, dimension)
+        atexit.register(self._save_on_exit)
+
+    def _new_state(self, generation: int) -> HNSWIndexState:
+        return HNSWIndexState(self.index_path, generation, self.m0)
+
+    # ---- 图结构访问 ----
+
+    def _matrix(self, state: HNSWIndexState) -> np.ndarray:
+        """向量矩阵的普通ndarray视图，避免np.memmap在大量小索引操作上的额外开销"""
+        return state.vectors.view(np.ndarray)
+
+    def _neighbors(self, state: HNSWIndexState, node: int, layer: int) -> np.ndarray:
+        # 只返回已完成插入的节点：无锁查询的快照可能读到快照之后插入的节点的边
+        links = state.layer0[node] if layer == 0 else state.upper[layer - 1][node]
+        return links[(links >= 0) & (links < state.graph_count)]
+
+    def _set_neighbors(self, state: HNSWIndexState, node: int, layer: int, neighbors: List[int]):
+        width = self.m0 if layer == 0 else self.m
+        links = np.full(width, -1, dtype=np.int32)
+        links[:len(neighbors)] = neighbors[:width]
+        if layer == 0:
+            state.layer0[node] = links
+        else:
+            state.upper[layer - 1][node] = links
+
+    def _ensure_graph_capacity(self, state: HNSWIndexState, required: int):
+        capacity = state.layer0.shape[0]
+        if required <= capacity:
+            return
+        new_capacity = max(1024, capacity * 2, required)
+        layer0 = np.full((new_capacity, self.m0), -1, dtype=np.int32)
+        layer0[:capacity] = state.layer0
+        levels = np.zeros(new_capacity, dtype=np.int8)
+        levels[:capacity] = state.levels
+        state.layer0 = layer0
+        state.levels = levels
+
+    # ---- 搜索 ----
+
+    def _search_layer(self, state: HNSWIndexState, query: np.ndarray, entry_points: List[int], ef: int, layer: int) -> List[Tuple[float, int]]:
+        """在单层上做best-first搜索，返回按相似度降序排列的最多ef个 (相似度, 节点)"""
+        vectors = self._matrix(state)
+        entry_scores = vectors[entry_points] @ query
+        visited = set(entry_points)
+        candidates = [(-float(score), node) for score, node in zip(entry_scores, entry_points)]
+        results = [(float(score), node) for score, node in zip(entry_scores, entry_points)]
+        heapq.heapify(candidates)
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            negative_score, node = heapq.heappop(candidates)
+            if len(results) >= ef and -negative_score < results[0][0]:
+                break
+
+            new_nodes = [n for n in self._neighbors(state, node, layer).tolist() if n not in visited]
+            if not new_nodes:
+                continue
+            visited.update(new_nodes)
+
+            # 一次计算所有未访问邻居的相似度
+            scores = vectors[new_nodes] @ query
+            for score, neighbor in zip(scores.tolist(), new_nodes):
+                if len(results) < ef or score > results[0][0]:
+                    heapq.heappush(candidates, (-score, neighbor))
+                    heapq.heappush(results, (score, neighbor))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        return sorted(results, reverse=True)
+
+    def _greedy_descend(self, state: HNSWIndexState, query: np.ndarray, target_level: int) -> int:
+        """从入口点沿上层贪心下降到 target_level 层"""
+        entry = state.entry_point
+        for layer in range(state.max_level, target_level, -1):
+            entry = self._search_layer(state, query, [entry], 1, layer)[0][1]
+        return entry
+
+    def _select_neighbors(self, state: HNSWIndexState, candidates: List[Tuple[float, int]], limit: int) -> List[int]:
+        """
+        启发式邻居选择：候选为按与基准点相似度降序的 (相似度, 节点)，
+        只有当候选与基准点的相似度高于它与所有已选邻居的相似度时才保留，
+        保证邻居分布在不同方向；不足时用被剪掉的最相近候选补足
+        """
+        if len(candidates) <= limit:
+            return [node for _, node in candidates]
+
+        nodes = [node for _, node in candidates]
+        base_scores = [score for score, _ in candidates]
+        vectors = self._matrix(state)[nodes]
+        pairwise = vectors @ vectors.T
+
+        # closest[i] 为候选i与已选邻居的最大相似度，每选中一个邻居用一次向量化的maximum更新
+        closest = np.full(len(nodes), -np.inf, dtype=np.float32)
+        selected: List[int] = []
+        pruned: List[int] = []
+        for i in range(len(nodes)):
+            if len(selected) >= limit:
+                break
+            if closest[i] < base_scores[i]:
+                selected.append(i)
+                np.maximum(closest, pairwise[i], out=closest)
+            else:
+                pruned.append(i)
+
+        for i in pruned:
+            if len(selected) >= limit:
+                break
+            selected.append(i)
+
+        return [nodes[i] for i in selected]
+
+    # ---- 插入 ----
+
+    def _insert_node(self, state: HNSWIndexState, node: int):
+        vectors = self._matrix(state)
+        query = vectors[node]
+        level = int(-np.log(max(self._rng.random(), 1e-12)) * self._level_mult)
+        self._ensure_graph_capacity(state, node + 1)
+        state.levels[node] = level
+        while len(state.upper) < level:
+            state.upper.append({})
+        for layer in range(1, level + 1):
+            state.upper[layer - 1][node] = np.full(self.m, -1, dtype=np.int32)
+
+        if state.entry_point < 0:
+            state.entry_point = node
+            state.max_level = level
+            return
+
+        entry_points = [self._greedy_descend(state, query, level)]
+        for layer in range(min(level, state.max_level), -1, -1):
+            found = self._search_layer(state, query, entry_points, self.ef_construction, layer)
+            limit = self.m0 if layer == 0 else self.m
+            neighbors = self._select_neighbors(state, found, self.m)
+            self._set_neighbors(state, node, layer, neighbors)
+
+            # 建立反向连接，邻居的邻接表溢出时重新选择
+            for neighbor in neighbors:
+                links = self._neighbors(state, neighbor, layer).tolist()
+                if node in links:
+                    continue
+                if len(links) < limit:
+                    self._set_neighbors(state, neighbor, layer, links + [node])
+                    continue
+                neighbor_vector = vectors[neighbor]
+                candidate_nodes = links + [node]
+                candidate_scores = (vectors[candidate_nodes] @ neighbor_vector).tolist()
+                ranked = sorted(zip(candidate_scores, candidate_nodes), reverse=True)
+                self._set_neighbors(state, neighbor, layer, self._select_neighbors(state, ranked, limit))
+
+            entry_points = [n for _, n in found]
+
+        if level > state.max_level:
+            state.entry_point = node
+            state.max_level = level
+
+    def _insert_rows(self, state: HNSWIndexState, start: int, end: int):
+        # 每插入一个节点即计入图中，之后插入的节点才能连接到它
+        for node in range(max(start, state.graph_count), end):
+            self._insert_node(state, node)
+            state.graph_count = node + 1
+            state.unsaved += 1
+
+    # ---- 持久化 ----
+
+    def _versioned_file(self, name: str, version: int) -> str:
+        # 版本0为压缩前旧格式的不带版本号的文件名
+        return name.replace(".npy", f"-{version:06d}.npy") if version else name
+
+    def _graph_files(self, version: int, layers: int) -> List[str]:
+        names = [self.LAYER0_FILE, self.LEVELS_FILE]
+        for layer in range(1, layers + 1):
+            names += [self.UPPER_NODES_FILE.format(layer), self.UPPER_LINKS_FILE.format(layer)]
+        return [self._versioned_file(name, version) for name in names]
+
+    def _read_graph_state(self, index_path: Optional[str] = None) -> Optional[dict]:
+        path = os.path.join(index_path or self.index_path, self.GRAPH_STATE_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_graph(self, target_path: str, version: int, layer0: np.ndarray, levels: np.ndarray, upper: List[Tuple[np.ndarray, np.ndarray]], graph_state: dict):
+        """
+        图数组写入带新版本号的文件，最后用 tmp + os.replace 替换状态文件作为提交，
+        读取方总是读到与状态文件一致的一组图文件
+        """
+        arrays = [layer0, levels]
+        for nodes, matrix in upper:
+            arrays += [nodes, matrix]
+        for name, array in zip(self._graph_files(version, len(upper)), arrays):
+            tmp_path = os.path.join(target_path, name + ".tmp.npy")
+            np.save(tmp_path, np.ascontiguousarray(array))
+            os.replace(tmp_path, os.path.join(target_path, name))
+        tmp_path = os.path.join(target_path, self.GRAPH_STATE_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({**graph_state, "version": version, "layers": len(upper)}, f)
+        os.replace(tmp_path, os.path.join(target_path, self.GRAPH_STATE_FILE))
+
+    def save_graph(self):
+        """
+        将图结构写入磁盘（持有文件锁），保留上一版本的文件给正在读取它的其他进程，更早的版本删除
+        磁盘上已有其他写入进程保存的更大的图时不覆盖，下次刷新时加载它
+        """
+        lock_handle = self._acquire_file_lock()
+        try:
+            with self._lock:
+                state = self._state
+                count = state.graph_count
+                previous = self._read_graph_state() or {}
+                if previous.get("count", 0) > count:
+                    state.unsaved = 0
+                    return
+
+                version = max(state.graph_version, previous.get("version", 0)) + 1
+                upper = []
+                for links in state.upper:
+                    nodes = np.array(sorted(links.keys()), dtype=np.int32)
+                    matrix = np.stack([links[n] for n in nodes.tolist()]) if len(nodes) else np.empty((0, self.m), dtype=np.int32)
+                    upper.append((nodes, matrix))
+                graph_state = {"count": count, "entry_point": state.entry_point, "max_level": state.max_level, "m": self.m, "generation": state.generation}
+                self._write_graph(self.index_path, version, state.layer0[:count], state.levels[:count], upper, graph_state)
+                state.graph_version = version
+                state.graph_mtime = os.path.getmtime(self._path(self.GRAPH_STATE_FILE))
+                state.unsaved = 0
+
+                keep = set(self._graph_files(version, len(upper)))
+                if previous:
+                    keep.update(self._graph_files(previous.get("version", 0), previous.get("layers", 0)))
+                for name in os.listdir(self.index_path):
+                    if name.startswith("hnsw_") and name.endswith(".npy") and name not in keep:
+                        os.remove(self._path(name))
+                logger.info(f"HNSW图已保存: {count} 个节点，{len(state.upper) + 1} 层")
+        finally:
+            lock_handle.close()
+
+    def _write_compacted_index(self, state: HNSWIndexState, target_path: str, keep: np.ndarray):
+        """
+        删除图中已删除的节点并重映射节点编号，指向已删除节点的边直接去掉；
+        入口点被删除时改用最高层中剩余的节点；未建图的行在查询时暴力搜索，由写入进程补充插入
+        """
+        with self._lock:
+            count = state.graph_count
+            keep = keep[keep < count]
+            # 多留一个位置，使 -1（空位）映射为 -1
+            old_to_new = np.full(count + 1, -1, dtype=np.int32)
+            old_to_new[keep] = np.arange(len(keep), dtype=np.int32)
+
+            def _remap(links: np.ndarray) -> np.ndarray:
+                mapped = old_to_new[links]
+                # 有效邻居排在前面，空位（-1）排在后面
+                order = np.argsort(mapped < 0, axis=-1, kind="stable")
+                return np.take_along_axis(mapped, order, axis=-1)
+
+            layer0 = _remap(np.asarray(state.layer0[keep]))
+            levels = np.asarray(state.levels[keep])
+            upper = []
+            for links in state.upper:
+                nodes = [node for node in sorted(links.keys()) if old_to_new[node] >= 0]
+                if not nodes:
+                    break
+                matrix = _remap(np.stack([links[node] for node in nodes]))
+                upper.append((old_to_new[nodes].astype(np.int32), matrix))
+
+            entry_point = int(old_to_new[state.entry_point]) if state.entry_point >= 0 else -1
+            max_level = len(upper)
+            if len(keep) and (entry_point < 0 or levels[entry_point] < max_level):
+                entry_point = int(np.argmax(levels))
+                max_level = int(levels[entry_point])
+                upper = upper[:max_level]
+            if not len(keep):
+                entry_point, max_level, upper = -1, -1, []
+            # 使用新的版本号，压缩替换文件时不会覆盖旧generation的读取方正在读取的同名文件
+            version = max(state.graph_version, (self._read_graph_state() or {}).get("version", 0)) + 1
+
+        graph_state = {"count": len(keep), "entry_point": entry_point, "max_level": max_level, "m": self.m, "generation": state.generation + 1}
+        self._write_graph(target_path, version, layer0, levels, upper, graph_state)
+
+    def _save_on_exit(self):
+        if self._is_writer and self._state.unsaved:
+            try:
+                self.save_graph()
+            except Exception as e:
+                logger.error(f"退出时保存HNSW图失败: {e}")
+
+    def _read_graph(self, state: HNSWIndexState) -> Optional[dict]:
+        """
+        读取已提交的图状态及其引用的图文件；图属于其他generation（压缩替换文件期间），
+        或节点数超过状态已提交的行数（刚保存、尚未读到新的元数据）时返回None，下次刷新时重试；
+        读取期间文件被新的保存删除时重读
+        """
+        for attempt in range(3):
+            path = self._path(self.GRAPH_STATE_FILE)
+            if not os.path.exists(path):
+                return None
+            mtime = os.path.getmtime(path)
+            graph_state = self._read_graph_state()
+            if graph_state["m"] != self.m:
+                raise ValueError(f"图的M={graph_state['m']} 与配置的 hnsw_m={self.m} 不一致")
+            if graph_state.get("generation", state.generation) != state.generation or graph_state["count"] > state.count:
+                return None
+            try:
+                files = self._graph_files(graph_state.get("version", 0), graph_state["layers"])
+                # 写时复制映射：多个进程共享只读页面
+                layer0 = np.load(self._path(files[0]), mmap_mode="c")
+                levels = np.load(self._path(files[1]), mmap_mode="c")
+                upper = []
+                for layer in range(graph_state["layers"]):
+                    nodes = np.load(self._path(files[2 + layer * 2]))
+                    matrix = np.load(self._path(files[3 + layer * 2]))
+                    upper.append({int(n): matrix[i].copy() for i, n in enumerate(nodes)})
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+                continue
+            return {**graph_state, "layer0": layer0, "levels": levels, "upper": upper, "mtime": mtime}
+
+    def _apply_graph(self, state: HNSWIndexState, graph: dict):
+        """用读取的图替换状态中的图结构（状态尚未发布或调用方持有 _lock）"""
+        state.layer0 = graph["layer0"]
+        state.levels = graph["levels"]
+        state.upper = graph["upper"]
+        state.graph_count = graph["count"]
+        state.entry_point = graph["entry_point"]
+        state.max_level = graph["max_level"]
+        state.graph_version = graph.get("version", 0)
+        state.graph_mtime = graph["mtime"]
+        state.unsaved = 0
+
+    def _load_index(self, state: HNSWIndexState):
+        """加载已保存的图；图保存之后追加的行在查询时暴力搜索，由写入进程在下次写入时插入"""
+        try:
+            graph = self._read_graph(state)
+            if graph is None:
+                return
+            self._apply_graph(state, graph)
+            logger.info(f"已加载HNSW图: {state.graph_count} 个节点")
+        except Exception as e:
+            logger.error(f"加载HNSW图失败，将由写入进程重新构建: {e}")
+
+    def _reload_graph(self):
+        """写入进程保存了新的图（图状态文件变化）后重新加载；本进程的图覆盖更多节点时保留自己的图"""
+        state = self._state
+        path = self._path(self.GRAPH_STATE_FILE)
+        if not os.path.exists(path) or os.path.getmtime(path) == state.graph_mtime:
+            return
+        try:
+            graph = self._read_graph(state)
+        except Exception as e:
+            logger.error(f"加载其他进程保存的HNSW图失败: {e}")
+            state.graph_mtime = os.path.getmtime(path)
+            return
+        with self._lock:
+            if graph is None or self._state is not state:
+                return
+            if graph["count"] <= state.graph_count:
+                state.graph_mtime = graph["mtime"]
+                return
+            self._apply_graph(state, graph)
+        logger.info(f"已加载其他进程保存的HNSW图: {state.graph_count} 个节点")
+
+    # ---- 父类扩展点 ----
+
+    def _refresh(self) -> HNSWIndexState:
+        # 保存图不改变元数据，每次刷新都检查图状态文件
+        super()._refresh()
+        self._reload_graph()
+        return self._state
+
+    def _append(self, documents, embeddings, ids=None):
+        self._is_writer = True
+        ids = super()._append(documents, embeddings, ids)
+        # 写入进程把图之后的全部行（包括其他进程追加、尚未建图的行）插入图中
+        with self._lock:
+            state = self._state
+            self._insert_rows(state, state.graph_count, state.count)
+            unsaved = state.unsaved
+        if unsaved >= settings.hnsw_save_interval:
+            self.save_graph()
+        return ids
+
+    def _search_rows(self, state: HNSWIndexState, query: np.ndarray, top_k: int, recall_hint: Optional[str] = None, ef_search: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        ef = ef_search or int(self.ef_search * recall_multiplier(recall_hint))
+        ef = max(ef, top_k)
+        # 只在锁内取状态的浅拷贝（图数组、入口点和节点数的引用），遍历时不持有锁，
+        # 并发查询之间、查询与插入之间不互相阻塞；快照之后插入的节点由 _neighbors 过滤
+        with self._lock:
+            graph = copy.copy(state)
+        count, graph_count = graph.count, graph.graph_count
+        found = []
+        if graph.entry_point >= 0:
+            entry = self._greedy_descend(graph, query, 0)
+            found = self._search_layer(graph, query, [entry], ef, 0)[:top_k]
+
+        rows = np.array([node for _, node in found], dtype=np.int64)
+        scores = np.array([score for score, _ in found], dtype=np.float32)
+        if count > graph_count:
+            # 尚未建图的行做暴力搜索，与图的结果合并
+            tail_scores = self._matrix(graph)[graph_count:count] @ query
+            tail_rows = top_k_indices(tail_scores, top_k)
+            rows = np.concatenate([rows, tail_rows.astype(np.int64) + graph_count])
+            scores = np.concatenate([scores, tail_scores[tail_rows].astype(np.float32)])
+            best = np.argsort(-scores, kind="stable")[:top_k]
+            rows, scores = rows[best], scores[best]
+        return rows, scores
+
+    def get_index_stats(self) -> dict:
+        """获取HNSW图状态"""
+        state = self._state
+        return {
+            "nodes": state.graph_count,
+            "layers": state.max_level + 1,
+            "entry_point": state.entry_point,
+            "m": self.m,
+            "ef_construction": self.ef_construction,
+            "ef_search": self.ef_search,
+            "unsaved": state.unsaved,
+        }
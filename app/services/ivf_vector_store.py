@@ -0,0 +1,436 @@
+from app.config.settings import settings
+from app.services.numpy_vector_store import IndexState, NumpyVectorStore
+from app.utils.vector_ops import normalize_rows, recall_multiplier, top_k_indices
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class IVFIndexState(IndexState):
+    """IVF索引的状态：簇中心、每行的簇分配和倒排列表"""
+
+    def __init__(self, index_path: str, generation: int = 0):
+        super().__init__(index_path, generation)
+        self.centroids: Optional[np.ndarray] = None
+        # 每行的簇分配，缓冲区按倍增扩容，前 assigned 行有效
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.assigned = 0
+        # 倒排列表：训练时构建的CSR结构 + 之后新增行的增量列表
+        self.posting_rows = np.empty(0, dtype=np.int64)
+        self.posting_offsets = np.zeros(1, dtype=np.int64)
+        self.delta_postings: Dict[int, List[int]] = {}
+        self.delta_count = 0
+
+        self.trained_count = 0
+        self.baseline_error = 0.0
+        self.new_error_sum = 0.0
+        self.new_error_count = 0
+        # 已加载或保存的状态文件版本和修改时间，用于发现其他进程提交的重新训练结果
+        self.ivf_version = 0
+        self.ivf_mtime: Optional[float] = None
+
+
+class IVFVectorStore(NumpyVectorStore):
+    """
+    倒排文件（IVF）近似索引
+    用向量化的球面k-means将向量划分到nlist个簇，每个簇维护一个倒排列表；
+    查询时只扫描与查询最相近的nprobe个簇，通过nprobe在速度和召回之间取舍
+    向量本身仍保存在父类的内存映射文件中，数据分布漂移或规模明显增长时由写入进程在后台重新训练，
+    只读进程不训练，加载写入进程提交的结果
+    训练结果写入带版本号的簇中心和簇分配文件，最后替换状态文件作为提交，其他进程发现状态文件变化后加载
+    """
+
+    CENTROIDS_FILE = "ivf_centroids.npy"
+    ASSIGNMENTS_FILE = "ivf_assignments.npy"
+    STATE_FILE = "ivf_state.json"
+    ASSIGN_BLOCK_SIZE = 16384
+    EXACT_BATCH_SEARCH = False
+    STATE_CLASS = IVFIndexState
+
+    def __init__(self, index_path: Optional[str] = None, dimension: Optional[int] = None):
+        self.nprobe = settings.ivf_nprobe
+        self._training = False
+        self._is_writer = False
+        self._train_lock = threading.Lock()
+        super().__init__(index_path, dimension)
+
+    # ---- k-means ----
+
+    def _assign(self, data: np.ndarray, centroids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """分块计算每个向量最近的簇（余弦相似度最大），返回 (簇编号, 相似度)"""
+        assignments = np.empty(data.shape[0], dtype=np.int32)
+        similarities = np.empty(data.shape[0], dtype=np.float32)
+        for start in range(0, data.shape[0], self.ASSIGN_BLOCK_SIZE):
+            block_scores = np.asarray(data[start:start + self.ASSIGN_BLOCK_SIZE]) @ centroids.T
+            block_assignments = block_scores.argmax(axis=1)
+            assignments[start:start + len(block_assignments)] = block_assignments
+            similarities[start:start + len(block_assignments)] = block_scores[np.arange(len(block_assignments)), block_assignments]
+        return assignments, similarities
+
+    def _kmeans(self, data: np.ndarray, nlist: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+        """球面k-means：每轮一次矩阵乘法完成分配，用排序 + reduceat 完成向量求和"""
+        centroids = data[rng.choice(data.shape[0], nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignments, _ = self._assign(data, centroids)
+            order = np.argsort(assignments, kind="stable")
+            sorted_assignments = assignments[order]
+            clusters, starts = np.unique(sorted_assignments, return_index=True)
+
+            sums = np.add.reduceat(data[order], starts, axis=0)
+            new_centroids = centroids.copy()
+            new_centroids[clusters] = sums
+
+            # 空簇用随机样本重新初始化
+            empty = np.setdiff1d(np.arange(nlist), clusters)
+            if len(empty):
+                new_centroids[empty] = data[rng.choice(data.shape[0], len(empty), replace=False)]
+
+            centroids = normalize_rows(new_centroids)
+
+        return centroids
+
+    def _choose_nlist(self, count: int) -> int:
+        if settings.ivf_nlist > 0:
+            return min(settings.ivf_nlist, count)
+        return max(1, min(count, int(4 * np.sqrt(count))))
+
+    def _committed_training(self) -> Tuple[int, int]:
+        """持有文件锁读取状态文件中已提交的 (版本, 训练行数)"""
+        lock_handle = self._acquire_file_lock()
+        try:
+            ivf_state = self._read_ivf_state() or {}
+        finally:
+            lock_handle.close()
+        return ivf_state.get("version", 0), ivf_state.get("trained_count", 0)
+
+    def train(self, only_if_needed: bool = False):
+        """
+        在当前全部向量上训练簇中心并重建倒排列表
+        训练前先加载其他进程已提交的结果，only_if_needed 为True（后台重训练）时加载后不再需要则跳过；
+        提交前重读状态文件，训练期间其他进程已提交新的训练结果时放弃本次结果
+        """
+        with self._train_lock:
+            self._reload_ivf()
+            if only_if_needed and not self._needs_retraining():
+                return
+            committed = self._committed_training()
+            state = self._state
+            count = state.count
+            if count < settings.ivf_min_train_size:
+                logger.info(f"文档数 {count} 少于训练阈值 {settings.ivf_min_train_size}，暂不训练IVF索引")
+                return
+
+            nlist = self._choose_nlist(count)
+            rng = np.random.default_rng(0)
+            sample_size = min(count, nlist * settings.ivf_train_sample_per_list)
+            sample_rows = np.sort(rng.choice(count, sample_size, replace=False))
+            sample = np.asarray(state.vectors[sample_rows], dtype=np.float32)
+
+            logger.info(f"开始训练IVF索引: {count} 个向量，{nlist} 个簇，训练样本 {sample_size}")
+            centroids = self._kmeans(sample, nlist, settings.ivf_train_iterations, rng)
+            assignments, similarities = self._assign(state.vectors[:count], centroids)
+
+            lock_handle = self._acquire_file_lock()
+            try:
+                with self._lock:
+                    if self._state is not state or self._read_meta().get("generation", 0) != state.generation:
+                        # 训练期间本进程或其他进程完成了压缩，行号已变化，结果作废
+                        logger.info("IVF训练期间索引已压缩，放弃本次训练结果")
+                        return
+                    ivf_state = self._read_ivf_state() or {}
+                    if (ivf_state.get("version", 0), ivf_state.get("trained_count", 0)) != committed:
+                        # 其他进程先提交了训练结果，保留它，下次刷新时加载
+                        logger.info("IVF训练期间其他进程已提交新的训练结果，放弃本次训练结果")
+                        return
+                    # 训练期间追加的行在切换后补充分配
+                    state.centroids = centroids
+                    state.assignments = assignments
+                    state.assigned = count
+                    state.trained_count = count
+                    state.baseline_error = float(np.mean(1.0 - similarities))
+                    state.new_error_sum = 0.0
+                    state.new_error_count = 0
+                    self._rebuild_postings(state)
+                    if state.count > count:
+                        self._assign_new_rows(state, count, state.count)
+                    self._save_ivf(state)
+            finally:
+                lock_handle.close()
+
+            logger.info(f"IVF索引训练完成，平均量化误差: {state.baseline_error:.4f}")
+
+    # ---- 倒排列表 ----
+
+    def _rebuild_postings(self, state: IVFIndexState):
+        """由分配结果构建CSR形式的倒排列表"""
+        nlist = state.centroids.shape[0]
+        assignments = state.assignments[:state.assigned]
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=nlist)
+        state.posting_rows = order.astype(np.int64)
+        state.posting_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        state.delta_postings = {}
+        state.delta_count = 0
+
+    def _assign_new_rows(self, state: IVFIndexState, start: int, end: int):
+        """为新增行分配簇并加入增量倒排列表，同时累计量化误差用于漂移检测"""
+        assignments, similarities = self._assign(state.vectors[start:end], state.centroids)
+        if end > len(state.assignments):
+            buffer = np.empty(max(1024, len(state.assignments) * 2, end), dtype=np.int32)
+            buffer[:start] = state.assignments[:start]
+            state.assignments = buffer
+        state.assignments[start:end] = assignments
+        state.assigned = end
+        for offset, cluster in enumerate(assignments.tolist()):
+            state.delta_postings.setdefault(cluster, []).append(start + offset)
+        state.delta_count += len(assignments)
+        state.new_error_sum += float(np.sum(1.0 - similarities))
+        state.new_error_count += len(assignments)
+
+        # 增量部分过大时合并进CSR结构
+        if state.delta_count > max(1024, len(state.posting_rows) // 10):
+            self._rebuild_postings(state)
+
+    def _cluster_rows(self, state: IVFIndexState, clusters: np.ndarray) -> np.ndarray:
+        parts = []
+        for cluster in clusters.tolist():
+            parts.append(state.posting_rows[state.posting_offsets[cluster]:state.posting_offsets[cluster + 1]])
+            delta = state.delta_postings.get(cluster)
+            if delta:
+                parts.append(np.asarray(delta, dtype=np.int64))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    # ---- 漂移检测与后台重训练 ----
+
+    def _needs_retraining(self) -> bool:
+        state = self._state
+        if state.centroids is None:
+            return state.count >= settings.ivf_min_train_size
+        if state.count >= state.trained_count * settings.ivf_retrain_growth:
+            return True
+        if state.new_error_count >= max(100, state.trained_count // 10):
+            new_error = state.new_error_sum / state.new_error_count
+            return new_error > state.baseline_error * settings.ivf_retrain_drift
+        return False
+
+    def _schedule_retraining(self):
+        with self._lock:
+            if self._training or not self._needs_retraining():
+                return
+            self._training = True
+
+        def _run():
+            try:
+                self.train(only_if_needed=True)
+            except Exception as e:
+                logger.error(f"IVF索引后台训练失败: {e}")
+            finally:
+                self._training = False
+
+        threading.Thread(target=_run, name="ivf-train", daemon=True).start()
+
+    # ---- 持久化 ----
+
+    def _versioned_file(self, name: str, version: int) -> str:
+        return name.replace(".npy", f"-{version:06d}.npy")
+
+    def _read_ivf_state(self) -> Optional[Dict[str, Any]]:
+        path = self._path(self.STATE_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_ivf(self, state: IVFIndexState):
+        """
+        簇中心和簇分配写入带新版本号的文件，最后用 tmp + os.replace 替换状态文件作为提交（调用方持有文件锁）
+        上一版本的文件保留给正在读取它的其他进程，更早的版本删除
+        """
+        previous = self._read_ivf_state() or {}
+        version = max(state.ivf_version, previous.get("version", 0)) + 1
+        ivf_state = {
+            "version": version,
+            "generation": state.generation,
+            "trained_count": state.trained_count,
+            "baseline_error": state.baseline_error,
+            "centroids_file": self._versioned_file(self.CENTROIDS_FILE, version),
+            "assignments_file": self._versioned_file(self.ASSIGNMENTS_FILE, version)
+        }
+        for name, array in ((ivf_state["centroids_file"], state.centroids), (ivf_state["assignments_file"], state.assignments[:state.trained_count])):
+            np.save(self._path(name + ".tmp.npy"), array)
+            os.replace(self._path(name + ".tmp.npy"), self._path(name))
+        tmp_path = self._path(self.STATE_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(ivf_state, f)
+        os.replace(tmp_path, self._path(self.STATE_FILE))
+        state.ivf_version = version
+        state.ivf_mtime = os.path.getmtime(self._path(self.STATE_FILE))
+
+        keep = {
+            ivf_state["centroids_file"], ivf_state["assignments_file"],
+            previous.get("centroids_file", self.CENTROIDS_FILE), previous.get("assignments_file", self.ASSIGNMENTS_FILE)
+        }
+        prefixes = (self.CENTROIDS_FILE[:-len(".npy")], self.ASSIGNMENTS_FILE[:-len(".npy")])
+        for name in os.listdir(self.index_path):
+            if name.startswith(prefixes) and name not in keep:
+                os.remove(self._path(name))
+
+    def _read_ivf(self, state: IVFIndexState) -> Optional[Dict[str, Any]]:
+        """
+        读取已提交的状态文件及其引用的簇中心和簇分配；状态文件属于其他generation（压缩替换文件期间）时返回None，
+        下次刷新时重试；读取期间文件被新的提交删除时重读
+        """
+        for attempt in range(3):
+            path = self._path(self.STATE_FILE)
+            if not os.path.exists(path):
+                return None
+            mtime = os.path.getmtime(path)
+            ivf_state = self._read_ivf_state()
+            if ivf_state.get("generation", state.generation) != state.generation:
+                return None
+            try:
+                centroids = np.load(self._path(ivf_state.get("centroids_file", self.CENTROIDS_FILE)))
+                assignments = np.load(self._path(ivf_state.get("assignments_file", self.ASSIGNMENTS_FILE)))
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+                continue
+            return {**ivf_state, "centroids": centroids, "assignments": assignments, "mtime": mtime}
+
+    def _apply_ivf(self, state: IVFIndexState, ivf: Dict[str, Any]):
+        """用读取的训练结果替换状态中的IVF结构，训练之后追加的行重新分配（状态尚未发布或调用方持有 _lock）"""
+        state.centroids = ivf["centroids"]
+        state.assignments = ivf["assignments"].astype(np.int32)
+        state.assigned = len(state.assignments)
+        state.trained_count = ivf["trained_count"]
+        state.baseline_error = ivf["baseline_error"]
+        state.new_error_sum = 0.0
+        state.new_error_count = 0
+        state.ivf_version = ivf.get("version", 0)
+        state.ivf_mtime = ivf["mtime"]
+        self._rebuild_postings(state)
+        if state.count > state.assigned:
+            self._assign_new_rows(state, state.assigned, state.count)
+
+    def _load_index(self, state: IVFIndexState):
+        """加载已训练的簇中心和簇分配，训练之后追加的行重新分配"""
+        try:
+            ivf = self._read_ivf(state)
+            if ivf is None:
+                return
+            self._apply_ivf(state, ivf)
+            logger.info(f"已加载IVF索引: {state.centroids.shape[0]} 个簇")
+        except Exception as e:
+            logger.error(f"加载IVF索引失败，将重新训练: {e}")
+            state.centroids = None
+
+    def _reload_ivf(self):
+        """其他进程重新训练并提交（状态文件变化）后，加载新的簇中心和簇分配"""
+        state = self._state
+        path = self._path(self.STATE_FILE)
+        if not os.path.exists(path) or os.path.getmtime(path) == state.ivf_mtime:
+            return
+        try:
+            ivf = self._read_ivf(state)
+        except Exception as e:
+            logger.error(f"加载其他进程训练的IVF索引失败: {e}")
+            state.ivf_mtime = os.path.getmtime(path)
+            return
+        with self._lock:
+            if ivf is None or self._state is not state:
+                return
+            if ivf.get("version", 0) == state.ivf_version:
+                state.ivf_mtime = ivf["mtime"]
+                return
+            self._apply_ivf(state, ivf)
+        logger.info(f"已加载其他进程训练的IVF索引: 版本 {state.ivf_version}")
+
+    # ---- 父类扩展点 ----
+
+    def compact(self) -> int:
+        # 训练会在旧行号上保存簇分配，压缩期间不能同时训练
+        with self._train_lock:
+            return super().compact()
+
+    def _write_compacted_index(self, state: IVFIndexState, target_path: str, keep: np.ndarray):
+        """簇中心不变，已训练行的簇分配按保留的行重映射；之后的行在加载时重新分配"""
+        if state.centroids is None:
+            return
+        with self._lock:
+            trained_keep = keep[keep < state.trained_count]
+            # 使用新的版本号，压缩替换文件时不会覆盖旧generation的读取方正在读取的同名文件
+            version = max(state.ivf_version, (self._read_ivf_state() or {}).get("version", 0)) + 1
+            ivf_state = {
+                "version": version,
+                "generation": state.generation + 1,
+                "trained_count": len(trained_keep),
+                "baseline_error": state.baseline_error,
+                "centroids_file": self._versioned_file(self.CENTROIDS_FILE, version),
+                "assignments_file": self._versioned_file(self.ASSIGNMENTS_FILE, version)
+            }
+            np.save(os.path.join(target_path, ivf_state["centroids_file"]), state.centroids)
+            np.save(os.path.join(target_path, ivf_state["assignments_file"]), state.assignments[trained_keep])
+        with open(os.path.join(target_path, self.STATE_FILE), "w", encoding="utf-8") as f:
+            json.dump(ivf_state, f)
+
+    def _on_rows_appended(self, state: IVFIndexState, start: int, end: int):
+        if state.centroids is not None and end > state.assigned:
+            self._assign_new_rows(state, max(start, state.assigned), end)
+
+    def _refresh(self) -> IVFIndexState:
+        # 重新训练不改变元数据，每次刷新都检查状态文件
+        super()._refresh()
+        self._reload_ivf()
+        return self._state
+
+    def _on_refresh(self):
+        # 只由写入进程重新训练，避免每个进程各自对同一漂移做一次完整的k-means
+        if self._is_writer:
+            self._schedule_retraining()
+
+    def _append(self, documents, embeddings, ids=None):
+        self._is_writer = True
+        ids = super()._append(documents, embeddings, ids)
+        self._schedule_retraining()
+        return ids
+
+    def _search_rows(self, state: IVFIndexState, query: np.ndarray, top_k: int, recall_hint: Optional[str] = None, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        # 尚未训练时退化为精确搜索
+        if state.centroids is None:
+            return super()._search_rows(state, query, top_k)
+
+        with self._lock:
+            nlist = state.centroids.shape[0]
+            nprobe = nprobe or max(1, int(round(self.nprobe * recall_multiplier(recall_hint))))
+            nprobe = min(nprobe, nlist)
+
+            probe = top_k_indices(state.centroids @ query, nprobe)
+            candidates = self._cluster_rows(state, probe)
+
+        if len(candidates) == 0:
+            return candidates, np.empty(0, dtype=np.float32)
+
+        scores = state.vectors[candidates] @ query
+        best = top_k_indices(scores, top_k)
+        return candidates[best], scores[best]
+
+    def get_index_stats(self) -> dict:
+        """获取IVF索引状态"""
+        state = self._state
+        return {
+            "trained": state.centroids is not None,
+            "nlist": int(state.centroids.shape[0]) if state.centroids is not None else 0,
+            "nprobe": self.nprobe,
+            "trained_count": state.trained_count,
+            "version": state.ivf_version,
+            "count": state.count,
+            "baseline_error": round(state.baseline_error, 4),
+            "new_error": round(state.new_error_sum / state.new_error_count, 4) if state.new_error_count else None,
+            "training": self._training,
+        }
@@ -0,0 +1,500 @@
+from app.config.settings import settings
+from app.models.document_models import DocumentCreate
+from app.utils.lazy_service import LazyService
+from app.utils.lexical_tokenizer import tokenize
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import json
+import logging
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只能依赖单写入进程
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class LexicalIndex:
+    """
+    进程内的BM25倒排索引
+    倒排列表以数组形式常驻内存：合并后的CSR结构（每个词的起止位置 + 行号int32 + 词频uint16）
+    加上最近写入的增量数组，增量超过阈值时合并；删除只标记行失效，合并时清理
+    每批写入保存为一个npz段文件，删除追加到删除记录文件，manifest.json 为提交点，
+    其他进程在manifest变化后加载新的段和删除记录；段过多时写入进程在后台把内存中的全部数据合并为一个新段，
+    合并段和新的删除记录文件使用新的文件名，提交manifest之前不改动读取中的文件
+    """
+
+    MANIFEST_FILE = "manifest.json"
+    DELETED_FILE = "deleted.jsonl"
+    MERGED_DELETED_FILE = "deleted-{:06d}.jsonl"
+    LOCK_FILE = "write.lock"
+    SEGMENT_FILE = "seg-{:06d}.npz"
+    MERGED_SEGMENT_FILE = "seg-{:06d}.g{:06d}.npz"
+    MAX_SEGMENTS = 64
+    MIN_DELTA_MERGE = 100000
+
+    def __init__(self, index_path: Optional[str] = None):
+        self.index_path = index_path or settings.lexical_index_path
+        self.k1 = settings.bm25_k1
+        self.b = settings.bm25_b
+        self._lock = threading.RLock()
+        self._merging = False
+        self._reset()
+        os.makedirs(self.index_path, exist_ok=True)
+        self._refresh()
+        logger.info(f"BM25倒排索引初始化成功: {self.index_path}，文档数: {self._live_count}")
+
+    def _reset(self):
+        self._manifest_mtime = None
+        self._generation = 0
+        self._segments: List[str] = []
+        self._deleted_file = self.DELETED_FILE
+        self._deleted_offset = 0
+
+        self._ids: List[str] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._doc_lengths = np.zeros(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._live_count = 0
+        self._total_length = 0.0
+
+        self._vocabulary: Dict[str, int] = {}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._rows = np.zeros(0, dtype=np.int32)
+        self._tfs = np.zeros(0, dtype=np.uint16)
+        self._delta_terms: List[np.ndarray] = []
+        self._delta_rows: List[np.ndarray] = []
+        self._delta_tfs: List[np.ndarray] = []
+        # 增量倒排按词索引：词ID -> [(行号, 词频)]，值为按词排序后的增量数组的切片视图
+        self._delta_postings: Dict[int, List[Tuple[np.ndarray, np.ndarray]]] = {}
+        self._delta_count = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.index_path, name)
+
+    # ---- 加载与刷新 ----
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        with open(self._path(self.MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_manifest(self):
+        manifest = {
+            "generation": self._generation,
+            "segments": self._segments,
+            "deleted_file": self._deleted_file,
+            "deleted_bytes": self._deleted_offset
+        }
+        tmp_path = self._path(self.MANIFEST_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._path(self.MANIFEST_FILE))
+        self._manifest_mtime = os.path.getmtime(self._path(self.MANIFEST_FILE))
+
+    def _refresh(self):
+        """加载其他进程提交的新段和删除记录；段被合并（generation变化）时整体重新加载"""
+        manifest_path = self._path(self.MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return
+        mtime = os.path.getmtime(manifest_path)
+        if mtime == self._manifest_mtime:
+            return
+
+        with self._lock:
+            for attempt in range(2):
+                manifest = self._read_manifest()
+                if attempt or manifest["generation"] != self._generation:
+                    self._reset()
+                    self._generation = manifest["generation"]
+                    self._deleted_file = manifest.get("deleted_file", self.DELETED_FILE)
+                try:
+                    # 删除记录带有写入时的段数，与段按提交顺序交替应用，删除后以同一ID重新写入的文档不受影响
+                    for entry in self._read_deleted(manifest["deleted_bytes"]):
+                        self._load_segments(manifest["segments"][:entry["segments"]])
+                        self._mark_deleted(entry["ids"])
+                    self._load_segments(manifest["segments"])
+                    break
+                except FileNotFoundError:
+                    # 读取期间其他进程提交了合并并删除了旧文件，按新的manifest整体重新加载
+                    if attempt:
+                        raise
+            self._manifest_mtime = mtime
+
+    def _load_segments(self, names: List[str]):
+        for name in names[len(self._segments):]:
+            self._load_segment(name)
+            self._segments.append(name)
+
+    def _load_segment(self, name: str):
+        with np.load(self._path(name), allow_pickle=False) as segment:
+            terms = segment["terms"].tolist()
+            term_ids = np.array([self._term_id(term) for term in terms], dtype=np.int32)
+            offsets = segment["offsets"]
+            self._add_rows(segment["ids"].tolist(), segment["lengths"])
+            base = len(self._ids) - len(segment["lengths"])
+            self._add_postings(
+                np.repeat(term_ids, np.diff(offsets)),
+                segment["rows"].astype(np.int32) + base,
+                segment["tfs"].astype(np.uint16)
+            )
+
+    def _read_deleted(self, size: int) -> List[Dict[str, Any]]:
+        entries = self._read_deleted_range(self._deleted_offset, size)
+        self._deleted_offset = max(self._deleted_offset, size)
+        return entries
+
+    def _read_deleted_range(self, start: int, end: int) -> List[Dict[str, Any]]:
+        if end <= start:
+            return []
+        with open(self._path(self._deleted_file), "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+        return [json.loads(line) for line in data.decode("utf-8").splitlines()]
+
+    # ---- 内存结构 ----
+
+    def _term_id(self, term: str) -> int:
+        term_id = self._vocabulary.get(term)
+        if term_id is None:
+            term_id = self._vocabulary[term] = len(self._vocabulary)
+        return term_id
+
+    def _add_rows(self, ids: List[str], lengths: np.ndarray):
+        start = len(self._ids)
+        end = start + len(ids)
+        if end > len(self._alive):
+            capacity = max(1024, len(self._alive) * 2, end)
+            self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+            self._doc_lengths = np.concatenate([self._doc_lengths, np.zeros(capacity - len(self._doc_lengths), dtype=np.float32)])
+        # 同一ID再次写入时旧的行失效
+        self._mark_deleted(ids)
+        for offset, doc_id in enumerate(ids):
+            self._id_to_row[doc_id] = start + offset
+        self._ids.extend(ids)
+        self._alive[start:end] = True
+        self._doc_lengths[start:end] = lengths
+        self._live_count += len(ids)
+        self._total_length += float(np.sum(lengths))
+
+    def _mark_deleted(self, ids: Sequence[str]):
+        for doc_id in ids:
+            row = self._id_to_row.pop(doc_id, None)
+            if row is not None and self._alive[row]:
+                self._alive[row] = False
+                self._live_count -= 1
+                self._total_length -= float(self._doc_lengths[row])
+
+    def _add_postings(self, term_ids: np.ndarray, rows: np.ndarray, tfs: np.ndarray):
+        order = np.argsort(term_ids, kind="stable")
+        term_ids, rows, tfs = term_ids[order], rows[order], tfs[order]
+        self._delta_terms.append(term_ids)
+        self._delta_rows.append(rows)
+        self._delta_tfs.append(tfs)
+        terms, starts = np.unique(term_ids, return_index=True)
+        ends = np.append(starts[1:], len(term_ids))
+        for term_id, start, end in zip(terms.tolist(), starts.tolist(), ends.tolist()):
+            self._delta_postings.setdefault(term_id, []).append((rows[start:end], tfs[start:end]))
+        self._delta_count += len(rows)
+        if self._delta_count >= max(self.MIN_DELTA_MERGE, len(self._rows) // 10):
+            self._merge_postings()
+
+    def _merge_postings(self):
+        """把增量倒排合并进CSR结构，同时丢弃已删除行的倒排"""
+        term_ids = np.concatenate([np.repeat(np.arange(len(self._offsets) - 1, dtype=np.int32), np.diff(self._offsets))] + self._delta_terms)
+        rows = np.concatenate([self._rows] + self._delta_rows)
+        tfs = np.concatenate([self._tfs] + self._delta_tfs)
+        live = self._alive[rows]
+        term_ids, rows, tfs = term_ids[live], rows[live], tfs[live]
+
+        order = np.argsort(term_ids, kind="stable")
+        self._rows, self._tfs = rows[order], tfs[order]
+        self._offsets = np.zeros(len(self._vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(self._vocabulary)), out=self._offsets[1:])
+        self._delta_terms, self._delta_rows, self._delta_tfs = [], [], []
+        self._delta_postings = {}
+        self._delta_count = 0
+
+    def _postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """一个词的全部倒排：CSR中的区间加上增量中该词的切片，开销只与该词的倒排长度有关"""
+        rows_parts, tfs_parts = [], []
+        if term_id < len(self._offsets) - 1:
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            rows_parts.append(self._rows[start:end])
+            tfs_parts.append(self._tfs[start:end])
+        for rows, tfs in self._delta_postings.get(term_id, ()):
+            rows_parts.append(rows)
+            tfs_parts.append(tfs)
+        if not rows_parts:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.uint16)
+        return np.concatenate(rows_parts), np.concatenate(tfs_parts)
+
+    # ---- 写入 ----
+
+    def _acquire_file_lock(self):
+        handle = open(self._path(self.LOCK_FILE), "a")
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def _next_segment_name(self) -> str:
+        last = int(self._segments[-1][4:10]) if self._segments else -1
+        return self.SEGMENT_FILE.format(last + 1)
+
+    @staticmethod
+    def _save_npz(path: str, **arrays):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    def add_documents(self, ids: Sequence[Optional[str]], documents: Sequence[DocumentCreate]):
+        """登记一批已写入向量存储的文档（ID为None的失败项跳过），写为一个新段"""
+        pairs = [(doc_id, document) for doc_id, document in zip(ids, documents) if doc_id is not None]
+        if not pairs:
+            return
+
+        # 段内的局部词表和CSR倒排
+        local_vocabulary: Dict[str, int] = {}
+        term_ids, rows, tfs, lengths = [], [], [], []
+        for row, (_, document) in enumerate(pairs):
+            tokens = tokenize(document.content)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_ids.append(local_vocabulary.setdefault(term, len(local_vocabulary)))
+                rows.append(row)
+                tfs.append(min(tf, np.iinfo(np.uint16).max))
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(local_vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(local_vocabulary)), out=offsets[1:])
+
+        with self._lock:
+            lock_handle = self._acquire_file_lock()
+            try:
+                self._refresh()
+                name = self._next_segment_name()
+                self._save_npz(
+                    self._path(name),
+                    ids=np.array([doc_id for doc_id, _ in pairs], dtype=str),
+                    lengths=np.asarray(lengths, dtype=np.float32),
+                    terms=np.array(list(local_vocabulary), dtype=str),
+                    offsets=offsets,
+                    rows=np.asarray(rows, dtype=np.int32)[order],
+                    tfs=np.asarray(tfs, dtype=np.uint16)[order]
+                )
+                self._load_segment(name)
+                self._segments.append(name)
+                self._write_manifest()
+            finally:
+                lock_handle.close()
+            self._schedule_merge()
+        logger.info(f"BM25索引新增 {len(pairs)} 个文档")
+
+    def remove(self, ids: Sequence[str]):
+        """删除文档，之后的查询立即跳过"""
+        if not ids:
+            return
+        with self._lock:
+            lock_handle = self._acquire_file_lock()
+            try:
+                self._refresh()
+                deleted_path = self._path(self._deleted_file)
+                # 丢弃上次未提交的删除记录
+                if os.path.exists(deleted_path) and os.path.getsize(deleted_path) > self._deleted_offset:
+                    os.truncate(deleted_path, self._deleted_offset)
+                with open(deleted_path, "ab") as f:
+                    entry = {"segments": len(self._segments), "ids": list(ids)}
+                    f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+                self._mark_deleted(ids)
+                self._deleted_offset = os.path.getsize(deleted_path)
+                self._write_manifest()
+            finally:
+                lock_handle.close()
+
+    def _schedule_merge(self):
+        """段数超过上限时在后台线程合并（调用方持有 self._lock）"""
+        if self._merging or len(self._segments) <= self.MAX_SEGMENTS:
+            return
+        self._merging = True
+
+        def _run():
+            try:
+                self.merge_segments()
+            except Exception as e:
+                logger.error(f"BM25索引后台合并失败: {e}")
+            finally:
+                self._merging = False
+
+        threading.Thread(target=_run, name="lexical-merge", daemon=True).start()
+
+    def _merged_segment(self) -> Tuple[str, Dict[str, np.ndarray]]:
+        """取内存中全部存活文档的快照，返回 (合并段文件名, 段数组)（调用方持有 self._lock）"""
+        self._merge_postings()
+        live_rows = np.flatnonzero(self._alive[:len(self._ids)])
+        new_rows = np.full(len(self._ids), -1, dtype=np.int32)
+        new_rows[live_rows] = np.arange(len(live_rows), dtype=np.int32)
+        terms = sorted(self._vocabulary, key=self._vocabulary.get)
+        # 合并段沿用最后一个被合并段的序号，之后写入的段序号更大；generation保证文件名不重复
+        last = int(self._segments[-1][4:10]) if self._segments else 0
+        arrays = {
+            "ids": np.array([self._ids[row] for row in live_rows.tolist()], dtype=str),
+            "lengths": self._doc_lengths[live_rows],
+            "terms": np.array(terms, dtype=str),
+            "offsets": self._offsets,
+            "rows": new_rows[self._rows],
+            "tfs": self._tfs
+        }
+        return self.MERGED_SEGMENT_FILE.format(last, self._generation + 1), arrays
+
+    def _commit_merged_segment(self, name: str, segment_count: int, deleted_offset: int):
+        """
+        以新的generation提交合并段：合并段替换前segment_count个段，之后写入的段保留在其后，
+        快照之后（deleted_offset之后）的删除记录改写到新的删除记录文件中（调用方持有两把写锁）
+        """
+        tail = self._segments[segment_count:]
+        entries = self._read_deleted_range(deleted_offset, self._deleted_offset)
+        old_files = self._segments[:segment_count] + [self._deleted_file]
+
+        generation = self._generation + 1
+        deleted_file = self.MERGED_DELETED_FILE.format(generation)
+        with open(self._path(deleted_file), "wb") as f:
+            for entry in entries:
+                entry = {"segments": entry["segments"] - segment_count + 1, "ids": entry["ids"]}
+                f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+            deleted_bytes = f.tell()
+
+        self._generation = generation
+        self._segments = [name] + tail
+        self._deleted_file = deleted_file
+        self._deleted_offset = deleted_bytes
+        self._write_manifest()
+        for old_name in old_files:
+            if os.path.exists(self._path(old_name)):
+                os.remove(self._path(old_name))
+
+    def merge_segments(self) -> bool:
+        """
+        把当前全部段合并为一个段，返回是否提交
+        只在取快照和提交时持有锁，写合并段文件期间不阻塞写入和查询；
+        其他进程先行合并或重建（generation已变化）时放弃本次结果
+        """
+        with self._lock:
+            self._refresh()
+            if len(self._segments) <= 1:
+                return False
+            generation, segment_count, deleted_offset = self._generation, len(self._segments), self._deleted_offset
+            name, arrays = self._merged_segment()
+        self._save_npz(self._path(name), **arrays)
+
+        with self._lock:
+            lock_handle = self._acquire_file_lock()
+            try:
+                self._refresh()
+                if self._generation != generation:
+                    os.remove(self._path(name))
+                    return False
+                self._commit_merged_segment(name, segment_count, deleted_offset)
+            finally:
+                lock_handle.close()
+        logger.info(f"BM25索引段已合并: {segment_count} 个段合并为 {name}")
+        return True
+
+    def rebuild(self, records) -> int:
+        """由 (ID列表, 文档列表, ...) 批次（如向量存储的 iter_records）重建整个索引，返回文档数"""
+        with self._lock:
+            lock_handle = self._acquire_file_lock()
+            try:
+                self._refresh()
+                old_segments, generation = self._segments, self._generation
+                deleted_file, deleted_offset = self._deleted_file, self._deleted_offset
+                self._reset()
+                self._generation = generation
+                for batch in records:
+                    ids, documents = list(batch[0]), batch[1]
+                    counts = [Counter(tokenize(document.content)) for document in documents]
+                    base = len(self._ids)
+                    self._add_rows(ids, np.asarray([sum(c.values()) for c in counts], dtype=np.float32))
+                    postings = [
+                        (self._term_id(term), base + row, min(tf, np.iinfo(np.uint16).max))
+                        for row, c in enumerate(counts) for term, tf in c.items()
+                    ]
+                    if postings:
+                        term_ids, rows, tfs = zip(*postings)
+                        self._add_postings(
+                            np.asarray(term_ids, dtype=np.int32),
+                            np.asarray(rows, dtype=np.int32),
+                            np.asarray(tfs, dtype=np.uint16)
+                        )
+                # 以合并段的方式提交，替换原有的段和删除记录
+                self._segments, self._deleted_file, self._deleted_offset = old_segments, deleted_file, deleted_offset
+                name, arrays = self._merged_segment()
+                self._save_npz(self._path(name), **arrays)
+                self._commit_merged_segment(name, len(old_segments), deleted_offset)
+            finally:
+                lock_handle.close()
+        logger.info(f"BM25索引已重建: {self._live_count} 个文档")
+        return self._live_count
+
+    # ---- 查询 ----
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[str, float]]:
+        """BM25检索，返回按分数降序的 (文档ID, 分数)；只在命中的行上累加分数，开销与倒排长度有关而与文档总数无关"""
+        self._refresh()
+        terms = Counter(tokenize(query))
+        with self._lock:
+            if not terms or self._live_count == 0:
+                return []
+            average_length = self._total_length / self._live_count
+            all_rows, all_weights = [], []
+            for term, query_tf in terms.items():
+                term_id = self._vocabulary.get(term)
+                if term_id is None:
+                    continue
+                rows, tfs = self._postings(term_id)
+                live = self._alive[rows]
+                rows, tfs = rows[live], tfs[live].astype(np.float32)
+                if len(rows) == 0:
+                    continue
+                idf = np.log(1.0 + (self._live_count - len(rows) + 0.5) / (len(rows) + 0.5))
+                norm = self.k1 * (1.0 - self.b + self.b * self._doc_lengths[rows] / average_length)
+                all_rows.append(rows)
+                all_weights.append(query_tf * idf * tfs * (self.k1 + 1.0) / (tfs + norm))
+            if not all_rows:
+                return []
+
+            matched, inverse = np.unique(np.concatenate(all_rows), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(all_weights), minlength=len(matched))
+            k = min(top_k, len(matched))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best], kind="stable")]
+            return [(self._ids[row], float(scores[i])) for row, i in zip(matched[best].tolist(), best.tolist())]
+
+    def get_document_count(self) -> int:
+        """已索引的（未删除的）文档数"""
+        self._refresh()
+        return self._live_count
+
+    def commit_point(self) -> Tuple[int, int, int]:
+        """已提交的 (generation, 段数, 删除记录字节数)：任何进程的写入、删除或合并都会改变它"""
+        self._refresh()
+        with self._lock:
+            return self._generation, len(self._segments), self._deleted_offset
+
+    def get_stats(self) -> dict:
+        """获取倒排索引状态"""
+        self._refresh()
+        with self._lock:
+            return {
+                "documents": self._live_count,
+                "terms": len(self._vocabulary),
+                "postings": int(len(self._rows) + self._delta_count),
+                "postings_bytes": int(self._rows.nbytes + self._tfs.nbytes + self._offsets.nbytes + self._delta_count * 10),
+                "segments": len(self._segments),
+            }
+
+
+lexical_index = LazyService("lexical_index", LexicalIndex)
@@ -13,6 +13,10 @@ class LLMService:
         # 使用HTTP版本的Ollama服务
         self.llm_backend = ollama_http_service
     
+    async def wait_ready(self, timeout=None):
+        """等待LLM后端就绪"""
+        await self.llm_backend.wait_ready(timeout)
+    
     def is_available(self):
         """检查LLM服务是否可用"""
         return True  # HTTP服务总是尝试可用
@@ -1,13 +1,26 @@
 import pymongo
+from bson import ObjectId
+from bson.errors import InvalidId
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 from app.config.settings import settings
-from app.models.document_models import Document, DocumentCreate
-from typing import List, Optional
+from app.models.document_models import BulkInsertError, BulkInsertResult, Document, DocumentCreate, DocumentPage, DocumentSummary
+from app.utils.metadata_filter import Filters, to_mongo_filter
+from app.utils.pagination import InvalidCursorError, content_preview, decode_cursor, encode_cursor
+from app.utils.retrieval import mmr_candidate_count, mmr_documents
+from app.utils.vector_ops import iter_batches, recall_multiplier
+from typing import List, Optional, Tuple, Union
 import logging
 
 
 logger = logging.getLogger(__name__)
 
+
+def to_mongo_id(doc_id: str) -> Union[ObjectId, str]:
+    """文档ID转换为_id：ObjectId格式的ID按ObjectId存储，其他（如迁移自其他后端的UUID）按字符串存储"""
+    return ObjectId(doc_id) if ObjectId.is_valid(doc_id) else doc_id
+
+
 class VectorStore:
     def __init__(self):
         self.client = None
@@ -36,6 +49,10 @@ class VectorStore:
                     "numDimensions": settings.vector_dimension,
                     "similarity": "cosine"
                 }
+            ] + [
+                # 元数据过滤字段需要在向量索引中声明为filter类型
+                {"type": "filter", "path": f"metadata.{field}"}
+                for field in settings.metadata_index_fields
             ]
         }
         
@@ -63,17 +80,69 @@ class VectorStore:
         result = self.collection.insert_one(doc_data)
         return str(result.inserted_id)
     
-    def similarity_search(self, query_embedding: List[float], top_k: int = 5) -> List[Document]:
-        """向量相似度搜索"""
+    def insert_documents(self, documents: List[DocumentCreate], embeddings, batch_size: Optional[int] = None, ids: Optional[List[str]] = None) -> BulkInsertResult:
+        """
+        批量插入文档和向量，每批一次无序的insert_many；_id在客户端批量生成
+        
+        Args:
+            ids: 指定文档ID（如去重分配的ID、迁移已有数据时保留原ID），按 to_mongo_id 映射为_id，默认自动生成
+        """
+        if len(documents) != len(embeddings):
+            raise ValueError(f"文档数 {len(documents)} 与向量数 {len(embeddings)} 不一致")
+        if ids is not None and len(ids) != len(documents):
+            raise ValueError(f"文档数 {len(documents)} 与ID数 {len(ids)} 不一致")
+
+        records = [
+            {
+                "_id": to_mongo_id(ids[i]) if ids is not None else ObjectId(),
+                "content": document.content,
+                "metadata": document.metadata or {},
+                "embedding": [float(value) for value in embedding]
+            }
+            for i, (document, embedding) in enumerate(zip(documents, embeddings))
+        ]
+        ids: List[Optional[str]] = [None] * len(records)
+        errors: List[BulkInsertError] = []
+
+        for start, batch in iter_batches(records, batch_size or settings.insert_batch_size):
+            failed = {}
+            try:
+                self.collection.insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                failed = {error["index"]: error.get("errmsg", "写入失败") for error in e.details.get("writeErrors", [])}
+            except Exception as e:
+                failed = {offset: str(e) for offset in range(len(batch))}
+
+            for offset, record in enumerate(batch):
+                if offset in failed:
+                    errors.append(BulkInsertError(index=start + offset, error=failed[offset]))
+                else:
+                    ids[start + offset] = str(record["_id"])
+
+        return BulkInsertResult(ids=ids, errors=errors)
+    
+    def similarity_search(self, query_embedding: List[float], top_k: int = 5, recall_hint: Optional[str] = None, filters: Optional[Filters] = None, mmr_lambda: Optional[float] = None, include_embeddings: bool = True) -> List[Document]:
+        """
+        向量相似度搜索，召回提示用于调整候选数量，元数据过滤在向量搜索阶段预过滤
+        mmr_lambda 不为None时多召回候选，再按返回的嵌入向量做MMR选择
+        嵌入向量随结果一起返回（include_embeddings 只为与其他后端保持接口一致）
+        """
+        final_k = top_k
+        if mmr_lambda is not None:
+            top_k = mmr_candidate_count(top_k)
+        vector_search = {
+            "index": "vector_index",
+            "path": "embedding",
+            "queryVector": query_embedding,
+            "numCandidates": max(top_k, int(top_k * 10 * recall_multiplier(recall_hint))),
+            "limit": top_k
+        }
+        if filters:
+            vector_search["filter"] = to_mongo_filter(filters)
+        
         pipeline = [
             {
-                "$vectorSearch": {
-                    "index": "vector_index",
-                    "path": "embedding",
-                    "queryVector": query_embedding,
-                    "numCandidates": top_k * 10,
-                    "limit": top_k
-                }
+                "$vectorSearch": vector_search
             },
             {
                 "$project": {
@@ -94,11 +163,140 @@ class VectorStore:
                 _id=str(result["_id"]),
                 content=result["content"],
                 metadata=result.get("metadata", {}),
-                embedding=result.get("embedding")
+                embedding=result.get("embedding"),
+                score=self._cosine_score(result.get("score", 0.0))
             )
             documents.append(doc)
         
+        if mmr_lambda is not None:
+            documents = mmr_documents(query_embedding, documents, final_k, mmr_lambda, keep_embeddings=True)
         return documents
 
+    @staticmethod
+    def _cosine_score(search_score: float) -> float:
+        """cosine索引的vectorSearchScore为 (1 + cos) / 2，换算回余弦相似度与其他后端保持一致"""
+        return 2.0 * float(search_score) - 1.0
+    
+    def batch_similarity_search(self, query_embeddings, top_k: int = 5, recall_hint: Optional[str] = None, filters: Optional[Filters] = None) -> List[List[Document]]:
+        """批量搜索（$vectorSearch每次只接受一个查询向量，逐条执行），返回每个查询带分数的文档列表"""
+        batches = []
+        for query_embedding in query_embeddings:
+            vector_search = {
+                "index": "vector_index",
+                "path": "embedding",
+                "queryVector": [float(value) for value in query_embedding],
+                "numCandidates": max(top_k, int(top_k * 10 * recall_multiplier(recall_hint))),
+                "limit": top_k
+            }
+            if filters:
+                vector_search["filter"] = to_mongo_filter(filters)
+            
+            pipeline = [
+                {"$vectorSearch": vector_search},
+                {"$project": {"_id": 1, "content": 1, "metadata": 1, "score": {"$meta": "vectorSearchScore"}}}
+            ]
+            batches.append([
+                Document(
+                    _id=str(result["_id"]),
+                    content=result["content"],
+                    metadata=result.get("metadata", {}),
+                    score=self._cosine_score(result.get("score", 0.0))
+                )
+                for result in self.collection.aggregate(pipeline)
+            ])
+        return batches
+    
+    def get_document_count(self) -> int:
+        """获取文档数量（使用集合元数据中的估计值，不扫描文档）"""
+        return self.collection.estimated_document_count()
+    
+    def get_source_file_ids(self, source_file: str) -> List[str]:
+        """获取某个来源文件的全部文档ID"""
+        return [str(doc["_id"]) for doc in self.collection.find({"metadata.source_file": source_file}, {"_id": 1})]
+    
+    def delete_documents(self, ids: List[str]) -> int:
+        """按ID删除文档，返回实际删除的数量"""
+        object_ids = [to_mongo_id(doc_id) for doc_id in ids]
+        if not object_ids:
+            return 0
+        deleted = self.collection.delete_many({"_id": {"$in": object_ids}}).deleted_count
+        logger.info(f"已删除 {deleted} 个文档")
+        return deleted
+    
+    def get_document(self, doc_id: str) -> Optional[Document]:
+        """根据ID获取文档"""
+        doc = self.collection.find_one({"_id": to_mongo_id(doc_id)}, {"embedding": 0})
+        if not doc:
+            return None
+        return Document(
+            _id=str(doc["_id"]),
+            content=doc["content"],
+            metadata=doc.get("metadata", {})
+        )
+    
+    def get_documents(self, ids: List[str], include_embeddings: bool = False) -> List[Document]:
+        """按ID批量获取文档（保持输入顺序，不存在的ID跳过）"""
+        object_ids = [to_mongo_id(doc_id) for doc_id in ids]
+        if not object_ids:
+            return []
+        found = {
+            str(doc["_id"]): Document(_id=str(doc["_id"]), content=doc["content"], metadata=doc.get("metadata", {}), embedding=doc.get("embedding"))
+            for doc in self.collection.find({"_id": {"$in": object_ids}}, None if include_embeddings else {"embedding": 0})
+        }
+        return [found[doc_id] for doc_id in ids if doc_id in found]
+    
+    def get_chunks(self, keys: List[Tuple[str, int]]) -> List[Document]:
+        """按 (来源文件, 块序号) 批量获取文档块，一次查询完成"""
+        if not keys:
+            return []
+        by_file = {}
+        for source_file, chunk_index in keys:
+            by_file.setdefault(source_file, []).append(chunk_index)
+        query = {"$or": [
+            {"metadata.source_file": source_file, "metadata.chunk_index": {"$in": indices}}
+            for source_file, indices in by_file.items()
+        ]}
+        return [
+            Document(_id=str(doc["_id"]), content=doc["content"], metadata=doc.get("metadata", {}))
+            for doc in self.collection.find(query, {"embedding": 0})
+        ]
+    
+    def list_documents(self, cursor: Optional[str] = None, limit: int = 20, preview_chars: Optional[int] = None) -> DocumentPage:
+        """
+        按_id键集分页列出文档（不返回嵌入向量），游标记录上一页最后一个_id
+        字符串_id（指定ID写入的文档）按BSON类型顺序排在ObjectId之前，游标为字符串时之后还要接着列出全部ObjectId
+        """
+        preview_chars = preview_chars or settings.document_preview_chars
+        position = decode_cursor(cursor)
+        query = {}
+        if "after" in position:
+            after = position["after"]
+            if not isinstance(after, str):
+                raise InvalidCursorError(f"无效的分页游标: {cursor}")
+            if position.get("string"):
+                query = {"$or": [{"_id": {"$gt": after}}, {"_id": {"$type": "objectId"}}]}
+            else:
+                try:
+                    query = {"_id": {"$gt": ObjectId(after)}}
+                except InvalidId:
+                    raise InvalidCursorError(f"无效的分页游标: {cursor}")
+        
+        # 多取一条用于判断是否还有下一页
+        docs = list(self.collection.find(query, {"embedding": 0}).sort("_id", pymongo.ASCENDING).limit(limit + 1))
+        items = [
+            DocumentSummary(
+                id=str(doc["_id"]),
+                metadata=doc.get("metadata", {}),
+                content_preview=content_preview(doc["content"], preview_chars),
+                content_length=len(doc["content"])
+            )
+            for doc in docs[:limit]
+        ]
+        next_cursor = None
+        if len(docs) > limit:
+            last_id = docs[limit - 1]["_id"]
+            next_cursor = encode_cursor({"after": str(last_id), "string": isinstance(last_id, str)})
+        return DocumentPage(items=items, next_cursor=next_cursor, total=self.get_document_count())
+
 # 全局向量存储实例
 vector_store = VectorStore()
\ No newline at end of file
@@ -0,0 +1,272 @@
+from app.config.settings import settings
+from app.models.document_models import DocumentCreate
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import json
+import logging
+import os
+import re
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只能依赖单写入进程
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# MinHash使用的梅森素数，哈希值小于2^32时 a*x+b 不会溢出uint64
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+_ROLLING_BASE = np.uint64(1000003)
+
+
+class NearDuplicateIndex:
+    """
+    基于MinHash/LSH的近重复文本块检测
+    每个块取字符n-gram（对中文同样有效）计算MinHash签名，签名分成若干band，
+    任一band完全相同的块成为候选，再用签名估计的Jaccard相似度确认；
+    签名和链接关系持久化到npz文件，LSH表在加载时由签名重建，跨多次增量加载持续去重；
+    文档删除只在文件锁下向删除日志追加一行，加载时应用，保存时合并进npz后清空，
+    因此删除不需要重写整个状态文件，正在运行的加载脚本保存时也不会把已删除的块写回
+    """
+
+    SEED = 1
+    REMOVED_SUFFIX = ".removed"
+    LOCK_SUFFIX = ".lock"
+
+    def __init__(self, path: Optional[str] = None, num_perm: Optional[int] = None, bands: Optional[int] = None,
+                 threshold: Optional[float] = None, shingle_size: Optional[int] = None):
+        self.path = settings.dedup_state_path if path is None else path
+        self.num_perm = num_perm or settings.dedup_num_perm
+        self.bands = bands or settings.dedup_bands
+        self.threshold = settings.dedup_threshold if threshold is None else threshold
+        self.shingle_size = shingle_size or settings.dedup_shingle_size
+        if self.num_perm % self.bands:
+            raise ValueError(f"MinHash排列数 {self.num_perm} 必须是band数 {self.bands} 的整数倍")
+        self.rows = self.num_perm // self.bands
+
+        rng = np.random.default_rng(self.SEED)
+        self._a = rng.integers(1, int(_MERSENNE_PRIME), size=self.num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_MERSENNE_PRIME), size=self.num_perm, dtype=np.uint64)
+        self._band_multipliers = rng.integers(1, 1 << 62, size=self.rows, dtype=np.uint64) | np.uint64(1)
+
+        self._ids: List[str] = []
+        self._signatures = np.empty((0, self.num_perm), dtype=np.uint32)
+        self._alive = np.empty(0, dtype=bool)
+        self._id_to_row: Dict[str, int] = {}
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(self.bands)]
+        self._links: Dict[str, List[Dict[str, Any]]] = {}
+
+        self._load()
+
+    # ---- 签名 ----
+
+    def _shingle_hashes(self, text: str) -> np.ndarray:
+        """字符n-gram的32位哈希（去重后），用向量化的多项式滚动哈希计算"""
+        normalized = re.sub(r"\s+", " ", text.lower()).strip()
+        codes = np.frombuffer(normalized.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        if len(codes) == 0:
+            return np.zeros(1, dtype=np.uint64)
+
+        k = min(self.shingle_size, len(codes))
+        hashes = np.zeros(len(codes) - k + 1, dtype=np.uint64)
+        for j in range(k):
+            hashes = hashes * _ROLLING_BASE + codes[j:len(codes) - k + 1 + j]
+        return np.unique((hashes ^ (hashes >> np.uint64(32))) & np.uint64(0xFFFFFFFF))
+
+    def signature(self, text: str) -> np.ndarray:
+        """计算文本的MinHash签名"""
+        hashes = self._shingle_hashes(text)
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % _MERSENNE_PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """每个签名每个band的64位键，形状为 (签名数, band数)"""
+        bands = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        with np.errstate(over="ignore"):
+            return (bands * self._band_multipliers).sum(axis=2, dtype=np.uint64)
+
+    # ---- 查询与更新 ----
+
+    def find_duplicate(self, signature: np.ndarray) -> Optional[Tuple[str, float]]:
+        """查找与签名近重复的已有块，返回 (块ID, 估计的Jaccard相似度)，没有时返回None"""
+        keys = self._band_keys(signature[None, :])[0].tolist()
+        candidates = set()
+        for table, key in zip(self._tables, keys):
+            candidates.update(table.get(key, ()))
+        if not candidates:
+            return None
+
+        rows = np.fromiter(candidates, dtype=np.int64)
+        rows = rows[self._alive[rows]]
+        if len(rows) == 0:
+            return None
+        similarities = (self._signatures[rows] == signature).mean(axis=1)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        return self._ids[rows[best]], float(similarities[best])
+
+    def add(self, doc_id: str, signature: np.ndarray):
+        """登记一个已入库的块"""
+        row = len(self._ids)
+        if row == len(self._signatures):
+            # 倍增扩容，保证逐个登记的均摊成本
+            capacity = max(1024, row * 2)
+            self._signatures = np.resize(self._signatures, (capacity, self.num_perm))
+            self._alive = np.concatenate([self._alive[:row], np.zeros(capacity - row, dtype=bool)])
+        self._ids.append(doc_id)
+        self._id_to_row[doc_id] = row
+        self._signatures[row] = signature
+        self._alive[row] = True
+        for table, key in zip(self._tables, self._band_keys(signature[None, :])[0].tolist()):
+            table.setdefault(key, []).append(row)
+
+    def remove(self, doc_ids: Sequence[str]):
+        """将块标记为已删除（如写入失败或文档被删除），之后不再作为重复的原件"""
+        for doc_id in doc_ids:
+            row = self._id_to_row.get(doc_id)
+            if row is not None:
+                self._alive[row] = False
+            self._links.pop(doc_id, None)
+
+    def get_links(self, doc_id: str) -> List[Dict[str, Any]]:
+        """获取链接到某个原件块的近重复块来源"""
+        return list(self._links.get(doc_id, []))
+
+    def filter_duplicates(self, documents: List[DocumentCreate]) -> Tuple[List[DocumentCreate], List[str], Dict[str, Any]]:
+        """
+        过滤一批待入库的块：与已入库块或本批中之前的块近重复的块被跳过，
+        其来源（元数据）链接到原件块ID；保留的块预先分配ID并登记到索引
+
+        Returns:
+            (保留的文档, 对应的ID, 去重报告)
+        """
+        kept, kept_ids = [], []
+        duplicates = saved_chars = 0
+        for document in documents:
+            signature = self.signature(document.content)
+            match = self.find_duplicate(signature)
+            if match is not None:
+                canonical_id, similarity = match
+                self._links.setdefault(canonical_id, []).append({**(document.metadata or {}), "similarity": round(similarity, 4)})
+                duplicates += 1
+                saved_chars += len(document.content)
+                continue
+
+            doc_id = str(uuid.uuid4())
+            self.add(doc_id, signature)
+            kept.append(document)
+            kept_ids.append(doc_id)
+
+        report = {
+            "checked": len(documents),
+            "kept": len(kept),
+            "duplicates": duplicates,
+            "saved_chars": saved_chars,
+            "duplicate_ratio": round(duplicates / len(documents), 4) if documents else 0.0,
+        }
+        return kept, kept_ids, report
+
+    # ---- 持久化 ----
+
+    def save(self):
+        """先应用加载之后其他进程记录的删除，再将签名、存活标记和链接关系原子写入npz文件并清空删除日志"""
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        lock_handle = _acquire_file_lock(self.path)
+        try:
+            self.remove(_read_removed(self.path))
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    ids=np.array(self._ids, dtype=str),
+                    signatures=self._signatures[:len(self._ids)],
+                    alive=self._alive[:len(self._ids)],
+                    links=np.array(json.dumps(self._links, ensure_ascii=False)),
+                    params=np.array([self.num_perm, self.bands, self.shingle_size, self.SEED], dtype=np.int64)
+                )
+            os.replace(tmp_path, self.path)
+            removed_path = self.path + self.REMOVED_SUFFIX
+            if os.path.exists(removed_path):
+                os.truncate(removed_path, 0)
+        finally:
+            lock_handle.close()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as state:
+                params = state["params"].tolist()
+                if params != [self.num_perm, self.bands, self.shingle_size, self.SEED]:
+                    logger.warning(f"去重状态的参数 {params} 与当前配置不一致，将重新开始去重")
+                    return
+                self._ids = state["ids"].tolist()
+                self._signatures = state["signatures"].astype(np.uint32)
+                self._alive = state["alive"].astype(bool)
+                self._links = json.loads(str(state["links"]))
+        except Exception as e:
+            logger.error(f"加载去重状态失败，将重新开始去重: {e}")
+            return
+
+        self._id_to_row = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        if len(self._ids):
+            for band, keys in enumerate(self._band_keys(self._signatures).T.tolist()):
+                table = self._tables[band]
+                for row, key in enumerate(keys):
+                    table.setdefault(key, []).append(row)
+        self.remove(_read_removed(self.path))
+        logger.info(f"已加载去重状态，登记的块数: {len(self._ids)}")
+
+    def get_stats(self) -> dict:
+        """获取去重索引状态"""
+        return {
+            "chunks": int(self._alive[:len(self._ids)].sum()),
+            "removed": int(len(self._ids) - self._alive[:len(self._ids)].sum()),
+            "linked_duplicates": sum(len(links) for links in self._links.values()),
+            "num_perm": self.num_perm,
+            "bands": self.bands,
+            "threshold": self.threshold,
+        }
+
+
+def _acquire_file_lock(path: str):
+    handle = open(path + NearDuplicateIndex.LOCK_SUFFIX, "a")
+    if fcntl is not None:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+    return handle
+
+
+def _read_removed(path: str) -> List[str]:
+    """读取删除日志中记录的全部块ID"""
+    removed_path = path + NearDuplicateIndex.REMOVED_SUFFIX
+    if not os.path.exists(removed_path):
+        return []
+    with open(removed_path, "r", encoding="utf-8") as f:
+        # 只取完整的行，写入中断留下的半行忽略
+        return [doc_id for line in f if line.endswith("\n") for doc_id in json.loads(line)]
+
+
+def forget_documents(doc_ids: Sequence[str], path: Optional[str] = None):
+    """
+    文档被删除后将其移出去重状态，之后再次加载相同内容时不会被当作重复跳过
+    只在文件锁下向删除日志追加一行，由下次加载或保存去重状态时应用
+    """
+    path = settings.dedup_state_path if path is None else path
+    if not settings.dedup_enabled or not path or not doc_ids:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    lock_handle = _acquire_file_lock(path)
+    try:
+        with open(path + NearDuplicateIndex.REMOVED_SUFFIX, "a", encoding="utf-8") as f:
+            f.write(json.dumps(list(doc_ids), ensure_ascii=False) + "\n")
+    finally:
+        lock_handle.close()
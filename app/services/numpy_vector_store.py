@@ -0,0 +1,739 @@
+from app.config.settings import settings
+from app.services.content_store import ContentStore
+from app.models.document_models import BulkInsertError, BulkInsertResult, Document, DocumentCreate, DocumentPage, DocumentSummary
+from app.utils.metadata_filter import Filters, MetadataIndex
+from app.utils.pagination import content_preview, cursor_index, decode_cursor, encode_cursor
+from app.utils.retrieval import mmr_candidate_count
+from app.utils.vector_ops import as_float32_matrix, fit_dimension, iter_batches, mmr_select, normalize_rows, prepare_query, top_k_indices
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只能依赖单写入进程
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class IndexState:
+    """
+    一个generation（两次压缩之间）的索引内存状态：向量映射、文档记录、墓碑、正文存储，以及子类的索引结构
+    追加和删除在同一对象上原地进行（只追加新行、只把行标记为删除）；压缩后由新文件构建新的对象，
+    在 _lock 下一次赋值替换，查询在调用开始时取得当前状态，整个调用都只读取这一个对象
+    """
+
+    def __init__(self, index_path: str, generation: int = 0):
+        self.generation = generation
+        self.meta_mtime = None
+        self.vectors: Optional[np.ndarray] = None
+        self.writable = False
+        self.capacity = 0
+        self.count = 0
+        self.documents_offset = 0
+        self.deleted = np.zeros(0, dtype=bool)
+        self.deleted_count = 0
+
+        self.ids: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.id_to_row: Dict[str, int] = {}
+        # (来源文件, 块序号) → 按写入顺序的全部行号，用于查询时取相邻块；
+        # 同一位置重新写入（或替换失败回滚）后，取其中最新的未删除行
+        self.chunk_rows: Dict[Tuple[str, int], List[int]] = {}
+        self.metadata_index = MetadataIndex(settings.metadata_index_fields)
+        self.content = ContentStore(index_path)
+
+    def add_record(self, doc_id: str, metadata: Dict[str, Any]):
+        row = len(self.ids)
+        self.id_to_row[doc_id] = row
+        self.ids.append(doc_id)
+        self.metadatas.append(metadata)
+        self.metadata_index.add(row, metadata)
+        if "source_file" in metadata and "chunk_index" in metadata:
+            self.chunk_rows.setdefault((metadata["source_file"], metadata["chunk_index"]), []).append(row)
+
+    def reserve_deleted(self, required: int):
+        if required > len(self.deleted):
+            deleted = np.zeros(max(NumpyVectorStore.INITIAL_CAPACITY, len(self.deleted) * 2, required), dtype=bool)
+            deleted[:len(self.deleted)] = self.deleted
+            self.deleted = deleted
+
+    def is_live(self, row: Optional[int]) -> bool:
+        return row is not None and row < self.count and not self.deleted[row]
+
+    def latest_live(self, rows: List[int]) -> Optional[int]:
+        """同一位置的多个行中最新的未删除行"""
+        for row in reversed(rows):
+            if self.is_live(row):
+                return row
+        return None
+
+    def live(self, rows: np.ndarray) -> np.ndarray:
+        """去掉已删除的行"""
+        return rows[~self.deleted[rows]] if self.deleted_count else rows
+
+    def live_hits(self, rows: np.ndarray, scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """去掉结果中已删除的行，保留前top_k个"""
+        if self.deleted_count and len(rows):
+            live = ~self.deleted[rows]
+            rows, scores = rows[live], scores[live]
+        return rows[:top_k], scores[:top_k]
+
+
+class NumpyVectorStore:
+    """
+    进程内的NumPy平面索引
+    归一化向量保存在只追加的内存映射 .npy 文件中，一次矩阵-向量乘法 + argpartition 得到精确 top-k
+    多个worker进程以只读方式映射同一文件，共享操作系统页缓存
+    文档正文单独保存在压缩的内容存储中，只在需要时（如最终的top-k结果）按行批量读取
+    删除只追加墓碑（被删除的行号）并立即从查询结果中排除，删除比例较高时由后台压缩重写全部文件
+    """
+
+    VECTORS_FILE = "vectors.npy"
+    DOCUMENTS_FILE = "documents.jsonl"
+    META_FILE = "meta.json"
+    LOCK_FILE = "write.lock"
+    TOMBSTONES_FILE = "tombstones.bin"
+    COMPACT_DIR = "compact.tmp"
+    INITIAL_CAPACITY = 1024
+    # 批量搜索时每块查询的得分矩阵元素上限（float32，约64MB）
+    BATCH_SCORE_ELEMENTS = 1 << 24
+    # 为True时批量搜索用一次矩阵乘法精确打分；近似索引子类逐条调用 _search_rows
+    EXACT_BATCH_SEARCH = True
+    # 子类可扩展状态类，加入自己的索引结构
+    STATE_CLASS = IndexState
+
+    def __init__(self, index_path: Optional[str] = None, dimension: Optional[int] = None):
+        self.index_path = index_path or settings.numpy_index_path
+        self.dimension = dimension or settings.vector_dimension
+
+        self._lock = threading.RLock()
+        # 写入和压缩互斥；压缩复制数据期间不持有 _lock，查询不受阻塞
+        self._write_lock = threading.RLock()
+        self._compacting = False
+        self._state = self._new_state(0)
+
+        os.makedirs(self.index_path, exist_ok=True)
+        self._migrate_inline_contents()
+        self._refresh()
+        logger.info(f"NumPy向量存储初始化成功，存储路径: {self.index_path}，文档数: {self._state.count}")
+
+    # ---- 文件路径 ----
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.index_path, name)
+
+    # ---- 加载与刷新 ----
+
+    def _new_state(self, generation: int) -> IndexState:
+        return self.STATE_CLASS(self.index_path, generation)
+
+    def _read_meta(self) -> Dict[str, Any]:
+        with open(self._path(self.META_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self, state: IndexState):
+        """原子写入元数据；元数据中的count是写入的提交点"""
+        meta = {
+            "count": state.count,
+            "capacity": state.capacity,
+            "dimension": self.dimension,
+            "deleted": state.deleted_count,
+            "generation": state.generation,
+        }
+        tmp_path = self._path(self.META_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._path(self.META_FILE))
+        state.meta_mtime = os.path.getmtime(self._path(self.META_FILE))
+
+    def _open_vectors(self, state: IndexState, writable: bool = False):
+        mode = "r+" if writable else "r"
+        state.vectors = np.load(self._path(self.VECTORS_FILE), mmap_mode=mode)
+        state.capacity = state.vectors.shape[0]
+        state.writable = writable
+
+    def _refresh(self) -> IndexState:
+        """
+        其他进程追加数据后，重新读取元数据、映射新文件并读取新增的文档记录，返回当前状态
+        首次加载或generation变化（其他进程完成了压缩，全部文件已被替换）时由新文件构建新的状态再整体替换
+        """
+        state = self._state
+        meta_path = self._path(self.META_FILE)
+        if not os.path.exists(meta_path):
+            return state
+
+        mtime = os.path.getmtime(meta_path)
+        if mtime == state.meta_mtime:
+            return state
+
+        with self._lock:
+            state = self._state
+            meta = self._read_meta()
+            if meta["dimension"] != self.dimension:
+                raise ValueError(f"索引维度 {meta['dimension']} 与配置的维度 {self.dimension} 不一致")
+
+            if state.meta_mtime is None or meta.get("generation", 0) != state.generation:
+                if state.meta_mtime is not None:
+                    logger.info(f"检测到索引已压缩，重新加载: {self.index_path}")
+                state = self._load_state(meta, mtime)
+                self._state = state
+            else:
+                if state.vectors is None or meta["capacity"] != state.capacity:
+                    self._open_vectors(state, state.writable)
+                previous_count = state.count
+                self._read_rows(state, meta)
+                state.meta_mtime = mtime
+                if state.count > previous_count:
+                    self._on_rows_appended(state, previous_count, state.count)
+        self._on_refresh()
+        return state
+
+    def _load_state(self, meta: Dict[str, Any], mtime: float) -> IndexState:
+        """由磁盘文件构建一个新的状态对象（不修改正在使用的状态）"""
+        state = self._new_state(meta.get("generation", 0))
+        self._open_vectors(state)
+        self._read_rows(state, meta)
+        state.meta_mtime = mtime
+        self._load_index(state)
+        return state
+
+    def _read_rows(self, state: IndexState, meta: Dict[str, Any]):
+        """读取到元数据提交的行数和墓碑数为止"""
+        self._read_documents(state, meta["count"])
+        state.content.refresh(meta["count"])
+        state.count = meta["count"]
+        self._read_tombstones(state, meta.get("deleted", 0))
+
+    def _read_documents(self, state: IndexState, count: int):
+        """从上次读取的位置继续读取文档记录，直到达到count条"""
+        with open(self._path(self.DOCUMENTS_FILE), "rb") as f:
+            f.seek(state.documents_offset)
+            while len(state.ids) < count:
+                line = f.readline()
+                if not line:
+                    break
+                record = json.loads(line)
+                state.add_record(record["id"], record.get("metadata") or {})
+            state.documents_offset = f.tell()
+
+    def _read_tombstones(self, state: IndexState, count: int):
+        """读取其他进程追加的墓碑，直到count条"""
+        state.reserve_deleted(state.count)
+        if count <= state.deleted_count:
+            return
+        with open(self._path(self.TOMBSTONES_FILE), "rb") as f:
+            f.seek(state.deleted_count * 8)
+            rows = np.frombuffer(f.read((count - state.deleted_count) * 8), dtype="<i8")
+        state.deleted[rows] = True
+        state.deleted_count += len(rows)
+
+    def _migrate_inline_contents(self):
+        """旧格式的 documents.jsonl 中直接包含正文，首次打开时将正文迁移到内容存储并重写文档记录"""
+        documents_path = self._path(self.DOCUMENTS_FILE)
+        content = self._state.content
+        if content.exists() or not os.path.exists(self._path(self.META_FILE)) or self._read_meta()["count"] == 0:
+            return
+
+        lock_handle = self._acquire_file_lock()
+        try:
+            if content.exists():
+                return
+            count = self._read_meta()["count"]
+            records = []
+            with open(documents_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if len(records) >= count:
+                        break
+                    records.append(json.loads(line))
+
+            content.append([record.get("content", "") for record in records], 0)
+            tmp_path = self._path(self.DOCUMENTS_FILE + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps({"id": record["id"], "metadata": record.get("metadata") or {}}, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, documents_path)
+            logger.info(f"已将 {len(records)} 个文档的正文迁移到压缩内容存储: {self.index_path}")
+        finally:
+            lock_handle.close()
+
+    # ---- 写入 ----
+
+    def _acquire_file_lock(self):
+        handle = open(self._path(self.LOCK_FILE), "a")
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def _ensure_capacity(self, state: IndexState, required: int):
+        """容量不足时以倍增方式创建新文件并原子替换，保证追加的均摊成本"""
+        if state.vectors is not None and required <= state.capacity:
+            if not state.writable:
+                self._open_vectors(state, writable=True)
+            return
+
+        new_capacity = max(self.INITIAL_CAPACITY, state.capacity * 2, required)
+        tmp_path = self._path(self.VECTORS_FILE + ".tmp")
+        new_vectors = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=np.float32, shape=(new_capacity, self.dimension)
+        )
+        if state.count:
+            new_vectors[:state.count] = state.vectors[:state.count]
+        new_vectors.flush()
+        del new_vectors
+
+        os.replace(tmp_path, self._path(self.VECTORS_FILE))
+        self._open_vectors(state, writable=True)
+        logger.info(f"向量文件扩容至 {new_capacity} 行")
+
+    def _append(self, documents: List[DocumentCreate], embeddings: np.ndarray, ids: Optional[List[str]] = None) -> List[str]:
+        """追加一批文档：先写文档记录和向量，最后更新元数据作为提交"""
+        embeddings = normalize_rows(fit_dimension(as_float32_matrix(embeddings), self.dimension).copy())
+        ids = ids or [str(uuid.uuid4()) for _ in documents]
+
+        with self._write_lock, self._lock:
+            lock_handle = self._acquire_file_lock()
+            try:
+                state = self._refresh()
+                start = state.count
+                self._ensure_capacity(state, start + len(documents))
+
+                # 丢弃上次未提交（写入中断）的文档记录
+                documents_path = self._path(self.DOCUMENTS_FILE)
+                if os.path.exists(documents_path) and os.path.getsize(documents_path) > state.documents_offset:
+                    os.truncate(documents_path, state.documents_offset)
+
+                with open(documents_path, "a", encoding="utf-8") as f:
+                    for doc_id, document in zip(ids, documents):
+                        record = {"id": doc_id, "metadata": document.metadata or {}}
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                state.content.append([document.content for document in documents], start)
+
+                state.vectors[start:start + len(documents)] = embeddings
+                state.vectors.flush()
+
+                for doc_id, document in zip(ids, documents):
+                    state.add_record(doc_id, document.metadata or {})
+                state.documents_offset = os.path.getsize(documents_path)
+
+                state.count = start + len(documents)
+                state.reserve_deleted(state.count)
+                self._write_meta(state)
+                self._on_rows_appended(state, start, state.count)
+            finally:
+                lock_handle.close()
+
+        return ids
+
+    # ---- 子类扩展点 ----
+
+    def _load_index(self, state: IndexState):
+        """构建新状态时调用，供近似索引加载（或为全部行构建）自己的索引结构"""
+
+    def _on_rows_appended(self, state: IndexState, start: int, end: int):
+        """新行 [start, end) 写入（或从其他进程读到）后调用，供近似索引增量更新"""
+
+    def _on_refresh(self):
+        """从磁盘刷新之后调用"""
+
+    def _search_rows(self, state: IndexState, query: np.ndarray, top_k: int, recall_hint: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """返回 (行号, 分数)，默认为精确的暴力搜索，忽略召回提示"""
+        scores = state.vectors[:state.count] @ query
+        rows = top_k_indices(scores, top_k)
+        return rows, scores[rows]
+
+    def _search_candidates(self, state: IndexState, query: np.ndarray, top_k: int, candidates: np.ndarray, recall_hint: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """在元数据过滤得到的候选行中搜索，默认对候选行精确打分"""
+        scores = state.vectors[candidates] @ query
+        best = top_k_indices(scores, top_k)
+        return candidates[best], scores[best]
+
+    def _deleted_padding(self, state: IndexState, top_k: int) -> int:
+        """有墓碑时多取的结果数，用于补足被过滤掉的已删除行"""
+        return min(state.deleted_count, max(top_k, 32))
+
+    def _search_live_rows(self, state: IndexState, query: np.ndarray, top_k: int, recall_hint: Optional[str] = None, **search_params) -> Tuple[np.ndarray, np.ndarray]:
+        """无过滤条件的搜索：多取若干结果后去掉已删除的行，仍不足top_k时在全部存活行中搜索"""
+        padding = self._deleted_padding(state, top_k)
+        rows, scores = state.live_hits(*self._search_rows(state, query, top_k + padding, recall_hint, **search_params), top_k)
+        live_count = state.count - state.deleted_count
+        if padding and len(rows) < min(top_k, live_count):
+            rows, scores = self._search_candidates(state, query, top_k, state.live(np.arange(state.count)), recall_hint)
+        return rows, scores
+
+    def _search_rows_batch(self, state: IndexState, queries: np.ndarray, top_k: int, recall_hint: Optional[str] = None, candidates: Optional[np.ndarray] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """批量搜索，返回每个查询的 (行号, 分数)；candidates为元数据过滤得到的候选行"""
+        if not self.EXACT_BATCH_SEARCH:
+            if candidates is None:
+                return [self._search_live_rows(state, query, top_k, recall_hint) for query in queries]
+            return [self._search_candidates(state, query, top_k, candidates, recall_hint) for query in queries]
+
+        if candidates is None and state.deleted_count:
+            candidates = state.live(np.arange(state.count))
+
+        matrix = state.vectors[:state.count] if candidates is None else state.vectors[candidates]
+        block_size = max(1, self.BATCH_SCORE_ELEMENTS // max(1, matrix.shape[0]))
+        hits = []
+        for start in range(0, len(queries), block_size):
+            # 一块查询与全部向量一次矩阵乘法
+            block_scores = queries[start:start + block_size] @ matrix.T
+            for scores in block_scores:
+                best = top_k_indices(scores, top_k)
+                rows = best if candidates is None else candidates[best]
+                hits.append((rows, scores[best]))
+        return hits
+
+    # ---- 公共接口 ----
+
+    def insert_document(self, document: DocumentCreate, embedding: List[float]) -> str:
+        """插入文档和向量"""
+        try:
+            doc_id = self._append([document], as_float32_matrix(embedding))[0]
+            logger.debug(f"文档插入成功: {doc_id}")
+            return doc_id
+        except Exception as e:
+            logger.error(f"插入文档失败: {e}")
+            raise
+
+    def insert_documents(self, documents: List[DocumentCreate], embeddings, batch_size: Optional[int] = None, ids: Optional[List[str]] = None) -> BulkInsertResult:
+        """
+        批量插入文档和向量，每批只做一次追加和一次元数据提交；包含非有限值的向量作为单项错误跳过
+
+        Args:
+            ids: 指定文档ID（如迁移已有数据时保留原ID），默认自动生成
+        """
+        embeddings = as_float32_matrix(embeddings)
+        if len(documents) != embeddings.shape[0]:
+            raise ValueError(f"文档数 {len(documents)} 与向量数 {embeddings.shape[0]} 不一致")
+
+        inserted_ids: List[Optional[str]] = [None] * len(documents)
+        valid = np.isfinite(embeddings).all(axis=1)
+        errors = [BulkInsertError(index=i, error="向量包含非有限值") for i in np.flatnonzero(~valid).tolist()]
+
+        for _, batch in iter_batches(np.flatnonzero(valid).tolist(), batch_size or settings.insert_batch_size):
+            try:
+                batch_ids = self._append([documents[i] for i in batch], embeddings[batch], [ids[i] for i in batch] if ids else None)
+                for i, doc_id in zip(batch, batch_ids):
+                    inserted_ids[i] = doc_id
+            except Exception as e:
+                logger.error(f"批量插入失败（批次大小 {len(batch)}）: {e}")
+                errors.extend(BulkInsertError(index=i, error=str(e)) for i in batch)
+
+        errors.sort(key=lambda error: error.index)
+        logger.info(f"批量插入完成: 成功 {len(documents) - len(errors)}，失败 {len(errors)}")
+        return BulkInsertResult(ids=inserted_ids, errors=errors)
+
+    def similarity_search(
+        self,
+        query_embedding: List[float],
+        top_k: int = 5,
+        recall_hint: Optional[str] = None,
+        filters: Optional[Filters] = None,
+        mmr_lambda: Optional[float] = None,
+        include_embeddings: bool = False,
+        **search_params
+    ) -> List[Document]:
+        """
+        向量相似度搜索
+
+        Args:
+            recall_hint: 召回/延迟提示（fast / balanced / accurate），由近似索引解释
+            filters: 元数据过滤条件，先由元数据索引得到候选行再做向量打分
+            mmr_lambda: 不为None时先召回更多候选，再用最大边际相关选择 top_k 个（越小越偏向多样性）
+            include_embeddings: 是否在结果中返回嵌入向量
+            search_params: 后端特有的搜索参数（如IVF的nprobe）
+        """
+        try:
+            state = self._refresh()
+            if state.count == state.deleted_count:
+                return []
+
+            final_k = top_k
+            if mmr_lambda is not None:
+                top_k = mmr_candidate_count(top_k)
+            query = prepare_query(query_embedding, self.dimension)
+            if filters:
+                with self._lock:
+                    candidates = state.live(state.metadata_index.candidate_rows(filters))
+                if len(candidates) == 0:
+                    return []
+                rows, scores = self._search_candidates(state, query, top_k, candidates, recall_hint)
+            else:
+                rows, scores = self._search_live_rows(state, query, top_k, recall_hint, **search_params)
+
+            if mmr_lambda is not None:
+                # 候选向量直接从内存映射矩阵读取
+                selected = mmr_select(query, np.asarray(state.vectors[rows], dtype=np.float32), final_k, mmr_lambda)
+                rows, scores = rows[selected], scores[selected]
+
+            documents = self._to_documents(state, rows, scores, include_embeddings)
+
+            logger.info(f"相似度搜索完成，找到 {len(documents)} 个文档")
+            return documents
+        except Exception as e:
+            logger.error(f"相似度搜索失败: {e}")
+            return []
+
+    def batch_similarity_search(self, query_embeddings, top_k: int = 5, recall_hint: Optional[str] = None, filters: Optional[Filters] = None) -> List[List[Document]]:
+        """多个查询向量一次搜索，返回每个查询带分数的文档列表"""
+        state = self._refresh()
+        queries = normalize_rows(fit_dimension(as_float32_matrix(query_embeddings), self.dimension).copy())
+        if state.count == state.deleted_count or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+
+        candidates = None
+        if filters:
+            with self._lock:
+                candidates = state.live(state.metadata_index.candidate_rows(filters))
+            if len(candidates) == 0:
+                return [[] for _ in range(len(queries))]
+
+        hits = self._search_rows_batch(state, queries, top_k, recall_hint, candidates)
+        logger.info(f"批量相似度搜索完成，查询数: {len(queries)}")
+        # 所有查询的结果行一次批量读取正文，再按查询拆分
+        documents = self._to_documents(
+            state,
+            np.concatenate([rows for rows, _ in hits]).astype(np.int64),
+            np.concatenate([scores for _, scores in hits])
+        )
+        results, start = [], 0
+        for rows, _ in hits:
+            results.append(documents[start:start + len(rows)])
+            start += len(rows)
+        return results
+
+    def _to_documents(self, state: IndexState, rows, scores=None, include_embeddings: bool = False) -> List[Document]:
+        """将行号转换为文档，正文从内容存储批量读取"""
+        rows = [int(row) for row in rows]
+        contents = state.content.get_many(rows)
+        embeddings = state.vectors[rows].tolist() if include_embeddings and rows else None
+        return [
+            Document(
+                id=state.ids[row],
+                content=content,
+                metadata=state.metadatas[row],
+                embedding=embeddings[i] if embeddings else None,  # 默认不返回嵌入向量以节省带宽
+                score=float(scores[i]) if scores is not None else None
+            )
+            for i, (row, content) in enumerate(zip(rows, contents))
+        ]
+
+    def get_document_count(self) -> int:
+        """获取文档数量"""
+        state = self._refresh()
+        return state.count - state.deleted_count
+
+    def commit_point(self) -> Tuple[int, int, int]:
+        """已提交的 (generation, 行数, 墓碑数)：任何进程的写入、删除或压缩都会改变它"""
+        state = self._refresh()
+        return state.generation, state.count, state.deleted_count
+
+    def get_document(self, doc_id: str) -> Optional[Document]:
+        """根据ID获取文档"""
+        state = self._refresh()
+        row = state.id_to_row.get(doc_id)
+        if not state.is_live(row):
+            return None
+        return self._to_documents(state, [row])[0]
+
+    def get_documents(self, ids: List[str], include_embeddings: bool = False) -> List[Document]:
+        """按ID批量获取文档（保持输入顺序，不存在或已删除的ID跳过），正文一次批量读取"""
+        state = self._refresh()
+        rows = [state.id_to_row.get(doc_id) for doc_id in ids]
+        return self._to_documents(state, [row for row in rows if state.is_live(row)], include_embeddings=include_embeddings)
+
+    def get_chunks(self, keys: List[Tuple[str, int]]) -> List[Document]:
+        """按 (来源文件, 块序号) 批量获取文档块（不存在或已删除的跳过），正文一次批量读取"""
+        state = self._refresh()
+        with self._lock:
+            rows = [state.latest_live(state.chunk_rows.get((source_file, chunk_index), ())) for source_file, chunk_index in keys]
+        return self._to_documents(state, [row for row in rows if row is not None])
+
+    def _live_rows_from(self, state: IndexState, start: int, limit: int) -> Tuple[np.ndarray, int]:
+        """从start行开始最多取limit个未删除的行，返回 (行号, 下一个起始行)"""
+        count = state.count
+        end = min(start + limit, count)
+        rows = state.live(np.arange(start, end))
+        while len(rows) < limit and end < count:
+            next_end = min(end + limit, count)
+            rows = np.concatenate([rows, state.live(np.arange(end, next_end))])
+            end = next_end
+        if len(rows) > limit:
+            end = int(rows[limit])
+            rows = rows[:limit]
+        return rows, end
+
+    def list_documents(self, cursor: Optional[str] = None, limit: int = 20, preview_chars: Optional[int] = None) -> DocumentPage:
+        """按插入顺序分页列出文档（跳过已删除的行），游标记录下一页的起始行"""
+        state = self._refresh()
+        preview_chars = preview_chars or settings.document_preview_chars
+        start = cursor_index(decode_cursor(cursor), "row", cursor)
+        rows, end = self._live_rows_from(state, start, limit)
+
+        contents = state.content.get_many(rows)
+        items = [
+            DocumentSummary(
+                id=state.ids[row],
+                metadata=state.metadatas[row],
+                content_preview=content_preview(content, preview_chars),
+                content_length=len(content)
+            )
+            for row, content in zip(rows.tolist(), contents)
+        ]
+        next_cursor = encode_cursor({"row": end}) if end < state.count else None
+        return DocumentPage(items=items, next_cursor=next_cursor, total=state.count - state.deleted_count)
+
+    def iter_records(self, batch_size: Optional[int] = None) -> Iterator[Tuple[List[str], List[DocumentCreate], np.ndarray]]:
+        """按批遍历全部未删除的文档及其向量，返回 (ID列表, 文档列表, 向量矩阵)，用于迁移、导出和压缩"""
+        state = self._refresh()
+        batch_size = batch_size or settings.insert_batch_size
+        count = state.count
+        for start in range(0, count, batch_size):
+            rows = state.live(np.arange(start, min(start + batch_size, count)))
+            if len(rows) == 0:
+                continue
+            contents = state.content.get_many(rows)
+            documents = [
+                DocumentCreate(content=content, metadata=state.metadatas[row])
+                for row, content in zip(rows.tolist(), contents)
+            ]
+            yield [state.ids[row] for row in rows.tolist()], documents, np.array(state.vectors[rows])
+
+    def get_all_documents(self, limit: int = 10) -> List[Document]:
+        """获取所有文档（用于调试）"""
+        state = self._refresh()
+        return self._to_documents(state, self._live_rows_from(state, 0, limit)[0])
+
+    # ---- 删除与压缩 ----
+
+    def get_source_file_ids(self, source_file: str) -> List[str]:
+        """获取某个来源文件的全部未删除文档ID"""
+        state = self._refresh()
+        with self._lock:
+            if "source_file" in state.metadata_index.fields:
+                rows = state.metadata_index.candidate_rows({"source_file": [source_file]})
+            else:
+                rows = np.array([row for row in range(state.count) if state.metadatas[row].get("source_file") == source_file], dtype=np.int64)
+            return [state.ids[row] for row in state.live(rows).tolist()]
+
+    def delete_documents(self, ids: List[str]) -> int:
+        """按ID删除文档：追加墓碑并提交，之后的查询立即跳过这些行，返回实际删除的数量"""
+        with self._write_lock, self._lock:
+            lock_handle = self._acquire_file_lock()
+            try:
+                state = self._refresh()
+                rows = sorted({
+                    row for row in (state.id_to_row.get(doc_id) for doc_id in ids)
+                    if state.is_live(row)
+                })
+                if not rows:
+                    return 0
+
+                # 丢弃上次未提交（写入中断）的墓碑
+                tombstones_path = self._path(self.TOMBSTONES_FILE)
+                if os.path.exists(tombstones_path) and os.path.getsize(tombstones_path) > state.deleted_count * 8:
+                    os.truncate(tombstones_path, state.deleted_count * 8)
+                with open(tombstones_path, "ab") as f:
+                    f.write(np.asarray(rows, dtype="<i8").tobytes())
+
+                state.deleted[rows] = True
+                state.deleted_count += len(rows)
+                self._write_meta(state)
+            finally:
+                lock_handle.close()
+
+        logger.info(f"已删除 {len(rows)} 个文档（墓碑共 {state.deleted_count} 个）")
+        self._schedule_compaction()
+        return len(rows)
+
+    def _needs_compaction(self) -> bool:
+        state = self._state
+        return (
+            state.deleted_count >= settings.compaction_min_deleted
+            and state.deleted_count >= state.count * settings.compaction_deleted_ratio
+        )
+
+    def _schedule_compaction(self):
+        """墓碑比例超过阈值时在后台线程压缩"""
+        with self._lock:
+            if self._compacting or not self._needs_compaction():
+                return
+            self._compacting = True
+
+        def _run():
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"索引后台压缩失败: {e}")
+            finally:
+                self._compacting = False
+
+        threading.Thread(target=_run, name="compaction", daemon=True).start()
+
+    def _write_compacted_index(self, state: IndexState, target_path: str, keep: np.ndarray):
+        """子类扩展点：将自身的索引结构按保留的行 keep（旧行号，升序）重映射后写入target_path"""
+
+    def compact(self) -> int:
+        """
+        将未删除的文档、向量和正文重写到临时目录，再逐个替换原文件并以新的generation提交，返回清理的行数
+        复制期间只阻塞写入，不阻塞查询；替换后由新文件构建新的状态，进行中的查询继续使用旧状态（旧文件的映射和句柄）
+        其他进程在下次刷新时发现generation变化后同样构建新的状态
+        """
+        with self._write_lock:
+            lock_handle = self._acquire_file_lock()
+            try:
+                state = self._refresh()
+                removed = state.deleted_count
+                if not removed:
+                    return 0
+
+                compact_path = self._path(self.COMPACT_DIR)
+                if os.path.exists(compact_path):
+                    shutil.rmtree(compact_path)
+                target = NumpyVectorStore(index_path=compact_path, dimension=self.dimension)
+                for ids, documents, vectors in self.iter_records():
+                    target._append(documents, vectors, ids)
+                if target._state.count == 0:
+                    # 全部文档都已删除：提交一个空索引
+                    target._ensure_capacity(target._state, 0)
+                    target._state.content.append([], 0)
+                    open(target._path(self.DOCUMENTS_FILE), "a").close()
+                    target._write_meta(target._state)
+                self._write_compacted_index(state, compact_path, state.live(np.arange(state.count)))
+                del target
+                with open(os.path.join(compact_path, self.META_FILE), "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                meta["generation"] = state.generation + 1
+
+                with self._lock:
+                    # 先替换数据文件并删除旧的墓碑，最后写入带新generation的元数据作为提交
+                    for name in os.listdir(self.index_path):
+                        if name not in (self.META_FILE, self.LOCK_FILE, self.COMPACT_DIR) and os.path.isfile(self._path(name)) and not os.path.exists(os.path.join(compact_path, name)):
+                            os.remove(self._path(name))
+                    for name in os.listdir(compact_path):
+                        if name not in (self.META_FILE, self.LOCK_FILE):
+                            os.replace(os.path.join(compact_path, name), self._path(name))
+                    tmp_path = self._path(self.META_FILE + ".tmp")
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        json.dump(meta, f)
+                    os.replace(tmp_path, self._path(self.META_FILE))
+                    shutil.rmtree(compact_path)
+                    logger.info(f"索引已压缩，加载新的状态: {self.index_path}")
+                    state = self._load_state(meta, os.path.getmtime(self._path(self.META_FILE)))
+                    self._state = state
+            finally:
+                lock_handle.close()
+        self._on_refresh()
+
+        logger.info(f"索引压缩完成: 清理 {removed} 个已删除的行，剩余 {state.count} 个文档")
+        return removed
+
+    def get_content_stats(self) -> dict:
+        """获取压缩内容存储状态"""
+        return self._refresh().content.get_stats()
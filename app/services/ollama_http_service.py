@@ -2,12 +2,18 @@ import requests
 from app.config.settings import settings
 from typing import List
 from app.models.document_models import Document
+from app.utils.lazy_service import LazyService
 import logging
 import time
 import json
 
 logger = logging.getLogger(__name__)
 
+
+class FailedAnswer(str):
+    """生成失败时返回给用户的说明文字；仍是普通字符串，调用方可据此区分（如不写入答案缓存）"""
+
+
 class OllamaHTTPService:
     def __init__(self):
         self.base_url = settings.ollama_base_url
@@ -54,7 +60,7 @@ class OllamaHTTPService:
         """基于检索到的文档生成答案"""
         
         if not self.is_available():
-            return "Ollama服务不可用，请确保Ollama服务正在运行。"
+            return FailedAnswer("Ollama服务不可用，请确保Ollama服务正在运行。")
         
         # 构建上下文
         context = self._build_context(context_docs)
@@ -93,14 +99,14 @@ class OllamaHTTPService:
                 return answer
             else:
                 logger.error(f"生成失败，状态码: {response.status_code}, 响应: {response.text}")
-                return f"生成失败，HTTP状态码: {response.status_code}, 错误: {response.text}"
+                return FailedAnswer(f"生成失败，HTTP状态码: {response.status_code}, 错误: {response.text}")
             
         except requests.exceptions.Timeout:
             logger.error("请求超时")
-            return "请求超时，请稍后重试或检查模型是否正在加载。"
+            return FailedAnswer("请求超时，请稍后重试或检查模型是否正在加载。")
         except Exception as e:
             logger.error(f"生成答案失败: {e}")
-            return f"生成答案时出现错误: {str(e)}"
+            return FailedAnswer(f"生成答案时出现错误: {str(e)}")
     
     def _build_context(self, documents: List[Document]) -> str:
         """构建上下文字符串"""
@@ -130,5 +136,5 @@ class OllamaHTTPService:
         
         return prompt
 
-# 全局HTTP Ollama服务实例
-ollama_http_service = OllamaHTTPService()
\ No newline at end of file
+# 全局HTTP Ollama服务实例（延迟加载，连接测试不阻塞应用启动）
+ollama_http_service = LazyService("ollama", OllamaHTTPService)
\ No newline at end of file
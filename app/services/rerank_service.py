@@ -0,0 +1,116 @@
+from app.config.settings import settings
+from app.models.document_models import Document
+from app.services.embedding_cache import EmbeddingCache
+from app.utils.lazy_service import LazyService
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+import importlib.util
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 与嵌入服务相同：只检查是否安装，真正的导入推迟到加载模型时
+CROSS_ENCODER_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
+
+
+class RerankService:
+    """
+    交叉编码器重排
+    对 (问题, 文档块) 逐对打分，比向量相似度更准确但更慢，因此只用于第一阶段召回的少量候选；
+    一次请求的全部候选在一次批量前向计算中打分，分数按 (模型, 问题哈希, 文档ID) 缓存在内存LRU中
+    """
+
+    def __init__(self, model: Any = None, model_name: Optional[str] = None, cache_size: Optional[int] = None):
+        self.model = model
+        self.model_name = model_name or settings.rerank_model
+        self.cache_size = settings.rerank_cache_size if cache_size is None else cache_size
+        self._cache: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        self._load_failed = False
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        # 默认启用重排时提前加载模型，否则在第一次请求重排时加载
+        if settings.rerank_enabled:
+            self._get_model()
+
+    def _get_model(self) -> Any:
+        """加载交叉编码器，不可用或加载失败时返回None（之后不再重试）"""
+        if self.model is not None or self._load_failed:
+            return self.model
+        with self._model_lock:
+            if self.model is not None or self._load_failed:
+                return self.model
+            if not CROSS_ENCODER_AVAILABLE:
+                logger.warning("sentence-transformers 不可用，重排阶段将保持第一阶段的排序")
+                self._load_failed = True
+                return None
+            try:
+                from sentence_transformers import CrossEncoder
+                self.model = CrossEncoder(self.model_name)
+                logger.info(f"重排模型 {self.model_name} 加载成功")
+            except Exception as e:
+                logger.error(f"加载重排模型 {self.model_name} 失败: {e}")
+                self._load_failed = True
+            return self.model
+
+    def is_available(self) -> bool:
+        return self._get_model() is not None
+
+    def score(self, question: str, documents: List[Document]) -> List[Optional[float]]:
+        """为每个文档计算与问题的相关度分数（未命中缓存的文档一次批量打分），模型不可用时全部为None"""
+        model = self._get_model()
+        if model is None:
+            return [None] * len(documents)
+
+        question_hash = EmbeddingCache.text_hash(question)
+        keys = [(self.model_name, question_hash, doc.id or EmbeddingCache.text_hash(doc.content)) for doc in documents]
+        scores: List[Optional[float]] = [None] * len(documents)
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[i] = self._cache[key]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        self.cache_hits += len(documents) - len(missing)
+        self.cache_misses += len(missing)
+
+        if missing:
+            predicted = model.predict(
+                [(question, documents[i].content) for i in missing],
+                batch_size=settings.rerank_batch_size,
+                show_progress_bar=False
+            )
+            with self._lock:
+                for i, value in zip(missing, predicted):
+                    scores[i] = float(value)
+                    self._cache[keys[i]] = scores[i]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def rerank(self, question: str, documents: List[Document], top_n: int) -> List[Document]:
+        """按交叉编码器分数重新排序并保留前top_n个；模型不可用时保持原顺序"""
+        scores = self.score(question, documents)
+        if any(score is None for score in scores):
+            return documents[:top_n]
+        order = sorted(range(len(documents)), key=lambda i: -scores[i])[:top_n]
+        return [documents[i].model_copy(update={"rerank_score": scores[i]}) for i in order]
+
+    def get_stats(self) -> dict:
+        """获取重排状态和缓存命中情况"""
+        total = self.cache_hits + self.cache_misses
+        return {
+            "model": self.model_name,
+            "loaded": self.model is not None,
+            "cached_scores": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_hit_rate": round(self.cache_hits / total, 4) if total else None,
+        }
+
+
+rerank_service = LazyService("rerank_service", RerankService)
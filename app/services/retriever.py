@@ -0,0 +1,167 @@
+from app.config.settings import settings
+from app.models.document_models import Document
+from app.services.embedding_dispatcher import embedding_dispatcher
+from app.services.lexical_index import lexical_index
+from app.services.rerank_service import rerank_service
+from app.services.vector_store import vector_store
+from app.utils.lazy_service import wait_for_services
+from app.utils.metadata_filter import Filters, matches_filters
+from app.utils.retrieval import expand_neighbors, filter_by_score, mmr_candidate_count, mmr_documents, reciprocal_rank_fusion
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _lexical_search(question: str, top_k: int, filters: Optional[Filters]) -> Tuple[List[Document], Dict[str, float]]:
+    """BM25检索并批量取回文档，按元数据过滤后保持BM25排序；同时返回 {文档ID: BM25分数}"""
+    hits = lexical_index.search(question, top_k)
+    if not hits:
+        return [], {}
+    documents = vector_store.get_documents([doc_id for doc_id, _ in hits])
+    return [doc for doc in documents if matches_filters(doc.metadata, filters)], dict(hits)
+
+
+async def _first_stage(
+    question: str,
+    top_k: int,
+    recall_hint: Optional[str],
+    filters: Optional[Filters],
+    min_score: Optional[float],
+    use_hybrid: bool,
+    include_embeddings: bool,
+    query_embedding: Optional[List[float]]
+) -> List[Document]:
+    """
+    第一阶段召回：向量检索，或向量与关键词检索融合；include_embeddings 为True时向量检索结果带嵌入向量
+    两种方式的检索都是同步的CPU/IO操作，放到线程池执行以免阻塞事件循环
+    """
+    loop = asyncio.get_running_loop()
+    if use_hybrid:
+        await wait_for_services(lexical_index, timeout=settings.service_ready_timeout)
+        # 已有知识库尚未建立BM25索引时（未运行 scripts/build_lexical_index.py）退化为纯向量检索
+        if await loop.run_in_executor(None, lexical_index.get_document_count) == 0:
+            logger.warning("BM25索引为空，混合检索退化为向量检索；已有知识库请先运行 scripts/build_lexical_index.py")
+            use_hybrid = False
+
+    if not use_hybrid:
+        if query_embedding is None:
+            query_embedding = await embedding_dispatcher.embed(question)
+        documents = await loop.run_in_executor(
+            None,
+            lambda: vector_store.similarity_search(query_embedding, top_k=top_k, recall_hint=recall_hint, filters=filters, include_embeddings=include_embeddings)
+        )
+        relevant = filter_by_score(documents, min_score)
+        logger.info(f"检索到 {len(documents)} 个文档，其中 {len(relevant)} 个达到相关度阈值")
+        return relevant
+
+    candidate_count = top_k * max(1, settings.hybrid_candidate_factor)
+
+    async def _vector_search() -> List[Document]:
+        embedding = query_embedding if query_embedding is not None else await embedding_dispatcher.embed(question)
+        return await loop.run_in_executor(
+            None,
+            lambda: vector_store.similarity_search(embedding, top_k=candidate_count, recall_hint=recall_hint, filters=filters, include_embeddings=include_embeddings)
+        )
+
+    vector_docs, (lexical_docs, bm25_scores) = await asyncio.gather(
+        _vector_search(),
+        loop.run_in_executor(None, _lexical_search, question, candidate_count, filters)
+    )
+
+    # 低于相似度阈值的向量结果丢弃，其关键词命中也一并丢弃，不参与融合；
+    # 只由关键词命中的文档没有余弦相似度，需达到BM25分数下限
+    candidates = vector_docs
+    vector_docs = filter_by_score(candidates, min_score)
+    passed = {doc.id for doc in vector_docs}
+    rejected = {doc.id for doc in candidates} - passed
+    lexical_docs = [
+        doc for doc in lexical_docs
+        if doc.id in passed or (doc.id not in rejected and bm25_scores.get(doc.id, 0.0) >= settings.bm25_min_score)
+    ]
+    by_id = {doc.id: doc for doc in lexical_docs}
+    by_id.update((doc.id, doc) for doc in vector_docs)
+    fused = reciprocal_rank_fusion([[doc.id for doc in vector_docs], [doc.id for doc in lexical_docs]])
+    documents = [by_id[doc_id] for doc_id in fused[:top_k]]
+    logger.info(f"混合检索: 向量候选 {len(vector_docs)} 个，关键词候选 {len(lexical_docs)} 个，融合后返回 {len(documents)} 个")
+    return documents
+
+
+def _diversify(query_embedding: List[float], documents: List[Document], top_k: int, mmr_lambda: float) -> List[Document]:
+    """对融合、重排之后的最终候选做MMR选择；只由关键词命中的候选没有嵌入向量，一次批量补取"""
+    missing = [doc.id for doc in documents if doc.embedding is None]
+    if missing:
+        embeddings = {doc.id: doc.embedding for doc in vector_store.get_documents(missing, include_embeddings=True)}
+        documents = [
+            doc if doc.embedding is not None else doc.model_copy(update={"embedding": embeddings.get(doc.id)})
+            for doc in documents
+        ]
+    return mmr_documents(query_embedding, documents, top_k, mmr_lambda, ranked=True)
+
+
+async def retrieve(
+    question: str,
+    top_k: int = 5,
+    recall_hint: Optional[str] = None,
+    filters: Optional[Filters] = None,
+    min_score: Optional[float] = None,
+    hybrid: Optional[bool] = None,
+    rerank: Optional[bool] = None,
+    mmr_lambda: Optional[float] = None,
+    timings: Optional[Dict[str, float]] = None,
+    query_embedding: Optional[List[float]] = None,
+    neighbors: Optional[int] = None
+) -> List[Document]:
+    """
+    检索与问题相关的文档（已按相关度阈值过滤）
+    混合检索时向量检索和BM25关键词检索并发执行，各召回 top_k 的若干倍候选，
+    用倒数排名融合合并；只由关键词命中的文档没有余弦相似度，score为None，需达到 bm25_min_score 才保留
+    重排时第一阶段召回 rerank_candidates 个候选，交叉编码器一次批量打分后保留前 top_k 个
+    mmr_lambda 不为None时召回和重排保留 top_k 的 mmr_candidate_factor 倍候选，
+    融合和重排之后再对最终候选做MMR选择 top_k 个，相关度按最终排序
+    neighbors 大于0时最终结果扩展为同一文件的前后相邻块，相邻块一次批量取回，连续的块合并为一个文档
+    timings 不为None时写入各阶段耗时（秒）；query_embedding 为已计算的问题向量，为None时在此计算
+    """
+    use_hybrid = settings.hybrid_search_enabled if hybrid is None else hybrid
+    use_rerank = settings.rerank_enabled if rerank is None else rerank
+    mmr_lambda = settings.mmr_lambda if mmr_lambda is None else mmr_lambda
+    timings = {} if timings is None else timings
+
+    use_mmr = mmr_lambda is not None
+    pool_size = mmr_candidate_count(top_k) if use_mmr else top_k
+
+    started = time.perf_counter()
+    if use_mmr and query_embedding is None:
+        query_embedding = await embedding_dispatcher.embed(question)
+    candidate_count = max(pool_size, settings.rerank_candidates) if use_rerank else pool_size
+    documents = await _first_stage(question, candidate_count, recall_hint, filters, min_score, use_hybrid, use_mmr, query_embedding)
+    timings["retrieval"] = time.perf_counter() - started
+    if not documents:
+        return documents
+
+    loop = asyncio.get_running_loop()
+    if use_rerank:
+        started = time.perf_counter()
+        await wait_for_services(rerank_service, timeout=settings.service_ready_timeout)
+        candidate_count = len(documents)
+        documents = await loop.run_in_executor(None, rerank_service.rerank, question, documents, pool_size)
+        timings["rerank"] = time.perf_counter() - started
+        logger.info(f"重排: {candidate_count} 个候选保留 {len(documents)} 个，耗时 {timings['rerank']:.3f}秒")
+
+    if use_mmr:
+        started = time.perf_counter()
+        candidate_count = len(documents)
+        documents = await loop.run_in_executor(None, _diversify, query_embedding, documents, top_k, mmr_lambda)
+        timings["mmr"] = time.perf_counter() - started
+        logger.info(f"MMR: {candidate_count} 个候选选择 {len(documents)} 个")
+
+    neighbors = settings.context_expansion_neighbors if neighbors is None else neighbors
+    if neighbors > 0:
+        started = time.perf_counter()
+        hit_count = len(documents)
+        documents = await loop.run_in_executor(None, expand_neighbors, documents, vector_store.get_chunks, neighbors)
+        timings["expansion"] = time.perf_counter() - started
+        logger.info(f"相邻块扩展: {hit_count} 个命中块合并为 {len(documents)} 段上下文")
+    return documents
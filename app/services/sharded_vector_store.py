@@ -0,0 +1,264 @@
+from app.models.document_models import BulkInsertError, BulkInsertResult, Document, DocumentCreate, DocumentPage
+from app.utils.metadata_filter import Filters
+from app.utils.pagination import cursor_index, decode_cursor, encode_cursor
+from app.utils.retrieval import mmr_candidate_count, mmr_documents
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+import heapq
+import json
+import logging
+import os
+import uuid
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+def shard_path(root: str, shard: int) -> str:
+    return os.path.join(root, f"shard_{shard:03d}")
+
+
+def read_manifest(root: str) -> Optional[Dict[str, Any]]:
+    """读取分片清单，root不是分片布局时返回None"""
+    manifest_path = os.path.join(root, ShardedVectorStore.MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def copy_records(source, target, batch_size: Optional[int] = None) -> Tuple[int, int]:
+    """将source中的全部文档和向量（保留原ID）按批写入target，返回 (成功数, 失败数)"""
+    copied = failed = 0
+    for ids, documents, embeddings in source.iter_records(batch_size):
+        result = target.insert_documents(documents, embeddings, batch_size=batch_size, ids=ids)
+        copied += result.inserted_count
+        failed += len(result.errors)
+        for error in result.errors:
+            logger.error(f"迁移文档 {ids[error.index]} 失败: {error.error}")
+        logger.info(f"已迁移 {copied} 个文档...")
+    return copied, failed
+
+
+class ShardedVectorStore:
+    """
+    分片向量存储
+    按文档ID哈希或按 source_file 将文档路由到N个独立的分片（各自的目录/客户端），
+    搜索时在线程池中并发查询全部分片，再用堆合并各分片的局部top-k
+    对外接口与单个向量存储一致，路由层无需改动
+    """
+
+    MANIFEST_FILE = "shards.json"
+    ROUTINGS = ("hash", "source_file")
+
+    def __init__(self, shards: List[Any], routing: str = "hash"):
+        if routing not in self.ROUTINGS:
+            raise ValueError(f"不支持的分片路由方式: {routing}，可选: {', '.join(self.ROUTINGS)}")
+        self.shards = shards
+        self.routing = routing
+        self._executor = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="shard")
+
+    @classmethod
+    def open(cls, root: str, shard_count: int, routing: str, create_shard: Callable[[str], Any]) -> "ShardedVectorStore":
+        """打开（或创建）root目录下的分片布局；分片数或路由方式与清单不一致时需要先重新分片"""
+        os.makedirs(root, exist_ok=True)
+        manifest = read_manifest(root)
+        if manifest is not None:
+            if manifest["shard_count"] != shard_count or manifest["routing"] != routing:
+                raise ValueError(
+                    f"{root} 的分片布局为 {manifest['shard_count']} 个分片（{manifest['routing']}），"
+                    f"与配置的 {shard_count} 个分片（{routing}）不一致，请先运行 scripts/rebalance_shards.py"
+                )
+        else:
+            with open(os.path.join(root, cls.MANIFEST_FILE), "w", encoding="utf-8") as f:
+                json.dump({"shard_count": shard_count, "routing": routing}, f)
+
+        shards = [create_shard(shard_path(root, shard)) for shard in range(shard_count)]
+        logger.info(f"分片向量存储初始化成功: {root}，{shard_count} 个分片，路由方式: {routing}")
+        return cls(shards, routing)
+
+    # ---- 路由 ----
+
+    def shard_for(self, doc_id: str, document: DocumentCreate) -> int:
+        """计算文档所属分片（使用稳定的crc32，保证跨进程一致）"""
+        key = doc_id
+        if self.routing == "source_file":
+            key = (document.metadata or {}).get("source_file") or doc_id
+        return zlib.crc32(str(key).encode("utf-8")) % len(self.shards)
+
+    def _map_shards(self, func: Callable[[Any], Any]) -> List[Any]:
+        """在线程池中对所有分片并发执行"""
+        return list(self._executor.map(func, self.shards))
+
+    @staticmethod
+    def _merge(partials: List[List[Document]], top_k: int) -> List[Document]:
+        """合并各分片已按分数降序的局部top-k"""
+        return heapq.nlargest(top_k, (doc for docs in partials for doc in docs), key=lambda doc: doc.score or 0.0)
+
+    # ---- 写入 ----
+
+    def insert_document(self, document: DocumentCreate, embedding: List[float]) -> str:
+        """插入文档和向量"""
+        result = self.insert_documents([document], [embedding])
+        if result.errors:
+            raise RuntimeError(result.errors[0].error)
+        return result.ids[0]
+
+    def insert_documents(self, documents: List[DocumentCreate], embeddings, batch_size: Optional[int] = None, ids: Optional[List[str]] = None) -> BulkInsertResult:
+        """按分片分组后并发批量写入，结果按输入顺序重新组装"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if len(documents) != len(embeddings):
+            raise ValueError(f"文档数 {len(documents)} 与向量数 {len(embeddings)} 不一致")
+
+        new_ids = list(ids) if ids else [str(uuid.uuid4()) for _ in documents]
+        groups: Dict[int, List[int]] = {}
+        for i, (doc_id, document) in enumerate(zip(new_ids, documents)):
+            groups.setdefault(self.shard_for(doc_id, document), []).append(i)
+
+        def _insert(item: Tuple[int, List[int]]) -> Tuple[List[int], BulkInsertResult]:
+            shard, positions = item
+            result = self.shards[shard].insert_documents(
+                [documents[i] for i in positions],
+                embeddings[positions],
+                batch_size=batch_size,
+                ids=[new_ids[i] for i in positions]
+            )
+            return positions, result
+
+        inserted_ids: List[Optional[str]] = [None] * len(documents)
+        errors: List[BulkInsertError] = []
+        for positions, result in self._executor.map(_insert, groups.items()):
+            for position, doc_id in zip(positions, result.ids):
+                inserted_ids[position] = doc_id
+            errors.extend(BulkInsertError(index=positions[error.index], error=error.error) for error in result.errors)
+
+        errors.sort(key=lambda error: error.index)
+        return BulkInsertResult(ids=inserted_ids, errors=errors)
+
+    # ---- 搜索 ----
+
+    def similarity_search(self, query_embedding: List[float], top_k: int = 5, recall_hint: Optional[str] = None, filters: Optional[Filters] = None, mmr_lambda: Optional[float] = None, include_embeddings: bool = False, **search_params) -> List[Document]:
+        """
+        并发搜索全部分片并合并结果
+        MMR需要在全部分片的候选上整体选择：各分片返回带嵌入向量的候选，合并后再做MMR
+        """
+        candidate_count = mmr_candidate_count(top_k) if mmr_lambda is not None else top_k
+        if include_embeddings or mmr_lambda is not None:
+            search_params["include_embeddings"] = True
+        partials = self._map_shards(
+            lambda shard: shard.similarity_search(query_embedding, top_k=candidate_count, recall_hint=recall_hint, filters=filters, **search_params)
+        )
+        documents = self._merge(partials, candidate_count)
+        if mmr_lambda is not None:
+            documents = mmr_documents(query_embedding, documents, top_k, mmr_lambda, keep_embeddings=include_embeddings)
+        logger.info(f"分片相似度搜索完成，找到 {len(documents)} 个文档")
+        return documents
+
+    def batch_similarity_search(self, query_embeddings, top_k: int = 5, recall_hint: Optional[str] = None, filters: Optional[Filters] = None) -> List[List[Document]]:
+        """每个分片做一次批量搜索，再按查询逐个合并"""
+        partials = self._map_shards(
+            lambda shard: shard.batch_similarity_search(query_embeddings, top_k=top_k, recall_hint=recall_hint, filters=filters)
+        )
+        return [self._merge([shard_hits[q] for shard_hits in partials], top_k) for q in range(len(query_embeddings))]
+
+    # ---- 删除 ----
+
+    def get_source_file_ids(self, source_file: str) -> List[str]:
+        """获取某个来源文件的全部文档ID（按source_file路由时只查询所属分片）"""
+        if self.routing == "source_file":
+            shard = self.shards[self.shard_for("", DocumentCreate(content="", metadata={"source_file": source_file}))]
+            return shard.get_source_file_ids(source_file)
+        return [doc_id for ids in self._map_shards(lambda shard: shard.get_source_file_ids(source_file)) for doc_id in ids]
+
+    def delete_documents(self, ids: List[str]) -> int:
+        """按ID删除文档（按哈希路由时直接定位分片，否则在全部分片中删除）"""
+        if self.routing != "hash":
+            return sum(self._map_shards(lambda shard: shard.delete_documents(ids)))
+        groups: Dict[int, List[str]] = {}
+        for doc_id in ids:
+            groups.setdefault(self.shard_for(doc_id, DocumentCreate(content="")), []).append(doc_id)
+        return sum(self._executor.map(lambda item: self.shards[item[0]].delete_documents(item[1]), groups.items()))
+
+    def compact(self) -> int:
+        """压缩全部支持压缩的分片"""
+        return sum(self._map_shards(lambda shard: shard.compact() if hasattr(shard, "compact") else 0))
+
+    # ---- 读取 ----
+
+    def get_document_count(self) -> int:
+        """获取文档数量"""
+        return sum(self._map_shards(lambda shard: shard.get_document_count()))
+
+    def commit_point(self) -> Optional[tuple]:
+        """各分片的提交点；分片后端没有提交点时返回None"""
+        if not all(hasattr(shard, "commit_point") for shard in self.shards):
+            return None
+        return tuple(shard.commit_point() for shard in self.shards)
+
+    def get_document(self, doc_id: str) -> Optional[Document]:
+        """根据ID获取文档（按source_file路由时无法由ID确定分片，查询全部分片）"""
+        if self.routing == "hash":
+            return self.shards[self.shard_for(doc_id, DocumentCreate(content=""))].get_document(doc_id)
+        for doc in self._map_shards(lambda shard: shard.get_document(doc_id)):
+            if doc is not None:
+                return doc
+        return None
+
+    def get_documents(self, ids: List[str], include_embeddings: bool = False) -> List[Document]:
+        """按ID批量获取文档（保持输入顺序，不存在的ID跳过），各分片并发查询"""
+        found = {}
+        for docs in self._map_shards(lambda shard: shard.get_documents(ids, include_embeddings=include_embeddings)):
+            found.update((doc.id, doc) for doc in docs)
+        return [found[doc_id] for doc_id in ids if doc_id in found]
+
+    def get_chunks(self, keys: List[Tuple[str, int]]) -> List[Document]:
+        """按 (来源文件, 块序号) 批量获取文档块（按source_file路由时只查询所属分片）"""
+        if self.routing != "source_file":
+            return [doc for docs in self._map_shards(lambda shard: shard.get_chunks(keys)) for doc in docs]
+        groups: Dict[int, List[Tuple[str, int]]] = {}
+        for key in keys:
+            groups.setdefault(self.shard_for("", DocumentCreate(content="", metadata={"source_file": key[0]})), []).append(key)
+        return [doc for docs in self._executor.map(lambda item: self.shards[item[0]].get_chunks(item[1]), groups.items()) for doc in docs]
+
+    def list_documents(self, cursor: Optional[str] = None, limit: int = 20, preview_chars: Optional[int] = None) -> DocumentPage:
+        """依次遍历各分片分页，游标记录当前分片及其内部游标"""
+        position = decode_cursor(cursor)
+        shard = cursor_index(position, "shard", cursor)
+        inner = position.get("cursor")
+        items = []
+
+        while shard < len(self.shards) and len(items) < limit:
+            page = self.shards[shard].list_documents(cursor=inner, limit=limit - len(items), preview_chars=preview_chars)
+            items.extend(page.items)
+            if page.next_cursor is None:
+                shard, inner = shard + 1, None
+            else:
+                inner = page.next_cursor
+
+        next_cursor = encode_cursor({"shard": shard, "cursor": inner}) if shard < len(self.shards) else None
+        return DocumentPage(items=items, next_cursor=next_cursor, total=self.get_document_count())
+
+    def iter_records(self, batch_size: Optional[int] = None) -> Iterator[Tuple[List[str], List[DocumentCreate], np.ndarray]]:
+        """依次遍历各分片的全部文档及向量"""
+        for shard in self.shards:
+            yield from shard.iter_records(batch_size)
+
+    def get_all_documents(self, limit: int = 10) -> List[Document]:
+        """获取所有文档（用于调试）"""
+        documents = []
+        for shard in self.shards:
+            if len(documents) >= limit:
+                break
+            documents.extend(shard.get_all_documents(limit=limit - len(documents)))
+        return documents
+
+    def get_index_stats(self) -> dict:
+        """获取各分片状态"""
+        return {
+            "routing": self.routing,
+            "shards": [
+                {"count": shard.get_document_count(), **(shard.get_index_stats() if hasattr(shard, "get_index_stats") else {})}
+                for shard in self.shards
+            ],
+        }
@@ -1,85 +1,229 @@
+from app.config.settings import settings
+from app.utils.vector_ops import iter_batches, normalize_rows
 import numpy as np
-from typing import List
+from typing import List, Optional
 import logging
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import hashlib
-import re
+import os
+from app.utils.lazy_service import LazyService
 
 logger = logging.getLogger(__name__)
 
 class SimpleEmbeddingService:
     """
     简单的嵌入服务，作为sentence-transformers的备选方案
-    使用TF-IDF和简单的文本哈希来生成向量
+    使用TF-IDF和特征哈希来生成向量
     """
     
     def __init__(self):
-        self.vectorizer = TfidfVectorizer(max_features=768, stop_words=None)
+        # sklearn导入较慢，推迟到服务构造时
+        from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+        
+        self.vectorizer = TfidfVectorizer(max_features=settings.vector_dimension, stop_words=None)
         self.is_fitted = False
         self.vocabulary = None
+        self.document_frequencies = None
+        self.document_count = 0
+        self.corpus_version = 0
+        self.fitted_idf = None  # 最近一次从头拟合时的IDF，用于估计增量更新后的漂移
+        self._state_mtime = None
+        # 特征哈希向量化器：无状态，未拟合TF-IDF时作为回退
+        self.char_hasher = HashingVectorizer(
+            analyzer='char',
+            ngram_range=(1, 3),
+            n_features=settings.vector_dimension,
+            alternate_sign=True,
+            norm=None,
+            dtype=np.float32
+        )
+        self.word_hasher = HashingVectorizer(
+            analyzer='word',
+            n_features=settings.vector_dimension,
+            alternate_sign=True,
+            norm=None,
+            dtype=np.float32
+        )
+        self._load_state()
         logger.info("简单嵌入服务初始化完成")
     
     def get_embedding(self, text: str) -> List[float]:
         """获取文本的简单向量表示"""
-        if not text.strip():
-            return [0.0] * 768
-        
-        try:
-            # 方法1: 使用TF-IDF（如果已经拟合过）
-            if self.is_fitted:
-                vector = self.vectorizer.transform([text]).toarray()[0]
-                if len(vector) < 768:
-                    # 填充到768维
-                    vector = np.pad(vector, (0, 768 - len(vector)))
-                elif len(vector) > 768:
-                    # 截断到768维
-                    vector = vector[:768]
-                return vector.tolist()
-            else:
-                # 方法2: 使用文本哈希作为简单向量
-                return self._text_to_hash_vector(text)
-                
-        except Exception as e:
-            logger.error(f"简单嵌入生成失败: {e}")
-            return self._text_to_hash_vector(text)
+        return self.get_embeddings_batch([text])[0].tolist()
     
-    def _text_to_hash_vector(self, text: str) -> List[float]:
-        """将文本转换为基于哈希的向量"""
-        # 清理文本
-        cleaned_text = re.sub(r'\s+', ' ', text.strip())
+    def transform_hashed(self, texts: List[str]):
+        """
+        特征哈希：字符n-gram（适配中日韩文本）+ 单词，带符号哈希到 vector_dimension 个桶
+        无需拟合，返回按行L2归一化的稀疏矩阵
+        """
+        from sklearn.preprocessing import normalize
         
-        # 使用SHA256哈希生成确定性向量
-        hash_obj = hashlib.sha256(cleaned_text.encode('utf-8'))
-        hash_hex = hash_obj.hexdigest()
+        matrix = self.char_hasher.transform(texts) + self.word_hasher.transform(texts)
+        return normalize(matrix, norm='l2', copy=False)
+    
+    def get_embeddings_batch(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        """
+        批量获取向量嵌入
         
-        # 将哈希转换为768维向量
-        vector = []
-        for i in range(0, min(len(hash_hex), 768*6), 6):
-            chunk = hash_hex[i:i+6]
-            if len(chunk) == 6:
-                # 将16进制转换为0-1之间的浮点数
-                value = int(chunk, 16) / 0xFFFFFF
-                vector.append(value)
+        Returns:
+            形状为 (len(texts), vector_dimension) 的连续float32矩阵，每行已L2归一化
+        """
+        dimension = settings.vector_dimension
+        batch_size = batch_size or settings.embedding_batch_size
+        embeddings = np.zeros((len(texts), dimension), dtype=np.float32)
+        self._reload_if_changed()
         
-        # 如果向量长度不足，用0填充
-        while len(vector) < 768:
-            vector.append(0.0)
+        for start, batch in iter_batches(texts, batch_size):
+            try:
+                if self.is_fitted:
+                    # 方法1: 使用TF-IDF（如果已经拟合过），整批稀疏变换
+                    matrix = self.vectorizer.transform(batch)
+                    cols = min(matrix.shape[1], dimension)
+                    embeddings[start:start + len(batch), :cols] = matrix[:, :cols].toarray()
+                else:
+                    # 方法2: 使用特征哈希向量（无需拟合）
+                    embeddings[start:start + len(batch)] = self.transform_hashed(batch).toarray()
+            except Exception as e:
+                logger.error(f"简单嵌入生成失败: {e}")
+                embeddings[start:start + len(batch)] = self.transform_hashed(batch).toarray()
         
-        return vector[:768]
-    
-    def get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
-        """批量获取向量嵌入"""
-        return [self.get_embedding(text) for text in texts]
+        return normalize_rows(embeddings)
     
     def fit_vectorizer(self, texts: List[str]):
-        """使用文本列表拟合TF-IDF向量化器"""
+        """使用文本列表拟合TF-IDF向量化器（从头拟合）"""
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        
         try:
+            self.vectorizer = TfidfVectorizer(max_features=settings.vector_dimension, stop_words=None)
             self.vectorizer.fit(texts)
+            self.document_frequencies = self._count_document_frequencies(texts)
+            self.document_count = len(texts)
+            self.fitted_idf = np.asarray(self.vectorizer.idf_, dtype=np.float64).copy()
             self.is_fitted = True
+            self.corpus_version += 1
+            self._save_state()
             logger.info(f"TF-IDF向量化器拟合完成，词汇表大小: {len(self.vectorizer.vocabulary_)}")
         except Exception as e:
             logger.error(f"拟合TF-IDF向量化器失败: {e}")
+    
+    def partial_fit(self, texts: List[str]):
+        """
+        增量更新TF-IDF：在现有词汇表上累加文档频率并重新计算IDF，无需从头拟合
+        词汇表决定向量维度，因此保持不变，新出现的词不会加入
+        
+        局限：已入库的向量不会重新计算，仍按旧IDF生成，而新的查询向量使用新IDF，
+        两者之间的偏差随增量更新累积。IDF相对最近一次从头拟合的漂移超过
+        tfidf_drift_warning_threshold 时记录警告，此时应重新拟合并重建索引
+        """
+        if not texts:
+            return
+        if not self.is_fitted:
+            self.fit_vectorizer(texts)
+            return
+        
+        try:
+            self.document_frequencies += self._count_document_frequencies(texts)
+            self.document_count += len(texts)
+            self.vectorizer.idf_ = self._compute_idf()
+            self.corpus_version += 1
+            self._save_state()
+            logger.info(f"TF-IDF增量更新完成，新增 {len(texts)} 个文档，语料版本: {self.corpus_version}")
+            drift = self.idf_drift()
+            if drift > settings.tfidf_drift_warning_threshold:
+                logger.warning(
+                    f"TF-IDF的IDF相对最近一次从头拟合已漂移 {drift:.1%}，已入库向量仍按旧IDF生成，"
+                    f"与新查询向量的相似度会产生偏差，建议重新拟合并重建索引"
+                )
+        except Exception as e:
+            logger.error(f"增量更新TF-IDF失败: {e}")
+    
+    def idf_drift(self) -> float:
+        """当前IDF相对最近一次从头拟合时IDF的相对L2变化，未拟合时为0"""
+        if not self.is_fitted or self.fitted_idf is None:
+            return 0.0
+        reference = float(np.linalg.norm(self.fitted_idf))
+        if reference == 0.0:
+            return 0.0
+        return float(np.linalg.norm(np.asarray(self.vectorizer.idf_) - self.fitted_idf)) / reference
+    
+    def _count_document_frequencies(self, texts: List[str]) -> np.ndarray:
+        """统计每个词出现的文档数"""
+        from sklearn.feature_extraction.text import CountVectorizer
+        
+        counter = CountVectorizer(vocabulary=self.vectorizer.vocabulary_, binary=True)
+        counts = counter.transform(texts)
+        return np.bincount(counts.indices, minlength=len(self.vectorizer.vocabulary_)).astype(np.int64)
+    
+    def _compute_idf(self) -> np.ndarray:
+        """按sklearn的平滑公式计算IDF: ln((1 + n) / (1 + df)) + 1"""
+        return np.log((1.0 + self.document_count) / (1.0 + self.document_frequencies)) + 1.0
+    
+    def _save_state(self):
+        """将词汇表、IDF、文档频率、语料版本和拟合时的IDF保存为紧凑的npz文件"""
+        path = settings.tfidf_state_path
+        if not path:
+            return
+        
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            
+            terms = [None] * len(self.vectorizer.vocabulary_)
+            for term, index in self.vectorizer.vocabulary_.items():
+                terms[index] = term
+            
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    terms=np.array(terms, dtype=str),
+                    idf=np.asarray(self.vectorizer.idf_, dtype=np.float64),
+                    document_frequencies=self.document_frequencies,
+                    document_count=np.int64(self.document_count),
+                    corpus_version=np.int64(self.corpus_version),
+                    fitted_idf=np.asarray(self.fitted_idf if self.fitted_idf is not None else self.vectorizer.idf_, dtype=np.float64)
+                )
+            os.replace(tmp_path, path)
+            self._state_mtime = os.path.getmtime(path)
+        except Exception as e:
+            logger.error(f"保存TF-IDF状态失败: {e}")
+    
+    def _load_state(self):
+        """启动时加载已保存的TF-IDF状态"""
+        path = settings.tfidf_state_path
+        if not path or not os.path.exists(path):
+            return
+        
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        
+        try:
+            with np.load(path, allow_pickle=False) as state:
+                terms = state["terms"].tolist()
+                vectorizer = TfidfVectorizer(vocabulary={term: i for i, term in enumerate(terms)})
+                vectorizer.idf_ = state["idf"]
+                self.vectorizer = vectorizer
+                self.document_frequencies = state["document_frequencies"].astype(np.int64)
+                self.document_count = int(state["document_count"])
+                self.corpus_version = int(state["corpus_version"])
+                # 旧版本状态文件没有记录拟合时的IDF，以当前IDF为基准
+                self.fitted_idf = state["fitted_idf"] if "fitted_idf" in state.files else np.asarray(state["idf"], dtype=np.float64)
+            
+            self.is_fitted = True
+            self._state_mtime = os.path.getmtime(path)
+            logger.info(f"已加载TF-IDF状态，词汇表大小: {len(terms)}，语料版本: {self.corpus_version}")
+        except Exception as e:
+            logger.error(f"加载TF-IDF状态失败，将使用特征哈希向量: {e}")
+    
+    def _reload_if_changed(self):
+        """其他进程（如加载脚本）更新了状态文件时重新加载，保证查询向量与入库向量一致"""
+        path = settings.tfidf_state_path
+        if not path:
+            return
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return
+        if mtime != self._state_mtime:
+            self._load_state()
 
-# 全局简单嵌入服务实例
-simple_embedding_service = SimpleEmbeddingService()
\ No newline at end of file
+# 全局简单嵌入服务实例（延迟加载）
+simple_embedding_service = LazyService("simple_embedding_service", SimpleEmbeddingService)
\ No newline at end of file
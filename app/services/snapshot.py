@@ -0,0 +1,191 @@
+from app.config.settings import settings
+from app.models.document_models import DocumentCreate
+from app.utils.vector_ops import as_float32_matrix
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+logger = logging.getLogger(__name__)
+
+# 快照格式版本：不兼容的结构变化时递增
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+TFIDF_STATE_FILE = "tfidf_state.npz"
+
+
+class SnapshotError(RuntimeError):
+    """快照格式、版本或校验和不正确"""
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _part_names(index: int) -> Tuple[str, str]:
+    return f"part-{index:05d}.npy", f"part-{index:05d}.jsonl"
+
+
+def _iter_parts(store, part_size: int) -> Iterator[Tuple[List[str], List[DocumentCreate], np.ndarray]]:
+    """将存储的批次重新组合为固定大小的分卷，内存中最多保留一个分卷"""
+    ids, documents, vectors = [], [], []
+    buffered = 0
+    for batch_ids, batch_documents, batch_vectors in store.iter_records(min(part_size, settings.insert_batch_size)):
+        ids.extend(batch_ids)
+        documents.extend(batch_documents)
+        vectors.append(as_float32_matrix(batch_vectors))
+        buffered += len(batch_ids)
+        while buffered >= part_size:
+            matrix = np.concatenate(vectors)
+            yield ids[:part_size], documents[:part_size], matrix[:part_size]
+            ids, documents, vectors = ids[part_size:], documents[part_size:], [matrix[part_size:]]
+            buffered -= part_size
+    if buffered:
+        yield ids, documents, np.concatenate(vectors)
+
+
+def export_snapshot(store, path: str, part_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    将向量存储导出为快照目录：每个分卷包含一个float32向量 .npy 和一个文档 .jsonl（id、内容、元数据），
+    manifest.json 记录格式版本、嵌入模型、维度和每个文件的sha256；先写入临时目录，完成后原子改名
+    """
+    part_size = part_size or settings.snapshot_part_size
+    tmp_path = path.rstrip("/\\") + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    parts = []
+    dimension = None
+    total = 0
+    for index, (ids, documents, vectors) in enumerate(_iter_parts(store, part_size)):
+        vectors_name, documents_name = _part_names(index)
+        np.save(os.path.join(tmp_path, vectors_name), vectors)
+        with open(os.path.join(tmp_path, documents_name), "w", encoding="utf-8") as f:
+            for doc_id, document in zip(ids, documents):
+                record = {"id": doc_id, "content": document.content, "metadata": document.metadata or {}}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        dimension = int(vectors.shape[1])
+        total += len(ids)
+        parts.append({
+            "count": len(ids),
+            "vectors": vectors_name,
+            "vectors_sha256": _sha256(os.path.join(tmp_path, vectors_name)),
+            "documents": documents_name,
+            "documents_sha256": _sha256(os.path.join(tmp_path, documents_name)),
+        })
+        logger.info(f"已导出 {total} 个文档...")
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "embedding_model": settings.embedding_model,
+        "dimension": dimension or settings.vector_dimension,
+        "count": total,
+        "parts": parts,
+    }
+
+    # 简单嵌入服务的向量依赖TF-IDF状态，一并导出以保证查询向量与快照中的向量一致
+    if os.path.exists(settings.tfidf_state_path):
+        shutil.copyfile(settings.tfidf_state_path, os.path.join(tmp_path, TFIDF_STATE_FILE))
+        manifest["tfidf_state_sha256"] = _sha256(os.path.join(tmp_path, TFIDF_STATE_FILE))
+
+    with open(os.path.join(tmp_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    logger.info(f"快照导出完成: {path}，{total} 个文档，{len(parts)} 个分卷")
+    return manifest
+
+
+def read_manifest(path: str) -> Dict[str, Any]:
+    """读取并检查快照清单"""
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise SnapshotError(f"{path} 不是快照目录（缺少 {MANIFEST_FILE}）")
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotError(f"不支持的快照格式版本: {manifest.get('format_version')}")
+    return manifest
+
+
+def verify_snapshot(path: str) -> Dict[str, Any]:
+    """校验全部文件的sha256，返回清单"""
+    manifest = read_manifest(path)
+    for part in manifest["parts"]:
+        for name_key, sha_key in (("vectors", "vectors_sha256"), ("documents", "documents_sha256")):
+            if _sha256(os.path.join(path, part[name_key])) != part[sha_key]:
+                raise SnapshotError(f"快照文件校验失败: {part[name_key]}")
+    if "tfidf_state_sha256" in manifest and _sha256(os.path.join(path, TFIDF_STATE_FILE)) != manifest["tfidf_state_sha256"]:
+        raise SnapshotError(f"快照文件校验失败: {TFIDF_STATE_FILE}")
+    return manifest
+
+
+def import_snapshot(store, path: str, batch_size: Optional[int] = None, restore_tfidf_state: bool = True) -> Tuple[int, int]:
+    """
+    将快照逐个分卷批量写入任意向量存储后端（保留原ID，不重新计算嵌入），返回 (成功数, 失败数)
+    每个分卷写入前先校验其sha256；向量通过内存映射读取，内存占用与分卷大小无关
+    """
+    manifest = read_manifest(path)
+    if manifest["dimension"] != settings.vector_dimension:
+        raise SnapshotError(f"快照向量维度 {manifest['dimension']} 与配置的维度 {settings.vector_dimension} 不一致")
+    if manifest["embedding_model"] != settings.embedding_model:
+        logger.warning(f"快照的嵌入模型 {manifest['embedding_model']} 与当前配置 {settings.embedding_model} 不同，查询向量可能不一致")
+
+    batch_size = batch_size or settings.insert_batch_size
+    was_empty = store.get_document_count() == 0
+    imported = failed = 0
+    for part in manifest["parts"]:
+        vectors_path = os.path.join(path, part["vectors"])
+        documents_path = os.path.join(path, part["documents"])
+        if _sha256(vectors_path) != part["vectors_sha256"] or _sha256(documents_path) != part["documents_sha256"]:
+            raise SnapshotError(f"快照分卷校验失败: {part['vectors']} / {part['documents']}")
+
+        vectors = np.load(vectors_path, mmap_mode="r")
+        with open(documents_path, "r", encoding="utf-8") as f:
+            row = 0
+            while row < part["count"]:
+                ids, documents = [], []
+                for line in f:
+                    record = json.loads(line)
+                    ids.append(record["id"])
+                    documents.append(DocumentCreate(content=record["content"], metadata=record.get("metadata") or {}))
+                    if len(ids) >= batch_size:
+                        break
+                if not ids:
+                    break
+
+                result = store.insert_documents(documents, np.asarray(vectors[row:row + len(ids)]), batch_size=batch_size, ids=ids)
+                imported += result.inserted_count
+                failed += len(result.errors)
+                for error in result.errors:
+                    logger.error(f"导入文档 {ids[error.index]} 失败: {error.error}")
+                row += len(ids)
+        del vectors
+        logger.info(f"已导入 {imported} 个文档...")
+
+    # TF-IDF状态只能整体替换，目标存储原本就有数据时不覆盖
+    tfidf_snapshot = os.path.join(path, TFIDF_STATE_FILE)
+    if restore_tfidf_state and os.path.exists(tfidf_snapshot) and not was_empty:
+        logger.warning("目标存储导入前已有文档，未恢复快照中的TF-IDF状态")
+    elif restore_tfidf_state and os.path.exists(tfidf_snapshot):
+        if _sha256(tfidf_snapshot) != manifest.get("tfidf_state_sha256"):
+            raise SnapshotError(f"快照文件校验失败: {TFIDF_STATE_FILE}")
+        os.makedirs(os.path.dirname(os.path.abspath(settings.tfidf_state_path)), exist_ok=True)
+        shutil.copyfile(tfidf_snapshot, settings.tfidf_state_path)
+        logger.info(f"已恢复TF-IDF状态: {settings.tfidf_state_path}")
+
+    logger.info(f"快照导入完成: 成功 {imported}，失败 {failed}")
+    return imported, failed
@@ -1,2 +1,48 @@
-# 重定向到ChromaDB向量存储
-from app.services.chroma_vector_store import chroma_vector_store as vector_store
\ No newline at end of file
+# 根据配置选择向量存储后端（延迟构造）
+from app.config.settings import settings
+from app.utils.lazy_service import LazyService
+from typing import Optional
+
+
+def backend_root(backend: str) -> str:
+    """后端数据的根目录"""
+    return settings.chroma_db_path if backend == "chroma" else settings.numpy_index_path
+
+
+def create_backend(backend: str, path: Optional[str] = None):
+    """构造单个向量存储，path为None时使用配置中的默认路径"""
+    backend = backend.lower()
+    
+    if backend == "chroma":
+        from app.services.chroma_vector_store import ChromaVectorStore
+        return ChromaVectorStore(db_path=path)
+    if backend == "numpy":
+        from app.services.numpy_vector_store import NumpyVectorStore
+        return NumpyVectorStore(index_path=path)
+    if backend == "ivf":
+        from app.services.ivf_vector_store import IVFVectorStore
+        return IVFVectorStore(index_path=path)
+    if backend == "hnsw":
+        from app.services.hnsw_vector_store import HNSWVectorStore
+        return HNSWVectorStore(index_path=path)
+    if backend == "binary":
+        from app.services.binary_vector_store import BinaryVectorStore
+        return BinaryVectorStore(index_path=path)
+    
+    raise ValueError(f"不支持的向量存储后端: {backend}")
+
+
+def create_sharded(backend: str, root: str, shard_count: int, routing: str):
+    """在root目录下构造分片存储，每个分片是一个独立的后端实例"""
+    from app.services.sharded_vector_store import ShardedVectorStore
+    return ShardedVectorStore.open(root, shard_count, routing, lambda path: create_backend(backend, path))
+
+
+def _create_vector_store():
+    backend = settings.vector_store_backend.lower()
+    if settings.shard_count > 1:
+        return create_sharded(backend, backend_root(backend), settings.shard_count, settings.shard_routing)
+    return create_backend(backend)
+
+
+vector_store = LazyService("vector_store", _create_vector_store)
@@ -0,0 +1,158 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceNotReadyError(RuntimeError):
+    """服务在等待时间内未能就绪"""
+
+
+class LazyService:
+    """
+    延迟构造的服务代理
+    首次访问属性时才构造实际对象（或由后台线程提前构造），属性访问透明转发到实际对象
+    异步等待方登记一个future，由加载线程完成后通过 call_soon_threadsafe 唤醒，等待期间不占用线程
+    """
+
+    # 所有延迟服务，按名称注册，用于后台加载和健康检查
+    registry: Dict[str, "LazyService"] = {}
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self._name = name
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+        self._state = "pending"
+        self._error: Optional[str] = None
+        self._load_seconds: Optional[float] = None
+        # 等待就绪的 (事件循环, future)，以及后台加载线程；由 _waiters_lock 保护
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._waiters_lock = threading.Lock()
+        self._loader: Optional[threading.Thread] = None
+        LazyService.registry[name] = self
+
+    def get_instance(self) -> Any:
+        """获取实际对象，必要时在当前线程构造；其他线程正在构造时阻塞等待"""
+        instance = self._instance
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            if self._instance is not None:
+                return self._instance
+
+            self._state = "loading"
+            started = time.perf_counter()
+            logger.info(f"开始加载服务: {self._name}")
+            try:
+                instance = self._factory()
+            except Exception as e:
+                self._state = "failed"
+                self._error = str(e)
+                logger.error(f"加载服务 {self._name} 失败: {e}")
+                self._notify_waiters(None, e)
+                raise
+
+            self._load_seconds = time.perf_counter() - started
+            self._instance = instance
+            self._state = "ready"
+            self._error = None
+            logger.info(f"服务 {self._name} 加载完成，耗时: {self._load_seconds:.2f}秒")
+            self._notify_waiters(instance, None)
+            return instance
+
+    def _notify_waiters(self, instance: Any, error: Optional[Exception]):
+        """在各等待方的事件循环中完成其future"""
+        with self._waiters_lock:
+            waiters, self._waiters = self._waiters, []
+            # 加载已结束：之后的等待方（如上次失败）可以启动新的加载线程
+            self._loader = None
+
+        def _resolve(future: asyncio.Future):
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(instance)
+
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                pass  # 事件循环已关闭
+
+    def __getattr__(self, item: str) -> Any:
+        # 只有代理自身没有的属性才会进入这里
+        if item.startswith("__"):
+            raise AttributeError(item)
+        return getattr(self.get_instance(), item)
+
+    def is_ready(self) -> bool:
+        return self._instance is not None
+
+    def load_in_background(self):
+        """在后台线程中构造实际对象，已就绪或已有加载线程时不重复启动"""
+        def _load():
+            try:
+                self.get_instance()
+            except Exception:
+                pass  # 错误已记录在状态中，后续访问时会重试
+
+        with self._waiters_lock:
+            if self._instance is not None or self._loader is not None:
+                return
+            self._loader = threading.Thread(target=_load, name=f"load-{self._name}", daemon=True)
+            self._loader.start()
+
+    async def wait_ready(self, timeout: Optional[float] = None) -> Any:
+        """异步等待服务就绪，不阻塞事件循环：登记future后由加载线程唤醒，尚未开始（或上次失败）时启动后台加载"""
+        if self._instance is not None:
+            return self._instance
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._waiters_lock:
+            if self._instance is not None:
+                return self._instance
+            waiter = (loop, future)
+            self._waiters.append(waiter)
+        self.load_in_background()
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise ServiceNotReadyError(f"服务 {self._name} 尚未就绪")
+        except Exception as e:
+            raise ServiceNotReadyError(f"服务 {self._name} 加载失败: {e}")
+        finally:
+            with self._waiters_lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "state": self._state,
+            "error": self._error,
+            "load_seconds": round(self._load_seconds, 3) if self._load_seconds is not None else None,
+        }
+
+
+def load_all_in_background():
+    """后台加载所有已注册的服务"""
+    for service in list(LazyService.registry.values()):
+        service.load_in_background()
+
+
+async def wait_for_services(*services: LazyService, timeout: Optional[float] = None):
+    """等待多个服务全部就绪"""
+    await asyncio.gather(*(service.wait_ready(timeout) for service in services))
+
+
+def get_services_status() -> Dict[str, Dict[str, Any]]:
+    """获取所有已注册服务的状态"""
+    return {name: service.get_status() for name, service in list(LazyService.registry.items())}
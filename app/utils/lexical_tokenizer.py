@@ -0,0 +1,29 @@
+from typing import List
+import re
+
+# 中日韩文字：没有空格分词，按相邻两字切分（单字成词时保留单字）
+_CJK_RUN = r"[㐀-䶿一-鿿豈-﫿぀-ヿ가-힯]+"
+# 拉丁字母和数字组成的标识符，允许内部的 - _ . / 连接（如 E-1001、v2.3.1、ERR_TIMEOUT）
+_IDENTIFIER = r"[0-9a-z]+(?:[-_./][0-9a-z]+)*"
+_TOKEN_PATTERN = re.compile(f"({_CJK_RUN})|({_IDENTIFIER})")
+_IDENTIFIER_PARTS = re.compile(r"[-_./]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    面向BM25的分词：英文和数字按标识符切分并转小写，带连接符的标识符同时保留整体和各部分，
+    中日韩文字切分为相邻两字的二元组，使错误码、型号和产品名可以精确匹配
+    """
+    tokens = []
+    for cjk, identifier in _TOKEN_PATTERN.findall(text.lower()):
+        if cjk:
+            if len(cjk) == 1:
+                tokens.append(cjk)
+            else:
+                tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+        else:
+            tokens.append(identifier)
+            parts = _IDENTIFIER_PARTS.split(identifier)
+            if len(parts) > 1:
+                tokens.extend(parts)
+    return tokens
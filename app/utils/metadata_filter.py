@@ -0,0 +1,147 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import json
+import numpy as np
+
+# 解析后的过滤条件：字段 → 可接受的取值列表；不同字段之间为“且”，同一字段的多个取值为“或”
+Filters = Dict[str, List[Any]]
+
+_SCALAR_TYPES = (str, int, float, bool)
+
+
+def parse_filters(filters: Optional[Dict[str, Any]], allowed_fields: Optional[Iterable[str]] = None) -> Optional[Filters]:
+    """
+    校验并规范化过滤表达式（对已规范化的条件再次调用结果不变）
+
+    支持 {"字段": 值} 和 {"字段": [值1, 值2]}（任一取值匹配），多个字段同时满足
+    """
+    if not filters:
+        return None
+
+    allowed = set(allowed_fields) if allowed_fields is not None else None
+    parsed: Filters = {}
+    for field, value in filters.items():
+        if allowed is not None and field not in allowed:
+            raise ValueError(f"字段 {field} 不支持过滤，可用字段: {sorted(allowed)}")
+
+        values = value if isinstance(value, list) else [value]
+        if not values:
+            raise ValueError(f"字段 {field} 的过滤取值不能为空")
+        for item in values:
+            if not isinstance(item, _SCALAR_TYPES):
+                raise ValueError(f"字段 {field} 的过滤取值必须是字符串、数字或布尔值")
+        parsed[field] = values
+    return parsed
+
+
+def to_chroma_where(filters: Optional[Filters]) -> Optional[Dict[str, Any]]:
+    """转换为ChromaDB的where条件"""
+    filters = parse_filters(filters)
+    if not filters:
+        return None
+    clauses = [
+        {field: values[0]} if len(values) == 1 else {field: {"$in": values}}
+        for field, values in filters.items()
+    ]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def to_mongo_filter(filters: Optional[Filters], prefix: str = "metadata.") -> Optional[Dict[str, Any]]:
+    """转换为MongoDB的查询条件"""
+    filters = parse_filters(filters)
+    if not filters:
+        return None
+    return {prefix + field: {"$in": values} for field, values in filters.items()}
+
+
+def matches_filters(metadata: Optional[Dict[str, Any]], filters: Optional[Filters]) -> bool:
+    """
+    在内存中判断单个文档的元数据是否满足过滤条件（与元数据索引和向量检索的过滤语义一致）
+
+    列表类型的字段按元素匹配：任一元素等于某个过滤取值即满足该字段
+    """
+    if not filters:
+        return True
+    metadata = metadata or {}
+    for field, values in filters.items():
+        if metadata.get(field) is None:
+            return False
+        wanted = {_value_key(value) for value in values}
+        if wanted.isdisjoint(_item_keys(metadata[field])):
+            return False
+    return True
+
+
+def _value_key(value: Any) -> str:
+    # 用JSON表示区分 1、"1" 和 true
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _item_keys(value: Any) -> List[str]:
+    """字段取值展开成可过滤的元素键（列表按元素展开、去重，非标量元素忽略）"""
+    items = value if isinstance(value, list) else [value]
+    return list(dict.fromkeys(_value_key(item) for item in items if isinstance(item, _SCALAR_TYPES)))
+
+
+class MetadataIndex:
+    """
+    元数据二级索引
+    每个 (字段, 取值) 对应一个按行号递增的倒排列表（行只追加），
+    过滤时对各字段的行号集合求交，得到向量打分前的候选行
+    """
+
+    def __init__(self, fields: Iterable[str]):
+        self.fields = set(fields)
+        self._postings: Dict[Tuple[str, str], List[int]] = {}
+        # 倒排列表转换成数组的缓存，列表增长后只转换新增部分
+        self._arrays: Dict[Tuple[str, str], np.ndarray] = {}
+
+    def add(self, row: int, metadata: Optional[Dict[str, Any]]):
+        """登记一行的元数据"""
+        if not metadata:
+            return
+        for field in self.fields:
+            value = metadata.get(field)
+            if value is None:
+                continue
+            # 列表字段中重复的取值只登记一次，保证倒排列表中行号唯一
+            for key in _item_keys(value):
+                self._postings.setdefault((field, key), []).append(row)
+
+    def rows(self, field: str, value: Any) -> np.ndarray:
+        """获取某个取值的全部行号（递增）"""
+        key = (field, _value_key(value))
+        posting = self._postings.get(key)
+        if not posting:
+            return np.empty(0, dtype=np.int64)
+
+        cached = self._arrays.get(key)
+        if cached is None or len(cached) < len(posting):
+            tail = np.asarray(posting[len(cached) if cached is not None else 0:], dtype=np.int64)
+            cached = tail if cached is None else np.concatenate([cached, tail])
+            self._arrays[key] = cached
+        return cached
+
+    def candidate_rows(self, filters: Filters) -> np.ndarray:
+        """返回满足全部过滤条件的行号（递增）"""
+        per_field = []
+        for field, values in parse_filters(filters).items():
+            if field not in self.fields:
+                raise ValueError(f"字段 {field} 未建立元数据索引")
+            parts = [self.rows(field, value) for value in values]
+            per_field.append(parts[0] if len(parts) == 1 else np.unique(np.concatenate(parts)))
+
+        # 从最小的集合开始求交
+        per_field.sort(key=len)
+        result = per_field[0]
+        for rows in per_field[1:]:
+            if len(result) == 0:
+                break
+            result = np.intersect1d(result, rows, assume_unique=True)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "fields": sorted(self.fields),
+            "keys": len(self._postings),
+            "postings": sum(len(posting) for posting in self._postings.values()),
+        }
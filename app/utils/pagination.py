@@ -0,0 +1,42 @@
+from typing import Any, Dict, Optional
+import base64
+import json
+
+
+class InvalidCursorError(ValueError):
+    """分页游标无法解析"""
+
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    """将后端内部的分页位置编码为不透明的游标字符串"""
+    raw = json.dumps(position, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Dict[str, Any]:
+    """解析游标；为空时返回空位置（从头开始）"""
+    if not cursor:
+        return {}
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise InvalidCursorError(f"无效的分页游标: {cursor}")
+    if not isinstance(position, dict):
+        raise InvalidCursorError(f"无效的分页游标: {cursor}")
+    return position
+
+
+def cursor_index(position: Dict[str, Any], key: str, cursor: Optional[str]) -> int:
+    """读取游标位置中的非负整数字段（行号、偏移量等），缺失时为0，类型或取值不合法时抛出InvalidCursorError"""
+    value = position.get(key, 0)
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise InvalidCursorError(f"无效的分页游标: {cursor}")
+    return value
+
+
+def content_preview(content: str, max_chars: int) -> str:
+    """截取内容预览"""
+    if len(content) <= max_chars:
+        return content
+    return content[:max_chars] + "..."
@@ -0,0 +1,150 @@
+from app.config.settings import settings
+from app.models.document_models import Document, SearchResult
+from app.utils.vector_ops import ArrayLike, as_float32_matrix, mmr_select, normalize_rows, prepare_query
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+
+def filter_by_score(documents: List[Document], min_score: Optional[float] = None) -> List[Document]:
+    """丢弃相似度低于阈值的文档；min_score为None时使用配置的默认阈值，没有分数的文档保留"""
+    threshold = settings.min_relevance_score if min_score is None else min_score
+    return [doc for doc in documents if doc.score is None or doc.score >= threshold]
+
+
+def mmr_candidate_count(top_k: int) -> int:
+    """MMR选择前召回的候选数"""
+    return top_k * max(1, settings.mmr_candidate_factor)
+
+
+def mmr_documents(
+    query_embedding: ArrayLike,
+    documents: List[Document],
+    top_k: int,
+    lambda_mult: float,
+    keep_embeddings: bool = False,
+    ranked: bool = False
+) -> List[Document]:
+    """
+    按文档自带的嵌入向量做MMR选择（用于无法直接访问向量矩阵的后端，或融合、重排之后的候选），默认去掉返回文档的嵌入向量
+    ranked 为True时documents已按最终相关度排序（如融合或重排的结果）：相关度沿用余弦相似度的取值范围，
+    但按documents的顺序分配，排名靠前的文档相关度更高
+    """
+    documents = [doc for doc in documents if doc.embedding is not None]
+    if not documents:
+        return []
+    candidates = normalize_rows(as_float32_matrix([doc.embedding for doc in documents]).copy())
+    query = prepare_query(query_embedding, candidates.shape[1])
+    relevance = -np.sort(-(candidates @ query)) if ranked else None
+    selected = [documents[i] for i in mmr_select(query, candidates, top_k, lambda_mult, relevance)]
+    return selected if keep_embeddings else [doc.model_copy(update={"embedding": None}) for doc in selected]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: Optional[int] = None) -> List[str]:
+    """
+    倒数排名融合：每个文档的得分为其在各路排序中 1/(k+排名) 之和，按得分降序返回文档ID
+    只使用排名，不需要把余弦相似度和BM25分数归一化到同一尺度
+    """
+    k = settings.rrf_k if k is None else k
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    # 同分时保持首次出现的顺序（先传入的一路优先）
+    return sorted(scores, key=lambda doc_id: -scores[doc_id])
+
+
+def join_overlapping(previous: str, following: str, min_overlap: int = 8) -> str:
+    """
+    拼接相邻块：去掉后一块开头与前一块结尾重复的部分（分块时加入的重叠），
+    找不到至少min_overlap个字符的重叠时换行拼接，避免偶然相同的个别字符被去掉
+    """
+    for size in range(min(len(previous), len(following)), min_overlap - 1, -1):
+        if previous.endswith(following[:size]):
+            return previous + following[size:]
+    return previous + "\n" + following
+
+
+def expand_neighbors(
+    hits: List[Document],
+    fetch_chunks: Callable[[List[Tuple[str, int]]], List[Document]],
+    window: int
+) -> List[Document]:
+    """
+    将每个命中块扩展为同一文件中前后各window个相邻块，所有缺失的相邻块通过一次 fetch_chunks 批量取回
+    同一文件中连续的块（相邻命中的扩展范围重叠或相接）合并为一个文档，文本不重复；
+    合并后的文档沿用其中排名最高的命中块的ID和分数，按该命中块的排名排序，
+    metadata["chunk_ids"] 记录合并的全部块的ID（按块序号）
+    没有 source_file / chunk_index 元数据的命中块原样保留
+    """
+    if window <= 0 or not hits:
+        return hits
+
+    chunks: Dict[str, Dict[int, Document]] = {}
+    best_rank: Dict[Tuple[str, int], int] = {}
+    wanted = []
+    merged: List[Tuple[int, Document]] = []
+    for rank, doc in enumerate(hits):
+        metadata = doc.metadata or {}
+        source_file, chunk_index = metadata.get("source_file"), metadata.get("chunk_index")
+        if source_file is None or not isinstance(chunk_index, int):
+            merged.append((rank, doc))
+            continue
+        chunks.setdefault(source_file, {}).setdefault(chunk_index, doc)
+        best_rank.setdefault((source_file, chunk_index), rank)
+        last = chunk_index + window
+        if isinstance(metadata.get("total_chunks"), int):
+            last = min(last, metadata["total_chunks"] - 1)
+        wanted.extend((source_file, i) for i in range(max(0, chunk_index - window), last + 1))
+
+    missing = [key for key in dict.fromkeys(wanted) if key[1] not in chunks.get(key[0], {})]
+    for doc in fetch_chunks(missing) if missing else []:
+        chunks[doc.metadata["source_file"]].setdefault(doc.metadata["chunk_index"], doc)
+    wanted_keys = set(wanted)
+
+    # 每个文件中按块序号找出连续的段，只保留包含命中块的段
+    for source_file, by_index in chunks.items():
+        run: List[int] = []
+        for chunk_index in sorted(by_index) + [None]:
+            if chunk_index is not None and (source_file, chunk_index) in wanted_keys and (not run or chunk_index == run[-1] + 1):
+                run.append(chunk_index)
+                continue
+            ranks = [best_rank[(source_file, i)] for i in run if (source_file, i) in best_rank]
+            if ranks:
+                top = hits[min(ranks)]
+                content = by_index[run[0]].content
+                for i in run[1:]:
+                    content = join_overlapping(content, by_index[i].content)
+                metadata = {
+                    **(top.metadata or {}),
+                    "chunk_range": [run[0], run[-1]],
+                    "chunk_ids": [by_index[i].id for i in run]
+                }
+                merged.append((min(ranks), top.model_copy(update={"content": content, "metadata": metadata})))
+            run = [chunk_index] if chunk_index is not None and (source_file, chunk_index) in wanted_keys else []
+
+    return [doc for _, doc in sorted(merged, key=lambda item: item[0])]
+
+
+def source_chunk_ids(documents: List[Document]) -> List[str]:
+    """文档引用的全部文档块ID：相邻块合并的文档展开为其中每个块的ID"""
+    return [
+        chunk_id
+        for doc in documents
+        for chunk_id in (doc.metadata or {}).get("chunk_ids", [doc.id])
+        if chunk_id
+    ]
+
+
+def to_search_results(documents: List[Document]) -> List[SearchResult]:
+    """将检索到的文档转换为带分数和排名的检索结果"""
+    return [
+        SearchResult(
+            document_id=doc.id or "",
+            content=doc.content,
+            metadata=doc.metadata or {},
+            score=round(doc.score, 4) if doc.score is not None else 0.0,
+            rank=rank + 1,
+            rerank_score=round(doc.rerank_score, 4) if doc.rerank_score is not None else None
+        )
+        for rank, doc in enumerate(documents)
+    ]
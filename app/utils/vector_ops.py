@@ -0,0 +1,134 @@
+import numpy as np
+from typing import List, Optional, Sequence, Union
+
+ArrayLike = Union[np.ndarray, Sequence[float], Sequence[Sequence[float]]]
+
+
+def as_float32_matrix(vectors: ArrayLike) -> np.ndarray:
+    """将向量或向量列表转换为连续的二维float32矩阵"""
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    return matrix
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """按行做L2归一化（原地操作），零向量保持不变"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def fit_dimension(matrix: np.ndarray, dimension: int) -> np.ndarray:
+    """将矩阵列数截断或零填充到指定维度"""
+    if matrix.shape[1] == dimension:
+        return matrix
+    fitted = np.zeros((matrix.shape[0], dimension), dtype=np.float32)
+    cols = min(matrix.shape[1], dimension)
+    fitted[:, :cols] = matrix[:, :cols]
+    return fitted
+
+
+def iter_batches(items: List, batch_size: int):
+    """按批次大小切分列表，返回 (起始位置, 批次) 迭代器"""
+    batch_size = max(1, batch_size)
+    for start in range(0, len(items), batch_size):
+        yield start, items[start:start + batch_size]
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """返回分数最高的k个位置（按分数降序），使用argpartition避免全排序"""
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(n)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def prepare_query(query_embedding: ArrayLike, dimension: int) -> np.ndarray:
+    """将查询向量转换为指定维度、L2归一化的一维float32向量"""
+    query = fit_dimension(as_float32_matrix(query_embedding), dimension)
+    return normalize_rows(query)[0]
+
+
+# 检索召回/延迟提示 -> 搜索宽度（nprobe、ef_search、候选数等）的倍数
+RECALL_HINT_MULTIPLIERS = {
+    "fast": 0.5,
+    "balanced": 1.0,
+    "accurate": 4.0,
+}
+
+
+def recall_multiplier(recall_hint: Optional[str]) -> float:
+    """将召回提示转换为搜索宽度倍数，未指定时为1"""
+    if not recall_hint:
+        return 1.0
+    return RECALL_HINT_MULTIPLIERS.get(recall_hint, 1.0)
+
+
+_POPCOUNT_M1 = np.uint64(0x5555555555555555)
+_POPCOUNT_M2 = np.uint64(0x3333333333333333)
+_POPCOUNT_M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+_POPCOUNT_H01 = np.uint64(0x0101010101010101)
+
+
+def popcount64(x: np.ndarray) -> np.ndarray:
+    """按元素统计uint64数组中置位的比特数"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    # SWAR算法（numpy < 2.0 没有 bitwise_count）
+    x = x - ((x >> np.uint64(1)) & _POPCOUNT_M1)
+    x = (x & _POPCOUNT_M2) + ((x >> np.uint64(2)) & _POPCOUNT_M2)
+    x = (x + (x >> np.uint64(4))) & _POPCOUNT_M4
+    return (x * _POPCOUNT_H01) >> np.uint64(56)
+
+
+def binary_codes(vectors: np.ndarray) -> np.ndarray:
+    """将向量按符号位量化为打包的比特码，每行补齐到8字节的整数倍以便按uint64计算"""
+    codes = np.packbits(vectors > 0, axis=1)
+    padding = (-codes.shape[1]) % 8
+    if padding:
+        codes = np.pad(codes, ((0, 0), (0, padding)))
+    return np.ascontiguousarray(codes)
+
+
+def hamming_distances(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    """计算每行比特码与查询比特码的汉明距离"""
+    words = codes.view(np.uint64)
+    query_words = query_code.view(np.uint64)
+    return popcount64(np.bitwise_xor(words, query_words)).sum(axis=1, dtype=np.int32)
+
+
+def mmr_select(query: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float, relevance: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    最大边际相关（MMR）贪心选择，返回被选中候选的位置（按选择顺序）
+    每一步选择 lambda*相关度 - (1-lambda)*与已选候选的最大相似度 最高的候选；
+    相关度默认为与查询的相似度，也可由调用方给出（如按融合或重排后的顺序）
+    候选之间的相似度矩阵只计算一次，与已选集合的最大相似度逐步增量更新
+    query 和 candidates 需已L2归一化
+    """
+    n = candidates.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    if relevance is None:
+        relevance = candidates @ query
+    similarity = candidates @ candidates.T
+    selected = np.empty(k, dtype=np.int64)
+    selected[0] = int(np.argmax(relevance))
+    max_similarity = similarity[selected[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    for i in range(1, k):
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        selected[i] = int(np.argmax(scores))
+        available[selected[i]] = False
+        np.maximum(max_similarity, similarity[selected[i]], out=max_similarity)
+    return selected
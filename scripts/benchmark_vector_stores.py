@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+向量存储后端基准测试
+用合成的聚簇向量比较各后端的构建时间、查询延迟和相对精确搜索的召回率
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.config.settings import settings
+from app.models.document_models import DocumentCreate
+
+
+def make_dataset(count: int, dimension: int, clusters: int, queries: int, seed: int = 0):
+    """生成聚簇分布的归一化向量（比纯随机向量更接近真实嵌入），查询取自数据附近"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, count)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((count, dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    picks = rng.choice(count, queries, replace=False)
+    noise = rng.standard_normal((queries, dimension)).astype(np.float32) / np.sqrt(dimension)
+    query_vectors = vectors[picks] + 0.3 * noise
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    return vectors, query_vectors
+
+
+def build_store(backend: str, path: str, dimension: int):
+    if backend == "chroma":
+        from app.services.chroma_vector_store import ChromaVectorStore
+        return ChromaVectorStore(db_path=path)
+    if backend == "numpy":
+        from app.services.numpy_vector_store import NumpyVectorStore
+        return NumpyVectorStore(index_path=path, dimension=dimension)
+    if backend == "ivf":
+        from app.services.ivf_vector_store import IVFVectorStore
+        return IVFVectorStore(index_path=path, dimension=dimension)
+    if backend == "hnsw":
+        from app.services.hnsw_vector_store import HNSWVectorStore
+        return HNSWVectorStore(index_path=path, dimension=dimension)
+    if backend == "binary":
+        from app.services.binary_vector_store import BinaryVectorStore
+        return BinaryVectorStore(index_path=path, dimension=dimension)
+    raise ValueError(f"不支持的向量存储后端: {backend}")
+
+
+def insert_all(store, backend: str, documents, vectors, batch_size: int = 1000):
+    store.insert_documents(documents, vectors, batch_size=batch_size)
+    if backend == "ivf":
+        store.train()
+
+
+def benchmark_backend(backend: str, vectors, query_vectors, truth, top_k: int, recall_hint):
+    documents = [DocumentCreate(content=str(i), metadata={"row": i}) for i in range(len(vectors))]
+
+    with tempfile.TemporaryDirectory() as path:
+        started = time.perf_counter()
+        store = build_store(backend, path, vectors.shape[1])
+        insert_all(store, backend, documents, vectors)
+        build_seconds = time.perf_counter() - started
+
+        latencies = []
+        hits = 0
+        for query, expected in zip(query_vectors, truth):
+            started = time.perf_counter()
+            if backend == "chroma":
+                results = store.similarity_search(query.tolist(), top_k=top_k)
+            else:
+                results = store.similarity_search(query.tolist(), top_k=top_k, recall_hint=recall_hint)
+            latencies.append(time.perf_counter() - started)
+            found = {int(doc.content) for doc in results}
+            hits += len(found & set(expected.tolist()))
+
+        stats = store.get_index_stats() if hasattr(store, "get_index_stats") else {}
+
+    latencies = np.array(latencies) * 1000.0
+    return {
+        "build_seconds": build_seconds,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "recall": hits / (len(query_vectors) * top_k),
+        "stats": stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量存储后端基准测试")
+    parser.add_argument("--count", type=int, default=20000, help="向量数量")
+    parser.add_argument("--dimension", type=int, default=settings.vector_dimension, help="向量维度")
+    parser.add_argument("--clusters", type=int, default=100, help="合成数据的簇数量")
+    parser.add_argument("--queries", type=int, default=200, help="查询数量")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--recall-hint", choices=["fast", "balanced", "accurate"], default=None)
+    parser.add_argument("--backends", default="chroma,numpy,binary", help="逗号分隔的后端列表")
+    args = parser.parse_args()
+
+    print("📊 向量存储基准测试")
+    print(f"   向量: {args.count} x {args.dimension}，查询: {args.queries}，top_k: {args.top_k}")
+    print("=" * 60)
+
+    vectors, query_vectors = make_dataset(args.count, args.dimension, args.clusters, args.queries)
+    # 精确搜索的结果作为召回率的基准
+    truth = np.argsort(-(query_vectors @ vectors.T), axis=1)[:, :args.top_k]
+
+    for backend in [name.strip() for name in args.backends.split(",") if name.strip()]:
+        try:
+            result = benchmark_backend(backend, vectors, query_vectors, truth, args.top_k, args.recall_hint)
+        except ImportError as e:
+            print(f"⚠️  {backend}: 依赖不可用，跳过 ({e})")
+            continue
+        except Exception as e:
+            print(f"❌ {backend}: 异常 - {e}")
+            continue
+
+        print(f"✅ {backend}")
+        print(f"   构建: {result['build_seconds']:.2f}秒")
+        print(f"   查询延迟: p50 {result['p50_ms']:.3f}ms, p95 {result['p95_ms']:.3f}ms")
+        print(f"   召回率@{args.top_k}: {result['recall']:.3f}")
+        if result["stats"]:
+            print(f"   索引状态: {result['stats']}")
+        print("-" * 40)
+
+
+if __name__ == "__main__":
+    main()
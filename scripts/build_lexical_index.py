@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+由向量存储中的全部文档重建BM25倒排索引（已有知识库首次启用混合检索，或索引损坏时使用）
+"""
+
+import os
+import sys
+import time
+import logging
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.lexical_index import lexical_index
+from app.services.vector_store import vector_store
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    start_time = time.time()
+    count = lexical_index.rebuild(vector_store.iter_records())
+    stats = lexical_index.get_stats()
+    print(f"✅ BM25索引重建完成: {count} 个文档，{stats['terms']} 个词项，{stats['postings']} 条倒排记录")
+    print(f"   耗时: {time.time() - start_time:.2f}秒")
+
+
+if __name__ == "__main__":
+    main()
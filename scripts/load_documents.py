@@ -13,8 +13,13 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.services.vector_store import vector_store
 from app.services.embedding_service import embedding_service
+from app.services.simple_embedding_service import simple_embedding_service
+from app.services.lexical_index import lexical_index
+from app.services.near_duplicate_index import NearDuplicateIndex
 from app.utils.text_processor import text_processor
 from app.models.document_models import DocumentCreate
+from app.config.settings import settings
+from app.utils.vector_ops import iter_batches
 import time
 
 logging.basicConfig(level=logging.INFO)
@@ -80,6 +85,8 @@ def load_documents_from_directory(directory: str):
     total_chunks = 0
     successful_chunks = 0
     
+    # 先解析并分块所有文件，便于简单嵌入服务一次性更新TF-IDF
+    file_chunks = []
     for file_path in all_files:
         logger.info(f"处理文件: {file_path.name}")
         
@@ -97,13 +104,16 @@ def load_documents_from_directory(directory: str):
         
         # 文本分块处理
         chunks = text_processor.process_document(content)
-        
+        file_chunks.append((file_path, chunks))
+    
+    documents = []
+    for file_path, chunks in file_chunks:
         # 将每个块作为独立文档存储
         for i, chunk in enumerate(chunks):
             if not chunk.strip():
                 continue
                 
-            document = DocumentCreate(
+            documents.append(DocumentCreate(
                 content=chunk,
                 metadata={
                     "source_file": file_path.name,
@@ -111,25 +121,51 @@ def load_documents_from_directory(directory: str):
                     "total_chunks": len(chunks),
                     "file_type": file_path.suffix.lower()
                 }
-            )
-            
-            try:
-                # 生成嵌入并存储
-                embedding = embedding_service.get_embedding(chunk)
-                doc_id = vector_store.insert_document(document, embedding)
-                
-                total_chunks += 1
-                successful_chunks += 1
-                
-                if total_chunks % 5 == 0:
-                    logger.info(f"已处理 {total_chunks} 个文档块...")
-                    
-            except Exception as e:
-                logger.error(f"处理文档块失败: {e}")
-                total_chunks += 1
+            ))
         
         logger.info(f"文件 {file_path.name} 处理完成，生成 {len(chunks)} 个文档块")
     
+    # 嵌入之前跳过与已入库块（或本次较早的块）近重复的块，节省嵌入计算和索引空间
+    dedup_index = None
+    ids = None
+    if settings.dedup_enabled:
+        dedup_index = NearDuplicateIndex()
+        documents, ids, report = dedup_index.filter_duplicates(documents)
+        logger.info(
+            f"近重复检测: 检查 {report['checked']} 个块，跳过 {report['duplicates']} 个"
+            f"（{report['duplicate_ratio']:.1%}），节省 {report['saved_chars']} 个字符"
+        )
+    
+    # 使用简单嵌入服务时，先用新增块增量更新TF-IDF（未拟合时从头拟合），保证入库向量与查询向量一致
+    if embedding_service.use_simple:
+        simple_embedding_service.partial_fit([document.content for document in documents])
+    
+    # 按批生成嵌入并批量写入，每批一次模型前向计算和一次存储写入
+    failed_ids = []
+    for start, batch in iter_batches(documents, settings.insert_batch_size):
+        batch_ids = ids[start:start + len(batch)] if ids else None
+        try:
+            embeddings = embedding_service.get_embeddings_batch([document.content for document in batch])
+            result = vector_store.insert_documents(batch, embeddings, ids=batch_ids)
+            successful_chunks += result.inserted_count
+            lexical_index.add_documents(result.ids, batch)
+            for error in result.errors:
+                source_file = batch[error.index].metadata.get("source_file")
+                logger.error(f"处理文档块失败（{source_file}）: {error.error}")
+                if batch_ids:
+                    failed_ids.append(batch_ids[error.index])
+        except Exception as e:
+            logger.error(f"处理文档块批次失败: {e}")
+            failed_ids.extend(batch_ids or [])
+        
+        total_chunks += len(batch)
+        logger.info(f"已处理 {total_chunks}/{len(documents)} 个文档块...")
+    
+    # 写入失败的块不能作为之后去重的原件
+    if dedup_index is not None:
+        dedup_index.remove(failed_ids)
+        dedup_index.save()
+    
     logger.info(f"文档加载完成！共处理 {len(all_files)} 个文件，成功加载 {successful_chunks}/{total_chunks} 个文档块")
 
 def main():
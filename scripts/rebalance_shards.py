@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+重新分片脚本
+将当前后端目录中的全部文档和向量（保留原ID，无需重新嵌入）迁移到新的分片布局，完成后原子切换目录
+运行前请停止API服务；完成后将 SHARD_COUNT / SHARD_ROUTING 改为新值再启动
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.config.settings import settings
+from app.services.sharded_vector_store import ShardedVectorStore, copy_records, read_manifest
+from app.services.vector_store import backend_root, create_backend, create_sharded
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def open_layout(backend: str, root: str, shard_count: int, routing: str):
+    if shard_count > 1:
+        return create_sharded(backend, root, shard_count, routing)
+    return create_backend(backend, root)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量存储重新分片")
+    parser.add_argument("--backend", default=settings.vector_store_backend, help="向量存储后端")
+    parser.add_argument("--shards", type=int, required=True, help="新的分片数（1表示合并为单个存储）")
+    parser.add_argument("--routing", default=settings.shard_routing, choices=ShardedVectorStore.ROUTINGS, help="新的路由方式")
+    parser.add_argument("--batch-size", type=int, default=settings.insert_batch_size)
+    parser.add_argument("--keep-backup", action="store_true", help="保留原目录的备份")
+    args = parser.parse_args()
+
+    backend = args.backend.lower()
+    root = os.path.abspath(backend_root(backend))
+    manifest = read_manifest(root) or {"shard_count": 1, "routing": args.routing}
+    if manifest["shard_count"] == args.shards and manifest["routing"] == args.routing:
+        print(f"✅ {root} 已经是 {args.shards} 个分片（{args.routing}），无需重新分片")
+        return
+
+    target_root = root + ".rebalance"
+    if os.path.exists(target_root):
+        shutil.rmtree(target_root)
+
+    print(f"🔄 重新分片: {manifest['shard_count']} 个分片（{manifest['routing']}） -> {args.shards} 个分片（{args.routing}）")
+    start_time = time.time()
+    source = open_layout(backend, root, manifest["shard_count"], manifest["routing"])
+    target = open_layout(backend, target_root, args.shards, args.routing)
+
+    expected = source.get_document_count()
+    copied, failed = copy_records(source, target, args.batch_size)
+    if failed or target.get_document_count() != expected:
+        print(f"❌ 迁移不完整: 源 {expected} 个文档，成功 {copied}，失败 {failed}；原目录未改动，新布局保留在 {target_root}")
+        sys.exit(1)
+
+    # HNSW等需要显式保存的索引在切换前落盘
+    for store in getattr(target, "shards", [target]):
+        if hasattr(store, "save_graph"):
+            store.save_graph()
+    del source, target
+
+    backup_root = f"{root}.bak-{int(time.time())}"
+    os.rename(root, backup_root)
+    os.rename(target_root, root)
+    if not args.keep_backup:
+        shutil.rmtree(backup_root)
+
+    print(f"✅ 重新分片完成: {copied} 个文档，耗时 {time.time() - start_time:.2f}秒")
+    if args.keep_backup:
+        print(f"   原目录备份: {backup_root}")
+    print(f"   请设置 SHARD_COUNT={args.shards} SHARD_ROUTING={args.routing} 后重启服务")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+知识库快照导出/导入脚本
+导出: python scripts/snapshot.py export <快照目录>
+导入: python scripts/snapshot.py import <快照目录>   （写入当前配置的向量存储后端，无需重新嵌入）
+校验: python scripts/snapshot.py verify <快照目录>
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.config.settings import settings
+from app.services.snapshot import SnapshotError, export_snapshot, import_snapshot, verify_snapshot
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库快照导出/导入")
+    parser.add_argument("command", choices=["export", "import", "verify"])
+    parser.add_argument("path", help="快照目录")
+    parser.add_argument("--part-size", type=int, default=settings.snapshot_part_size, help="导出时每个分卷的文档数")
+    parser.add_argument("--batch-size", type=int, default=settings.insert_batch_size, help="导入时每批写入的文档数")
+    parser.add_argument("--skip-tfidf-state", action="store_true", help="导入时不恢复TF-IDF状态")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    try:
+        if args.command == "verify":
+            manifest = verify_snapshot(args.path)
+            print(f"✅ 快照校验通过: {manifest['count']} 个文档，{len(manifest['parts'])} 个分卷")
+            print(f"   嵌入模型: {manifest['embedding_model']}，维度: {manifest['dimension']}，创建时间: {manifest['created_at']}")
+            return
+
+        # 只在需要时加载向量存储
+        from app.services.vector_store import vector_store
+
+        if args.command == "export":
+            manifest = export_snapshot(vector_store, args.path, args.part_size)
+            print(f"✅ 快照导出完成: {manifest['count']} 个文档，{len(manifest['parts'])} 个分卷")
+        else:
+            imported, failed = import_snapshot(vector_store, args.path, args.batch_size, not args.skip_tfidf_state)
+            print(f"✅ 快照导入完成: 成功 {imported}，失败 {failed}")
+            # HNSW等需要显式保存的索引在退出前落盘
+            for store in getattr(vector_store.get_instance(), "shards", [vector_store.get_instance()]):
+                if hasattr(store, "save_graph"):
+                    store.save_graph()
+            # 关键词检索的倒排索引由导入后的全部文档重建
+            from app.services.lexical_index import lexical_index
+            print(f"✅ BM25索引重建完成: {lexical_index.rebuild(vector_store.iter_records())} 个文档")
+            if failed:
+                sys.exit(1)
+    except SnapshotError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    print(f"   耗时: {time.time() - start_time:.2f}秒")
+
+
+if __name__ == "__main__":
+    main()
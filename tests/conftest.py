@@ -0,0 +1,111 @@
+import asyncio
+import os
+import sys
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+ROUTE_DIMENSION = 32
+
+
+class FakeEmbeddingService:
+    """按单词哈希到固定维度的确定性嵌入，共享单词越多的文本相似度越高；failing_texts 中的文本得到非有限向量"""
+
+    def __init__(self, dimension: int = ROUTE_DIMENSION):
+        self.dimension = dimension
+        self.calls = 0
+        self.failing_texts = set()
+
+    def get_embeddings_batch(self, texts, batch_size=None) -> np.ndarray:
+        self.calls += 1
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[i, zlib.crc32(word.encode("utf-8")) % self.dimension] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1.0, norms)
+        for i, text in enumerate(texts):
+            if text in self.failing_texts:
+                vectors[i] = np.nan
+        return vectors
+
+    def get_embedding(self, text: str):
+        return self.get_embeddings_batch([text])[0].tolist()
+
+
+class FakeLLMService:
+    """记录调用次数，答案引用第一个上下文文档"""
+
+    def __init__(self):
+        self.questions = []
+
+    async def wait_ready(self, timeout=None):
+        await asyncio.sleep(0)
+
+    def generate_answer(self, question, context_docs):
+        self.questions.append(question)
+        return f"答案: {context_docs[0].content}"
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """
+    在临时目录上组装完整的API：NumPy向量存储、BM25索引、答案缓存和假的嵌入/LLM服务，
+    替换各路由和检索模块引用的全局服务，返回TestClient和各组件
+    """
+    from fastapi.testclient import TestClient
+    from app.config.settings import settings
+    from app.main import app
+    from app.routes import documents, query, search
+    from app.services import retriever
+    from app.services.answer_cache import AnswerCache
+    from app.services.embedding_dispatcher import EmbeddingDispatcher
+    from app.services.lexical_index import LexicalIndex
+    from app.services.numpy_vector_store import NumpyVectorStore
+    from app.utils.lazy_service import LazyService
+
+    monkeypatch.setattr(LazyService, "registry", {})
+    monkeypatch.setattr(settings, "dedup_state_path", str(tmp_path / "dedup_state.json"))
+    monkeypatch.setattr(settings, "min_relevance_score", 0.0)
+
+    store = NumpyVectorStore(index_path=str(tmp_path / "vectors"), dimension=ROUTE_DIMENSION)
+    lexical = LexicalIndex(index_path=str(tmp_path / "lexical"))
+    embedder = FakeEmbeddingService()
+    llm = FakeLLMService()
+    cache = AnswerCache(version_source=lambda: (store.commit_point(), lexical.commit_point()))
+    services = {
+        "vector_store": LazyService("vector_store", lambda: store),
+        "lexical_index": LazyService("lexical_index", lambda: lexical),
+        "embedding_service": LazyService("embedding_service", lambda: embedder),
+        "llm_service": llm,
+        "answer_cache": cache,
+        "embedding_dispatcher": EmbeddingDispatcher(embedder.get_embeddings_batch),
+    }
+    for module in (documents, query, search, retriever):
+        for name, service in services.items():
+            if hasattr(module, name):
+                monkeypatch.setattr(module, name, service)
+
+    # 不进入 with 块：不触发启动事件，避免在后台加载真实的嵌入模型和LLM
+    client = TestClient(app)
+
+    def add_documents(documents):
+        """通过批量接口写入文档，返回文档ID"""
+        response = client.post("/api/v1/documents/batch", json=documents)
+        assert response.status_code == 201
+        return response.json()["ids"]
+
+    return SimpleNamespace(
+        client=client,
+        add_documents=add_documents,
+        store=store,
+        lexical_index=lexical,
+        embedder=embedder,
+        llm=llm,
+        answer_cache=cache
+    )
@@ -0,0 +1,69 @@
+import numpy as np
+
+from app.models.document_models import DocumentCreate
+from app.services.answer_cache import AnswerCache
+from app.services.numpy_vector_store import NumpyVectorStore
+
+DIMENSION = 16
+
+
+def question_vectors(count: int, seed: int = 0) -> np.ndarray:
+    """互不相近的归一化问题向量"""
+    vectors = np.random.default_rng(seed).standard_normal((count, DIMENSION)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class TestAnswerCache:
+    """语义答案缓存测试"""
+
+    def test_similar_questions_hit_until_sources_change(self):
+        cache = AnswerCache(capacity=2, threshold=0.95, ttl_seconds=60)
+        vectors = question_vectors(3)
+        paraphrase = vectors[0] + np.full(DIMENSION, 0.01, dtype=np.float32)
+        cache.put(vectors[0], "top_k=5", {"answer": "重启设备"}, ["c1", "c2"])
+
+        assert cache.get(paraphrase, "top_k=5")["answer"] == "重启设备"
+        assert cache.get(paraphrase, "top_k=3") is None
+        assert cache.get(vectors[1], "top_k=5") is None
+
+        # 来源块删除后失效；开始检索后语料版本变化的答案不保存
+        assert cache.invalidate_chunks(["c2", "c9"]) == 1
+        assert cache.get(vectors[0], "top_k=5") is None
+        version = cache.current_version()
+        cache.bump_version()
+        cache.put(vectors[0], "top_k=5", {"answer": "过期"}, ["c1"], version=version)
+        assert cache.get(vectors[0], "top_k=5") is None
+        # 生成答案期间引用的块被删除时不保存，其他块的删除不影响
+        version = cache.current_version()
+        cache.invalidate_chunks(["c1"])
+        cache.put(vectors[0], "top_k=5", {"answer": "已删除"}, ["c1"], version=version)
+        cache.put(vectors[1], "top_k=5", {"answer": "保留"}, ["c3"], version=version)
+        assert cache.get(vectors[0], "top_k=5") is None
+        assert cache.get(vectors[1], "top_k=5")["answer"] == "保留"
+
+        # 容量已满时替换最久未使用的条目
+        for i in range(3):
+            cache.put(vectors[i], "top_k=5", {"answer": str(i)}, [f"c{i}"])
+        assert cache.get(vectors[0], "top_k=5") is None
+        assert cache.get(vectors[2], "top_k=5")["answer"] == "2"
+        assert cache.get_stats()["entries"] == 2
+
+    def test_other_process_writes_invalidate_entries(self, tmp_path):
+        writer = NumpyVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        reader = NumpyVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        vectors = question_vectors(3, seed=1)
+        documents = [DocumentCreate(content=f"答案来源 {i}") for i in range(3)]
+        ids = writer.insert_documents(documents[:2], vectors[:2]).ids
+        cache = AnswerCache(capacity=4, threshold=0.95, ttl_seconds=60, version_source=reader.commit_point)
+
+        version = cache.current_version()
+        cache.put(vectors[0], "top_k=5", {"answer": "a"}, [ids[0]], version=version)
+        assert cache.get(vectors[0], "top_k=5")["answer"] == "a"
+        # 另一个进程写入或删除后，本进程的条目全部失效，进行中的请求也不再保存
+        writer.insert_documents(documents[2:3], vectors[2:3])
+        assert cache.get(vectors[0], "top_k=5") is None
+        version = cache.current_version()
+        cache.put(vectors[0], "top_k=5", {"answer": "b"}, [ids[0]], version=version)
+        writer.delete_documents([ids[1]])
+        cache.put(vectors[1], "top_k=5", {"answer": "c"}, [ids[0]], version=version)
+        assert cache.get(vectors[0], "top_k=5") is None and cache.get(vectors[1], "top_k=5") is None
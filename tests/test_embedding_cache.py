@@ -0,0 +1,53 @@
+import numpy as np
+
+from app.services.embedding_cache import EmbeddingCache
+
+
+def random_vectors(count: int, dimension: int = 16, seed: int = 0) -> np.ndarray:
+    """生成随机float32向量"""
+    return np.random.default_rng(seed).standard_normal((count, dimension)).astype(np.float32)
+
+
+class TestEmbeddingCache:
+    """两级嵌入缓存测试"""
+    
+    def test_memory_lru_and_disk_tier(self, tmp_path):
+        db_path = str(tmp_path / "embeddings.db")
+        cache = EmbeddingCache(db_path=db_path, max_memory_items=2)
+        assert cache.get("问题 0") is None  # 未设置模型时不缓存
+        cache.set_model("model-a")
+        vectors = random_vectors(3)
+        cache.put_many(["问题 0", "问题 1", "问题 2"], list(vectors))
+        assert cache.get_stats()["memory_items"] == 2
+        assert cache.evictions == 1
+        
+        # 键为规范化文本：首尾和连续空白不影响命中
+        np.testing.assert_array_equal(cache.get("  问题   2 "), vectors[2])
+        assert cache.memory_hits == 1
+        # 被淘汰的条目从磁盘层读回
+        np.testing.assert_array_equal(cache.get("问题 0"), vectors[0])
+        assert cache.disk_hits == 1
+        assert cache.get("问题 3") is None
+        
+        # 新实例（重启或其他worker）共享磁盘层
+        reopened = EmbeddingCache(db_path=db_path, max_memory_items=2)
+        reopened.set_model("model-a")
+        results = reopened.get_many(["问题 1", "问题 1", "问题 9"])
+        np.testing.assert_array_equal(results[1], vectors[1])
+        assert results[2] is None
+        assert (reopened.disk_hits, reopened.misses) == (2, 1)
+    
+    def test_model_switch_invalidates_keys(self, tmp_path):
+        cache = EmbeddingCache(db_path=str(tmp_path / "embeddings.db"))
+        cache.set_model("model-a")
+        vector = random_vectors(1)[0]
+        cache.put("问题", vector)
+        
+        cache.set_model("model-b")
+        assert cache.invalidations == 1
+        assert cache.get("问题") is None
+        
+        # 切回原模型时磁盘层中该模型的键仍可用
+        cache.set_model("model-a")
+        np.testing.assert_array_equal(cache.get("问题"), vector)
+        assert cache.disk_hits == 1
@@ -0,0 +1,45 @@
+import asyncio
+
+import numpy as np
+
+from app.services.embedding_dispatcher import EmbeddingDispatcher
+
+
+class TestEmbeddingDispatcher:
+    """异步微批处理测试"""
+    
+    def test_concurrent_requests_share_batches(self):
+        batches = []
+        
+        def embed_batch(texts):
+            batches.append(list(texts))
+            return np.array([[float(text)] * 2 for text in texts], dtype=np.float32)
+        
+        async def run():
+            dispatcher = EmbeddingDispatcher(embed_batch, window_ms=50, max_batch_size=4)
+            try:
+                results = await asyncio.gather(*(dispatcher.embed(str(i)) for i in range(10)))
+                return results, dispatcher.get_stats()
+            finally:
+                await dispatcher.close()
+        
+        results, stats = asyncio.run(run())
+        # 每个调用方拿到自己的向量，并发请求合并为不超过上限的批次
+        assert results == [[float(i)] * 2 for i in range(10)]
+        assert [len(batch) for batch in batches] == [4, 4, 2]
+        assert (stats["batches"], stats["items"]) == (3, 10)
+        assert stats["batch_fill_ratio"] == round(10 / 12, 4)
+    
+    def test_encode_error_reaches_every_caller(self):
+        def embed_batch(texts):
+            raise RuntimeError("模型不可用")
+        
+        async def run():
+            dispatcher = EmbeddingDispatcher(embed_batch, window_ms=20, max_batch_size=8)
+            try:
+                return await asyncio.gather(*(dispatcher.embed("问题") for _ in range(3)), return_exceptions=True)
+            finally:
+                await dispatcher.close()
+        
+        results = asyncio.run(run())
+        assert [str(result) for result in results] == ["模型不可用"] * 3
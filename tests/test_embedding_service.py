@@ -0,0 +1,57 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+
+DIMENSION = 8
+
+
+class FakeSentenceTransformer:
+    """记录每次encode的批次，返回未归一化的float64向量"""
+    
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.batches = []
+    
+    def get_sentence_embedding_dimension(self):
+        return DIMENSION
+    
+    def encode(self, texts, batch_size=None, convert_to_numpy=True, show_progress_bar=False):
+        self.batches.append(list(texts))
+        return np.array([[len(text) + 1.0] * DIMENSION for text in texts])
+
+
+@pytest.fixture
+def service(monkeypatch):
+    """用假的 sentence_transformers 模块构造嵌入服务，只使用内存缓存"""
+    from app.config.settings import settings
+    from app.services import embedding_service as embedding_module
+    
+    monkeypatch.setitem(sys.modules, "sentence_transformers", types.SimpleNamespace(SentenceTransformer=FakeSentenceTransformer))
+    monkeypatch.setattr(embedding_module, "SENTENCE_TRANSFORMERS_AVAILABLE", True)
+    monkeypatch.setattr(settings, "embedding_model", "fake")
+    monkeypatch.setattr(settings, "embedding_cache_enabled", True)
+    monkeypatch.setattr(settings, "embedding_cache_path", "")
+    return embedding_module.EmbeddingService()
+
+
+class TestEmbeddingBatching:
+    """批量嵌入测试"""
+    
+    def test_batches_misses_and_normalizes_rows(self, service):
+        assert not service.use_simple and service.model_name == "fake"
+        texts = [f"文本 {i}" for i in range(10)]
+        embeddings = service.get_embeddings_batch(texts, batch_size=4)
+        
+        assert [len(batch) for batch in service.model.batches] == [4, 4, 2]
+        assert embeddings.dtype == np.float32 and embeddings.flags["C_CONTIGUOUS"]
+        assert embeddings.shape == (10, DIMENSION)
+        np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1.0, rtol=1e-6)
+        
+        # 已缓存的行直接复用，只对未命中的文本encode
+        service.model.batches.clear()
+        again = service.get_embeddings_batch(texts[8:] + ["新文本"], batch_size=4)
+        assert service.model.batches == [["新文本"]]
+        np.testing.assert_array_equal(again[:2], embeddings[8:])
+        assert service.get_embedding("新文本") == again[2].tolist()
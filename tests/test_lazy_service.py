@@ -0,0 +1,57 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.utils.lazy_service import LazyService, ServiceNotReadyError, get_services_status, wait_for_services
+
+
+class TestLazyService:
+    """延迟加载和就绪状态测试"""
+    
+    def test_constructs_on_first_access(self, monkeypatch):
+        monkeypatch.setattr(LazyService, "registry", {})
+        calls = []
+        service = LazyService("store", lambda: calls.append(1) or {"answer": 42})
+        assert not calls and get_services_status()["store"]["state"] == "pending"
+        
+        assert service.get("answer") == 42
+        assert service.get_instance() is service.get_instance()
+        assert len(calls) == 1 and service.is_ready()
+        status = get_services_status()["store"]
+        assert status["state"] == "ready" and status["load_seconds"] is not None
+    
+    def test_waiters_are_woken_by_loader_and_failures_retry(self, monkeypatch):
+        monkeypatch.setattr(LazyService, "registry", {})
+        release = threading.Event()
+        attempts = []
+        
+        def factory():
+            attempts.append(1)
+            release.wait(5)
+            if len(attempts) == 1:
+                raise RuntimeError("模型文件缺失")
+            return "model"
+        
+        service = LazyService("model", factory)
+        
+        async def run():
+            waiters = [asyncio.ensure_future(service.wait_ready(5)) for _ in range(20)]
+            await asyncio.sleep(0.05)
+            # 所有等待方共用一个加载线程
+            assert len(attempts) == 1 and service.get_status()["state"] == "loading"
+            with pytest.raises(ServiceNotReadyError, match="尚未就绪"):
+                await service.wait_ready(0.01)
+            
+            release.set()
+            failures = await asyncio.gather(*waiters, return_exceptions=True)
+            assert all(isinstance(error, ServiceNotReadyError) and "模型文件缺失" in str(error) for error in failures)
+            assert service.get_status()["state"] == "failed"
+            
+            # 失败后再次等待时重新加载
+            await wait_for_services(service, timeout=5)
+            return await service.wait_ready(5)
+        
+        assert asyncio.run(run()) == "model"
+        status = service.get_status()
+        assert len(attempts) == 2 and status["state"] == "ready" and status["error"] is None
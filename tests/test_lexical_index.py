@@ -0,0 +1,67 @@
+import threading
+
+from app.models.document_models import DocumentCreate
+from app.services.lexical_index import LexicalIndex
+
+
+def ids_of(hits):
+    return [doc_id for doc_id, _ in hits]
+
+
+class TestLexicalIndex:
+    """BM25倒排索引测试"""
+
+    def test_matches_exact_terms_across_instances(self, tmp_path):
+        writer = LexicalIndex(index_path=str(tmp_path))
+        writer.add_documents(["a", "b", None], [
+            DocumentCreate(content="设备报错 E-1001 时请重启"),
+            DocumentCreate(content="固件 v2.3.1 升级说明，型号 X200"),
+            DocumentCreate(content="写入失败的文档不登记"),
+        ])
+        reader = LexicalIndex(index_path=str(tmp_path))
+        assert ids_of(reader.search("e-1001 怎么处理")) == ["a"]
+        assert ids_of(reader.search("X200 固件")) == ["b"]
+        assert reader.search("写入失败") == []
+
+        # 删除后以同一ID重新写入，其他实例按提交顺序应用
+        writer.remove(["a"])
+        writer.add_documents(["a"], [DocumentCreate(content="X200 重启步骤")])
+        assert reader.search("e-1001") == []
+        assert ids_of(LexicalIndex(index_path=str(tmp_path)).search("x200 重启")) == ["a", "b"]
+
+        assert writer.rebuild([(["c"], [DocumentCreate(content="E-1001")])]) == 1
+        assert reader.search("x200") == [] and reader.get_stats()["segments"] == 1
+
+    def test_merge_keeps_concurrent_writes(self, tmp_path):
+        merger = LexicalIndex(index_path=str(tmp_path))
+        for i in range(3):
+            merger.add_documents([f"d{i}"], [DocumentCreate(content=f"型号 X{i} 说明")])
+        reader = LexicalIndex(index_path=str(tmp_path))
+        assert reader.search("x1") and reader.get_stats()["segments"] == 3
+
+        # 另一个实例（模拟加载脚本或其他worker）在合并的同时不断写入和删除，
+        # 无论与合并如何交错，合并提交后都不会丢失这些写入和删除
+        writer = LexicalIndex(index_path=str(tmp_path))
+        done = threading.Event()
+
+        def write():
+            try:
+                for i in range(3, 40):
+                    writer.add_documents([f"d{i}"], [DocumentCreate(content=f"型号 X{i} 说明")])
+                    writer.remove([f"d{i - 3}"])
+            finally:
+                done.set()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        merges = 0
+        while not done.is_set():
+            merges += merger.merge_segments()
+        thread.join()
+        merger.merge_segments()
+
+        assert merges > 0
+        for index in (merger, reader, writer, LexicalIndex(index_path=str(tmp_path))):
+            assert index.get_stats()["documents"] == 3
+            assert all(index.search(f"x{i}") == [] for i in range(37))
+            assert [ids_of(index.search(f"x{i}")) for i in range(37, 40)] == [["d37"], ["d38"], ["d39"]]
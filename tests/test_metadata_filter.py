@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from app.utils.metadata_filter import MetadataIndex, matches_filters, parse_filters
+
+
+class TestMetadataFilter:
+    """元数据过滤表达式和二级索引测试"""
+
+    def test_parse_filters_validates_fields_and_values(self):
+        assert parse_filters(None) is None
+        assert parse_filters({"product": "router"}, ["product"]) == {"product": ["router"]}
+        assert parse_filters(parse_filters({"product": ["a", "b"]})) == {"product": ["a", "b"]}
+        with pytest.raises(ValueError, match="author"):
+            parse_filters({"author": "x"}, ["product"])
+        with pytest.raises(ValueError):
+            parse_filters({"product": []})
+        with pytest.raises(ValueError):
+            parse_filters({"product": {"$gt": 1}})
+
+    def test_in_memory_matching_agrees_with_index(self):
+        assert matches_filters({"source_file": "x.txt", "chunk_index": 1}, {"source_file": ["x.txt", "y.txt"]})
+        # 1、"1" 和 true 是不同的取值
+        assert not matches_filters({"chunk_index": 1}, {"chunk_index": ["1"]})
+        assert not matches_filters({"flag": True}, {"flag": [1]})
+        # 列表字段按元素匹配
+        assert matches_filters({"product": ["a", "b"]}, {"product": "b"})
+        assert not matches_filters({"product": ["a", "c"]}, {"product": ["b"]})
+        assert not matches_filters({"product": None}, {"product": "b"})
+        assert matches_filters(None, None) and not matches_filters(None, {"product": "a"})
+
+        # 索引求出的候选行与逐行判断的结果一致
+        metadatas = [
+            {"product": "a", "lang": "zh"},
+            {"product": ["a", "b"], "lang": "en"},
+            {"product": ["b", "b"], "lang": "zh"},
+            {"product": "c"},
+            None,
+            {"product": ["c", 1], "lang": ["zh", "en"]},
+        ]
+        index = MetadataIndex(["product", "lang"])
+        for row, metadata in enumerate(metadatas):
+            index.add(row, metadata)
+        for filters in ({"product": "b"}, {"product": ["a", "c"]}, {"product": "b", "lang": "zh"}, {"lang": "en"}, {"product": 1}):
+            expected = [row for row, metadata in enumerate(metadatas) if matches_filters(metadata, parse_filters(filters))]
+            np.testing.assert_array_equal(index.candidate_rows(filters), expected)
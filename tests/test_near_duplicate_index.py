@@ -0,0 +1,38 @@
+import os
+
+import numpy as np
+
+from app.models.document_models import DocumentCreate
+from app.services.near_duplicate_index import NearDuplicateIndex, forget_documents
+
+
+class TestNearDuplicateIndex:
+    """MinHash/LSH近重复检测测试"""
+    
+    def test_filter_duplicates_persists_across_loads(self, tmp_path):
+        rng = np.random.default_rng(0)
+        words = "设备 安装 电源 接口 重启 网络 配置 错误代码 E1001 固件 手册 版本".split()
+        originals = [" ".join(rng.choice(words, 80)) for _ in range(30)]
+        revisions = [text.replace("版本", "版本 v2", 1) for text in originals[:10]]
+        state_path = str(tmp_path / "dedup_state.npz")
+        
+        index = NearDuplicateIndex(path=state_path, threshold=0.8)
+        kept, ids, report = index.filter_duplicates([DocumentCreate(content=text) for text in originals + revisions[:5]])
+        assert report["kept"] == 30 and report["duplicates"] == 5
+        assert len(ids) == len(kept) == 30
+        index.remove(ids[:1])
+        index.save()
+        
+        # 重新加载后继续去重；已删除的原件不再匹配
+        reloaded = NearDuplicateIndex(path=state_path, threshold=0.8)
+        kept, _, report = reloaded.filter_duplicates([DocumentCreate(content=text, metadata={"chunk_index": i}) for i, text in enumerate(revisions)])
+        assert report["duplicates"] == 9 and [doc.metadata["chunk_index"] for doc in kept] == [0]
+        assert len(reloaded.get_links(ids[1])) == 2
+        
+        # 加载脚本运行期间API删除的块，在脚本保存时不会被写回
+        forget_documents([ids[2]], path=state_path)
+        assert not os.path.exists(state_path + ".tmp") and NearDuplicateIndex(path=state_path).get_stats()["removed"] == 2
+        reloaded.save()
+        assert os.path.getsize(state_path + NearDuplicateIndex.REMOVED_SUFFIX) == 0
+        _, _, report = NearDuplicateIndex(path=state_path, threshold=0.8).filter_duplicates([DocumentCreate(content=originals[2])])
+        assert report["duplicates"] == 0
@@ -0,0 +1,30 @@
+import numpy as np
+
+from app.models.document_models import Document
+from app.services.rerank_service import RerankService
+
+
+class TestRerank:
+    """交叉编码器重排测试（用假模型代替真实模型）"""
+    
+    def test_rerank_batches_and_caches_scores(self):
+        class FakeCrossEncoder:
+            def __init__(self):
+                self.calls = []
+            
+            def predict(self, pairs, batch_size=32, show_progress_bar=False):
+                self.calls.append(len(pairs))
+                return np.array([float(content.count("重启")) for _, content in pairs])
+        
+        model = FakeCrossEncoder()
+        service = RerankService(model=model, model_name="fake", cache_size=100)
+        documents = [Document(id=str(i), content="重启 " * (i % 4), score=0.9 - i * 0.01) for i in range(8)]
+        
+        reranked = service.rerank("如何重启", documents, top_n=3)
+        assert [doc.id for doc in reranked] == ["3", "7", "2"]
+        assert reranked[0].rerank_score == 3.0 and reranked[0].score == documents[3].score
+        
+        # 已打分的候选命中缓存，只有新候选进入一次批量打分
+        service.rerank("如何重启", documents[:4] + [Document(id="new", content="重启 重启 重启 重启")], top_n=2)
+        assert model.calls == [8, 1]
+        assert service.get_stats()["cache_hits"] == 4
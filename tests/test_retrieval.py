@@ -0,0 +1,108 @@
+import numpy as np
+
+from app.models.document_models import Document, DocumentCreate
+from app.services.numpy_vector_store import NumpyVectorStore
+from app.services.sharded_vector_store import ShardedVectorStore
+from app.utils.retrieval import expand_neighbors, mmr_documents, reciprocal_rank_fusion, source_chunk_ids
+from app.utils.text_processor import TextProcessor
+
+DIMENSION = 32
+
+
+def topic_vectors(rng, topics: int, copies: int, noise: float = 0.01):
+    """每个主题若干个几乎相同的归一化向量（模拟带重叠的相邻块），同时返回主题中心"""
+    base = rng.standard_normal((topics, DIMENSION)).astype(np.float32)
+    vectors = np.repeat(base, copies, axis=0) + rng.standard_normal((topics * copies, DIMENSION)).astype(np.float32) * noise
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return base, vectors
+
+
+class TestReciprocalRankFusion:
+    """倒数排名融合测试"""
+
+    def test_documents_in_both_lists_rank_first(self):
+        assert reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]], k=60) == ["c", "a", "b", "d"]
+        assert reciprocal_rank_fusion([[], ["x"]]) == ["x"]
+
+
+class TestMMR:
+    """MMR多样化测试"""
+
+    def test_mmr_skips_near_duplicate_chunks(self, tmp_path):
+        rng = np.random.default_rng(1)
+        base, vectors = topic_vectors(rng, 4, 3)
+        documents = [DocumentCreate(content=f"主题 {i // 3} 块 {i}") for i in range(12)]
+        query = (base[0] + 0.8 * base[1]).tolist()
+
+        single = NumpyVectorStore(index_path=str(tmp_path / "single"), dimension=DIMENSION)
+        single.insert_documents(documents, vectors)
+        sharded = ShardedVectorStore.open(
+            str(tmp_path / "sharded"), 2, "hash",
+            lambda path: NumpyVectorStore(index_path=path, dimension=DIMENSION)
+        )
+        sharded.insert_documents(documents, vectors)
+
+        plain = single.similarity_search(query, top_k=3)
+        assert len({doc.content.split()[1] for doc in plain}) == 1
+        for store in (single, sharded):
+            diverse = store.similarity_search(query, top_k=3, mmr_lambda=0.5)
+            assert diverse[0].content == plain[0].content
+            assert len({doc.content.split()[1] for doc in diverse}) == 3
+            assert all(doc.embedding is None for doc in diverse)
+        # lambda为1时等价于按相关度排序
+        assert [doc.id for doc in single.similarity_search(query, top_k=3, mmr_lambda=1.0)] == [doc.id for doc in plain]
+
+    def test_mmr_over_ranked_pool_follows_final_order(self):
+        rng = np.random.default_rng(2)
+        base = rng.standard_normal((3, DIMENSION)).astype(np.float32)
+        query = base[0] + 0.5 * base[1] + 0.2 * base[2]
+        # 融合或重排后的顺序：主题2排第一，其后是它的近似重复块，最后是与查询更相似的主题0和主题1
+        vectors = base[[2, 2, 0, 1]] + rng.standard_normal((4, DIMENSION)).astype(np.float32) * 0.01
+        documents = [Document(id=str(i), content="", embedding=vector.tolist()) for i, vector in enumerate(vectors)]
+
+        selected = mmr_documents(query, documents, 3, 0.5, ranked=True)
+        assert [doc.id for doc in selected] == ["0", "2", "3"]
+        assert all(doc.embedding is None for doc in selected)
+        assert [doc.id for doc in mmr_documents(query, documents, 2, 1.0, ranked=True)] == ["0", "1"]
+
+
+class TestNeighborExpansion:
+    """相邻块扩展测试"""
+
+    def test_hits_expand_to_neighbors_without_repeating_text(self, tmp_path):
+        text = " ".join(f"Sentence {i} describes step {i} of the setup." for i in range(40))
+        chunks = TextProcessor(chunk_size=120, chunk_overlap=30).split_into_chunks(text)
+        documents = [
+            DocumentCreate(content=chunk, metadata={"source_file": "guide.txt", "chunk_index": i, "total_chunks": len(chunks)})
+            for i, chunk in enumerate(chunks)
+        ]
+        rng = np.random.default_rng(4)
+        vectors = rng.standard_normal((len(chunks) + 1, DIMENSION)).astype(np.float32)
+        store = NumpyVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        ids = store.insert_documents(documents, vectors[:-1]).ids
+        store.delete_documents([ids[9]])
+        assert [doc.id for doc in store.get_chunks([("guide.txt", 2), ("guide.txt", 9), ("other.txt", 0)])] == [ids[2]]
+        # 同一位置写入的新行被删除（如替换失败回滚）后，仍取到原来的行
+        rollback_id = store.insert_documents(documents[2:3], vectors[-1:]).ids[0]
+        assert [doc.id for doc in store.get_chunks([("guide.txt", 2)])] == [rollback_id]
+        store.delete_documents([rollback_id])
+        assert [doc.id for doc in store.get_chunks([("guide.txt", 2)])] == [ids[2]]
+
+        hits = store.get_documents([ids[3], ids[5], ids[10]]) + [Document(id="plain", content="无块序号")]
+        calls = []
+
+        def fetch(keys):
+            calls.append(keys)
+            return store.get_chunks(keys)
+
+        expanded = expand_neighbors(hits, fetch, 1)
+        assert len(calls) == 1
+        assert [(doc.id, doc.metadata.get("chunk_range")) for doc in expanded] == [
+            (ids[3], [2, 6]), (ids[10], [10, 11]), ("plain", None)
+        ]
+        # 合并的每个块都记录下来，其中任一块删除时引用它的缓存答案失效
+        assert source_chunk_ids(expanded) == ids[2:7] + ids[10:12] + ["plain"]
+        # 合并后的文本连续且每个句子只出现一次
+        merged = expanded[0].content
+        assert merged.startswith(chunks[2]) and merged.endswith(chunks[6][-20:])
+        assert all(merged.count(f"Sentence {i} ") <= 1 for i in range(40))
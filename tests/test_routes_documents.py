@@ -0,0 +1,100 @@
+import base64
+import json
+
+
+class TestListDocuments:
+    """GET /documents/ 游标分页"""
+
+    def test_pages_through_all_documents(self, api):
+        ids = api.add_documents([{"content": f"chunk {i}", "metadata": {"source_file": "guide.txt"}} for i in range(7)])
+
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 3} if cursor is None else {"limit": 3, "cursor": cursor}
+            response = api.client.get("/api/v1/documents/", params=params)
+            assert response.status_code == 200
+            page = response.json()
+            assert page["total"] == 7 and len(page["items"]) <= 3
+            seen.extend(item["id"] for item in page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        assert seen == ids
+
+        # 删除已翻过的文档不影响后续页
+        first = api.client.get("/api/v1/documents/", params={"limit": 3}).json()
+        assert api.client.delete(f"/api/v1/documents/{ids[0]}").status_code == 200
+        second = api.client.get("/api/v1/documents/", params={"limit": 3, "cursor": first["next_cursor"]}).json()
+        assert [item["id"] for item in second["items"]] == ids[3:6]
+
+    def test_invalid_cursor_returns_400(self, api):
+        api.add_documents([{"content": "chunk", "metadata": {}}])
+
+        def encode(position):
+            return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii").rstrip("=")
+
+        for cursor in ("not a cursor", encode(["row", 1]), encode({"row": -1}), encode({"row": "1"}), encode({"row": True})):
+            response = api.client.get("/api/v1/documents/", params={"cursor": cursor})
+            assert response.status_code == 400, cursor
+            assert "游标" in response.json()["detail"]
+
+
+class TestDeleteAndReplace:
+    """删除使答案缓存失效，替换失败时回滚"""
+
+    def test_delete_invalidates_cached_answers(self, api):
+        ids = api.add_documents([
+            {"content": "reset the router password", "metadata": {"source_file": "router.txt"}},
+            {"content": "update the modem firmware", "metadata": {"source_file": "modem.txt"}},
+        ])
+        body = {"question": "reset router password", "top_k": 1, "min_score": 0.5}
+
+        first = api.client.post("/api/v1/query/", json=body).json()
+        assert not first["cache_hit"] and first["source_documents"][0]["document_id"] == ids[0]
+        assert api.client.post("/api/v1/query/", json=body).json()["cache_hit"]
+        assert len(api.llm.questions) == 1
+
+        # 删除答案引用的文档后，缓存的答案不再返回，也不会再引用已删除的文档
+        assert api.client.delete(f"/api/v1/documents/{ids[0]}").json()["deleted_count"] == 1
+        after = api.client.post("/api/v1/query/", json=body).json()
+        assert not after["cache_hit"] and after["source_documents"] == []
+        assert api.client.get(f"/api/v1/documents/{ids[0]}").status_code == 404
+        assert api.client.delete(f"/api/v1/documents/{ids[0]}").status_code == 404
+
+        # 按来源文件删除同样使缓存失效
+        body = {"question": "update modem firmware", "top_k": 1, "min_score": 0.5}
+        api.client.post("/api/v1/query/", json=body)
+        assert api.client.post("/api/v1/query/", json=body).json()["cache_hit"]
+        assert api.client.delete("/api/v1/documents/", params={"source_file": "modem.txt"}).json()["deleted_count"] == 1
+        assert not api.client.post("/api/v1/query/", json=body).json()["cache_hit"]
+        assert api.store.get_document_count() == 0
+
+    def test_failed_replace_keeps_old_chunks(self, api):
+        old_ids = api.add_documents([
+            {"content": f"old chunk {i}", "metadata": {"source_file": "guide.txt"}} for i in range(2)
+        ])
+        api.embedder.failing_texts.add("broken chunk")
+
+        response = api.client.put(
+            "/api/v1/documents/",
+            params={"source_file": "guide.txt"},
+            json=[{"content": "new chunk", "metadata": {}}, {"content": "broken chunk", "metadata": {}}]
+        )
+        assert response.status_code == 500
+        # 已写入的新块被撤销，旧块保留，关键词索引中没有新块
+        page = api.client.get("/api/v1/documents/").json()
+        assert [item["id"] for item in page["items"]] == old_ids
+        assert api.lexical_index.search("new") == []
+
+        response = api.client.put(
+            "/api/v1/documents/",
+            params={"source_file": "guide.txt"},
+            json=[{"content": "new chunk", "metadata": {}}]
+        )
+        assert response.status_code == 200
+        result = response.json()
+        assert result["deleted_count"] == 2 and result["inserted"]["errors"] == []
+        page = api.client.get("/api/v1/documents/").json()
+        assert [item["id"] for item in page["items"]] == result["inserted"]["ids"]
+        assert page["items"][0]["metadata"] == {"source_file": "guide.txt"}
+        assert api.lexical_index.search("old") == []
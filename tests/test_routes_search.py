@@ -0,0 +1,114 @@
+import pytest
+
+PRODUCT_DOCUMENTS = [
+    {"content": "reset the router password", "metadata": {"source_file": "a.txt", "product": "router"}},
+    {"content": "reset the modem password", "metadata": {"source_file": "b.txt", "product": "modem"}},
+    {"content": "reset the password on router and modem", "metadata": {"source_file": "c.txt", "product": ["router", "modem"]}},
+    {"content": "update the modem firmware", "metadata": {"source_file": "d.txt", "product": "modem"}},
+]
+
+
+class TestSearchFilters:
+    """/search/ 和 /query/ 的元数据过滤"""
+
+    def test_unknown_filter_field_is_rejected(self, api):
+        body = {"question": "reset password", "filters": {"author": "x"}}
+        for path in ("/api/v1/search/", "/api/v1/query/"):
+            response = api.client.post(path, json=body)
+            assert response.status_code == 400
+            assert "author" in response.json()["detail"]
+        response = api.client.post("/api/v1/search/batch", json={"questions": ["reset password"], "filters": {"author": "x"}})
+        assert response.status_code == 400
+        assert not api.embedder.calls and not api.llm.questions
+
+    def test_search_applies_filters(self, api):
+        ids = api.add_documents(PRODUCT_DOCUMENTS)
+
+        response = api.client.post("/api/v1/search/", json={"question": "reset password", "top_k": 10, "filters": {"product": "modem"}})
+        assert response.status_code == 200
+        # 列表字段按元素匹配：product 为 ["router", "modem"] 的文档同样满足 product=modem
+        assert sorted(result["document_id"] for result in response.json()["results"]) == sorted([ids[1], ids[2], ids[3]])
+
+    def test_hybrid_search_filters_keyword_hits_by_list_items(self, api):
+        # 向量检索召回的路由器文档都低于 min_score，只剩只由关键词命中的文档，它们在内存中按元数据过滤
+        ids = api.add_documents([
+            {"content": f"router guide {i}", "metadata": {"product": "router"}} for i in range(4)
+        ] + [
+            {"content": "zebra crossing", "metadata": {"product": ["router", "modem"]}},
+            {"content": "zebra modem", "metadata": {"product": "modem"}},
+        ])
+
+        response = api.client.post(
+            "/api/v1/search/",
+            json={"question": "router router zebra", "top_k": 1, "hybrid": True, "min_score": 0.9, "filters": {"product": "router"}}
+        )
+        assert response.status_code == 200
+        # 列表字段按元素匹配，与向量检索使用的元数据索引一致
+        assert [result["document_id"] for result in response.json()["results"]] == [ids[4]]
+
+    def test_query_applies_filters(self, api):
+        ids = api.add_documents(PRODUCT_DOCUMENTS)
+
+        response = api.client.post("/api/v1/query/", json={"question": "reset router password", "filters": {"product": "modem", "source_file": "b.txt"}})
+        assert response.status_code == 200
+        body = response.json()
+        assert [doc["document_id"] for doc in body["source_documents"]] == [ids[1]]
+        assert body["answer"] == "答案: reset the modem password"
+
+        # 没有满足过滤条件的文档时不调用LLM
+        response = api.client.post("/api/v1/query/", json={"question": "reset password", "filters": {"product": "switch"}})
+        assert response.status_code == 200
+        assert response.json()["source_documents"] == []
+        assert len(api.llm.questions) == 1
+
+
+class TestSearchRoutes:
+    """/search/ 的分数过滤和 /search/batch"""
+
+    def test_search_drops_results_below_min_score(self, api):
+        api.add_documents([
+            {"content": "reset the router password", "metadata": {}},
+            {"content": "router password", "metadata": {}},
+            {"content": "bake bread at home", "metadata": {}},
+        ])
+
+        everything = api.client.post("/api/v1/search/", json={"question": "router password", "top_k": 10, "min_score": 0.0}).json()["results"]
+        assert len(everything) == 3
+        assert [result["rank"] for result in everything] == [1, 2, 3]
+
+        results = api.client.post("/api/v1/search/", json={"question": "router password", "top_k": 10, "min_score": 0.5}).json()["results"]
+        assert [result["content"] for result in results] == ["router password", "reset the router password"]
+        assert all(result["score"] >= 0.5 for result in results)
+        assert results[0]["score"] == pytest.approx(1.0, abs=1e-5)
+        assert not api.llm.questions
+
+    def test_batch_search_matches_single_searches(self, api):
+        api.add_documents([
+            {"content": "reset the router password", "metadata": {"product": "router"}},
+            {"content": "update the modem firmware", "metadata": {"product": "modem"}},
+            {"content": "router firmware notes", "metadata": {"product": "router"}},
+        ])
+        questions = ["router password", "modem firmware", "bake bread"]
+
+        calls = api.embedder.calls
+        response = api.client.post("/api/v1/search/batch", json={"questions": questions, "top_k": 2, "min_score": 0.5})
+        assert response.status_code == 200
+        items = response.json()["items"]
+        # 全部问题一次批量嵌入
+        assert api.embedder.calls == calls + 1
+        assert [item["question"] for item in items] == questions
+        for question, item in zip(questions, items):
+            single = api.client.post("/api/v1/search/", json={"question": question, "top_k": 2, "min_score": 0.5}).json()["results"]
+            assert [result["document_id"] for result in item["results"]] == [result["document_id"] for result in single]
+        assert items[2]["results"] == [] and items[2]["answer"] is None
+
+        # 生成答案时只对有检索结果的问题调用LLM
+        items = api.client.post("/api/v1/search/batch", json={"questions": questions, "top_k": 2, "min_score": 0.5, "generate_answers": True}).json()["items"]
+        assert sorted(api.llm.questions) == sorted(questions[:2])
+        assert items[0]["answer"] == f"答案: {items[0]['results'][0]['content']}"
+        assert items[2]["answer"].startswith("抱歉")
+
+    def test_batch_search_validates_questions(self, api):
+        assert api.client.post("/api/v1/search/batch", json={"questions": []}).status_code == 400
+        assert api.client.post("/api/v1/search/batch", json={"questions": ["ok", " "]}).status_code == 400
+        assert api.client.post("/api/v1/search/batch", json={"questions": ["ok"], "top_k": 0}).status_code == 400
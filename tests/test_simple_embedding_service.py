@@ -0,0 +1,111 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.config.settings import settings
+from app.services.simple_embedding_service import SimpleEmbeddingService
+
+DIMENSION = 32
+
+
+@pytest.fixture
+def unfitted(monkeypatch, tmp_path):
+    """没有TF-IDF状态文件的简单嵌入服务设置"""
+    monkeypatch.setattr(settings, "vector_dimension", DIMENSION)
+    monkeypatch.setattr(settings, "tfidf_state_path", str(tmp_path / "missing_tfidf.npz"))
+
+
+class TestSimpleEmbeddingBatching:
+    """简单嵌入服务的批量嵌入测试"""
+    
+    def test_simple_embeddings_are_normalized_matrix(self, unfitted):
+        service = SimpleEmbeddingService()
+        texts = ["检索增强生成", "vector search", ""]
+        embeddings = service.get_embeddings_batch(texts, batch_size=2)
+        
+        assert embeddings.dtype == np.float32 and embeddings.shape == (3, DIMENSION)
+        np.testing.assert_allclose(np.linalg.norm(embeddings[:2], axis=1), 1.0, rtol=1e-6)
+        # 空文本得到零向量而不是NaN
+        assert not embeddings[2].any()
+        # 分批结果与整批结果一致
+        np.testing.assert_allclose(embeddings, service.get_embeddings_batch(texts, batch_size=10), rtol=1e-6)
+
+
+class TestFeatureHashing:
+    """特征哈希回退向量测试"""
+    
+    def test_hashed_vectors_are_stable_and_similarity_preserving(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(settings, "vector_dimension", 256)
+        monkeypatch.setattr(settings, "tfidf_state_path", str(tmp_path / "missing_tfidf.npz"))
+        service = SimpleEmbeddingService()
+        assert not service.is_fitted
+        
+        texts = ["向量数据库的索引结构", "向量数据库的索引构建", "今天天气晴朗适合散步"]
+        matrix = service.transform_hashed(texts)
+        assert matrix.shape == (3, 256)
+        np.testing.assert_allclose(np.sqrt(matrix.multiply(matrix).sum(axis=1)).A.ravel(), 1.0, rtol=1e-6)
+        
+        # 无需拟合，结果与进程和实例无关
+        embeddings = service.get_embeddings_batch(texts)
+        np.testing.assert_array_equal(embeddings, SimpleEmbeddingService().get_embeddings_batch(texts))
+        # 共享字符n-gram的文本比无关文本更相近
+        assert embeddings[0] @ embeddings[1] > embeddings[0] @ embeddings[2] + 0.3
+
+
+class TestTfidfState:
+    """TF-IDF状态持久化和增量更新测试"""
+    
+    def test_persist_reload_and_partial_fit(self, monkeypatch, tmp_path):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        
+        state_path = str(tmp_path / "tfidf_state.npz")
+        monkeypatch.setattr(settings, "vector_dimension", DIMENSION)
+        monkeypatch.setattr(settings, "tfidf_state_path", state_path)
+        first = ["vector search with numpy", "hybrid search with bm25", "numpy arrays and vector math"]
+        second = ["bm25 keyword search", "vector index"]
+        
+        service = SimpleEmbeddingService()
+        service.fit_vectorizer(first)
+        assert os.path.exists(state_path) and service.corpus_version == 1
+        
+        # 新实例（重启或其他进程）加载已保存的状态，得到相同的向量
+        reader = SimpleEmbeddingService()
+        assert reader.is_fitted and reader.corpus_version == 1
+        np.testing.assert_allclose(reader.get_embeddings_batch(second), service.get_embeddings_batch(second), rtol=1e-6)
+        
+        # 增量更新后的IDF与在全部文档上用同一词汇表拟合的结果一致
+        service.partial_fit(second)
+        assert service.document_count == 5 and service.corpus_version == 2
+        expected = TfidfVectorizer(vocabulary=service.vectorizer.vocabulary_).fit(first + second)
+        np.testing.assert_allclose(service.vectorizer.idf_, expected.idf_)
+        
+        # 状态文件变化后，其他实例在下次嵌入时重新加载
+        os.utime(state_path, ns=(0, os.stat(state_path).st_mtime_ns + 10 ** 9))
+        reader.get_embeddings_batch(["vector"])
+        assert reader.corpus_version == 2
+        np.testing.assert_allclose(reader.vectorizer.idf_, expected.idf_)
+    
+    def test_partial_fit_warns_when_idf_drifts(self, monkeypatch, tmp_path, caplog):
+        monkeypatch.setattr(settings, "vector_dimension", DIMENSION)
+        monkeypatch.setattr(settings, "tfidf_state_path", str(tmp_path / "tfidf_state.npz"))
+        monkeypatch.setattr(settings, "tfidf_drift_warning_threshold", 0.1)
+        service = SimpleEmbeddingService()
+        service.fit_vectorizer(["apple banana", "banana cherry", "cherry apple"])
+        
+        # 小幅更新：漂移低于阈值，不告警
+        with caplog.at_level("WARNING"):
+            service.partial_fit(["apple banana cherry"])
+        assert 0 < service.idf_drift() < 0.1
+        assert "漂移" not in caplog.text
+        
+        # 大量只含同一个词的文档使IDF明显偏离拟合时的值
+        with caplog.at_level("WARNING"):
+            service.partial_fit(["apple"] * 20)
+        assert service.idf_drift() > 0.1
+        assert "漂移" in caplog.text
+        
+        # 漂移基准随状态文件保存，重启后仍然可用；从头拟合后重置
+        assert SimpleEmbeddingService().idf_drift() == pytest.approx(service.idf_drift())
+        service.fit_vectorizer(["apple banana", "banana cherry"])
+        assert service.idf_drift() == 0.0
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from app.config.settings import settings
+from app.models.document_models import DocumentCreate
+from app.services.binary_vector_store import BinaryVectorStore
+from app.services.numpy_vector_store import NumpyVectorStore
+from app.services.snapshot import SnapshotError, export_snapshot, import_snapshot, verify_snapshot
+
+DIMENSION = 16
+
+
+class TestSnapshot:
+    """快照导出/导入测试"""
+
+    def test_export_import_roundtrip(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(settings, "vector_dimension", DIMENSION)
+        monkeypatch.setattr(settings, "tfidf_state_path", str(tmp_path / "missing_tfidf.npz"))
+        rng = np.random.default_rng(3)
+        vectors = rng.standard_normal((45, DIMENSION)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        documents = [
+            DocumentCreate(content=f"第 {i // 15} 章 第 {i % 15} 节", metadata={"source_file": f"manual_{i // 15}.md", "chunk_index": i % 15})
+            for i in range(45)
+        ]
+        source = NumpyVectorStore(index_path=str(tmp_path / "source"), dimension=DIMENSION)
+        ids = source.insert_documents(documents, vectors).ids
+
+        manifest = export_snapshot(source, str(tmp_path / "snapshot"), part_size=20)
+        assert manifest["count"] == 45
+        assert [part["count"] for part in manifest["parts"]] == [20, 20, 5]
+        verify_snapshot(str(tmp_path / "snapshot"))
+
+        # 导入到另一种后端，保留原ID和向量
+        target = BinaryVectorStore(index_path=str(tmp_path / "target"), dimension=DIMENSION)
+        assert import_snapshot(target, str(tmp_path / "snapshot"), batch_size=8) == (45, 0)
+        assert target.get_document(ids[30]).metadata == documents[30].metadata
+        assert target.similarity_search(vectors[30].tolist(), top_k=1)[0].id == ids[30]
+
+        # 文件损坏时校验失败
+        with open(tmp_path / "snapshot" / manifest["parts"][1]["documents"], "a", encoding="utf-8") as f:
+            f.write("\n")
+        with pytest.raises(SnapshotError):
+            verify_snapshot(str(tmp_path / "snapshot"))
@@ -0,0 +1,431 @@
+import numpy as np
+import json
+import pytest
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models.document_models import DocumentCreate
+from app.services.numpy_vector_store import NumpyVectorStore
+
+DIMENSION = 32
+
+
+def make_corpus(count: int, seed: int = 0):
+    """生成随机的归一化向量和对应文档"""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, DIMENSION)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    documents = [
+        DocumentCreate(content=f"文档 {i}", metadata={"source_file": f"file_{i % 3}.txt", "chunk_index": i})
+        for i in range(count)
+    ]
+    return documents, vectors
+
+
+def wait_for_training(store, timeout: float = 30.0):
+    """等待IVF后台训练线程结束"""
+    import time
+    
+    deadline = time.time() + timeout
+    while store.get_index_stats()["training"]:
+        assert time.time() < deadline, "IVF后台训练超时"
+        time.sleep(0.01)
+
+
+class TestNumpyVectorStore:
+    """NumPy平面索引测试"""
+    
+    def test_insert_and_search(self, tmp_path):
+        store = NumpyVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        documents, vectors = make_corpus(50)
+        ids = [store.insert_document(doc, vec.tolist()) for doc, vec in zip(documents, vectors)]
+        
+        assert store.get_document_count() == 50
+        results = store.similarity_search(vectors[7].tolist(), top_k=3)
+        assert len(results) == 3
+        assert results[0].id == ids[7]
+        assert results[0].content == "文档 7"
+        # 返回真实的余弦相似度分数，按分数降序
+        assert abs(results[0].score - 1.0) < 1e-5
+        assert results[0].score >= results[1].score >= results[2].score
+    
+    def test_reopen_and_refresh(self, tmp_path):
+        writer = NumpyVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        documents, vectors = make_corpus(20)
+        for doc, vec in zip(documents[:10], vectors[:10]):
+            writer.insert_document(doc, vec.tolist())
+        
+        # 另一个实例（模拟其他worker进程）可以读取已有数据，并看到后续追加
+        reader = NumpyVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        assert reader.get_document_count() == 10
+        for doc, vec in zip(documents[10:], vectors[10:]):
+            writer.insert_document(doc, vec.tolist())
+        assert reader.get_document_count() == 20
+        assert reader.similarity_search(vectors[15].tolist(), top_k=1)[0].content == "文档 15"
+    
+    def test_compressed_contents_and_inline_migration(self, tmp_path, monkeypatch):
+        from app.services.content_store import ContentStore
+        
+        # 小块大小，使内容分布在多个压缩块中
+        monkeypatch.setattr(ContentStore, "BLOCK_BYTES", 256)
+        store = NumpyVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        documents, vectors = make_corpus(60)
+        for doc in documents:
+            doc.content = f"{doc.content} " + "重复的手册正文 " * 20
+        ids = store.insert_documents(documents, vectors, batch_size=25).ids
+        
+        stats = store.get_content_stats()
+        assert stats["rows"] == 60 and stats["compression_ratio"] > 1
+        hits = store.batch_similarity_search(vectors[[3, 42]], top_k=2)
+        assert [docs[0].content for docs in hits] == [documents[3].content, documents[42].content]
+        
+        # 旧格式：正文直接写在 documents.jsonl 中，重新打开时迁移到内容存储
+        with open(tmp_path / NumpyVectorStore.DOCUMENTS_FILE, "w", encoding="utf-8") as f:
+            for doc_id, doc in zip(ids, documents):
+                f.write(json.dumps({"id": doc_id, "content": doc.content, "metadata": doc.metadata}, ensure_ascii=False) + "\n")
+        os.remove(tmp_path / ContentStore.DATA_FILE)
+        os.remove(tmp_path / ContentStore.INDEX_FILE)
+        
+        reopened = NumpyVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        assert reopened.get_document(ids[17]).content == documents[17].content
+        assert reopened.similarity_search(vectors[59].tolist(), top_k=1)[0].content == documents[59].content
+    
+    def test_insert_documents_reports_item_errors(self, tmp_path):
+        store = NumpyVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        documents, vectors = make_corpus(25)
+        vectors[4, 0] = np.nan
+        
+        result = store.insert_documents(documents, vectors, batch_size=10)
+        assert result.inserted_count == 24
+        assert [error.index for error in result.errors] == [4]
+        assert result.ids[4] is None
+        assert store.get_document_count() == 24
+        results = store.similarity_search(vectors[20].tolist(), top_k=1)
+        assert results[0].id == result.ids[20]
+    
+    def test_list_documents_with_cursor(self, tmp_path):
+        store = NumpyVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        documents, vectors = make_corpus(25)
+        ids = store.insert_documents(documents, vectors).ids
+        
+        seen = []
+        cursor = None
+        while True:
+            page = store.list_documents(cursor=cursor, limit=10, preview_chars=2)
+            assert page.total == 25
+            seen.extend(item.id for item in page.items)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        assert seen == ids
+        assert page.items[0].content_preview == "文档..."
+        assert store.get_document(ids[3]).content == "文档 3"
+        
+        # 行号不是非负整数的游标视为无效游标
+        from app.utils.pagination import InvalidCursorError, encode_cursor
+        for position in ({"row": -1}, {"row": "x"}, {"row": 1.5}, {"row": None}):
+            with pytest.raises(InvalidCursorError):
+                store.list_documents(cursor=encode_cursor(position))
+        assert store.get_document("missing") is None
+    
+    def test_filtered_search_keeps_top_k_full(self, tmp_path):
+        store = NumpyVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        documents, vectors = make_corpus(60)
+        store.insert_documents(documents, vectors)
+        
+        # 查询向量与 file_0 的文档最相近，但过滤条件只允许 file_1 / file_2
+        results = store.similarity_search(vectors[0].tolist(), top_k=5, filters={"source_file": ["file_1.txt", "file_2.txt"]})
+        assert len(results) == 5
+        assert all(doc.metadata["source_file"] != "file_0.txt" for doc in results)
+        
+        results = store.similarity_search(vectors[4].tolist(), top_k=50, filters={"source_file": ["file_1.txt"]})
+        assert len(results) == 20
+        assert results[0].content == "文档 4"
+        assert store.similarity_search(vectors[0].tolist(), filters={"source_file": ["missing.txt"]}) == []
+    
+    def test_batch_similarity_search(self, tmp_path):
+        store = NumpyVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        documents, vectors = make_corpus(40)
+        store.insert_documents(documents, vectors)
+        
+        batches = store.batch_similarity_search(vectors[[3, 17, 29]], top_k=2)
+        assert [hits[0].content for hits in batches] == ["文档 3", "文档 17", "文档 29"]
+        assert all(abs(hits[0].score - 1.0) < 1e-5 for hits in batches)
+        assert batches[0][0].score >= batches[0][1].score
+        
+        # 过滤条件对每个查询都生效，结果与单条搜索一致
+        batches = store.batch_similarity_search(vectors[[0, 1]], top_k=3, filters={"source_file": "file_2.txt"})
+        for query, hits in zip(vectors[[0, 1]], batches):
+            expected = store.similarity_search(query.tolist(), top_k=3, filters={"source_file": "file_2.txt"})
+            assert [doc.id for doc in hits] == [doc.id for doc in expected]
+    
+    def test_get_documents_skips_missing_and_deleted(self, tmp_path):
+        store = NumpyVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        documents, vectors = make_corpus(10)
+        ids = store.insert_documents(documents, vectors).ids
+        store.delete_documents([ids[2]])
+        # 按请求顺序返回，缺失和已删除的ID被跳过
+        assert [doc.content for doc in store.get_documents([ids[3], "missing", ids[2], ids[1]])] == ["文档 3", "文档 1"]
+
+
+class TestIVFVectorStore:
+    """IVF近似索引测试"""
+    
+    def test_train_and_search(self, tmp_path, monkeypatch):
+        from app.config.settings import settings
+        from app.services.ivf_vector_store import IVFVectorStore
+        
+        monkeypatch.setattr(settings, "ivf_min_train_size", 100)
+        monkeypatch.setattr(settings, "ivf_nlist", 8)
+        store = IVFVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        documents, vectors = make_corpus(400)
+        store.insert_documents(documents, vectors)
+        store.train()
+        wait_for_training(store)
+        
+        assert store.get_index_stats()["trained"]
+        # 扫描全部簇时结果与精确搜索一致
+        results = store.similarity_search(vectors[42].tolist(), top_k=1, nprobe=8)
+        assert results[0].content == "文档 42"
+        
+        # 重新打开时加载已训练的簇中心，新增行被分配到簇中
+        reopened = IVFVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        assert reopened.get_index_stats()["nlist"] == 8
+        extra_documents, extra_vectors = make_corpus(10, seed=1)
+        reopened.insert_documents(extra_documents, extra_vectors)
+        results = reopened.similarity_search(extra_vectors[3].tolist(), top_k=1, recall_hint="accurate")
+        assert results[0].content == "文档 3"
+        
+        # 其他实例重新训练并提交后，在下次查询时加载新版本；只保留当前和上一版本的文件
+        store.train()
+        store.train()
+        wait_for_training(store)
+        wait_for_training(reopened)
+        version = json.loads((tmp_path / "ivf_state.json").read_text())["version"]
+        reopened.similarity_search(extra_vectors[3].tolist(), top_k=1)
+        stats = reopened.get_index_stats()
+        assert stats["version"] == version >= 2 and stats["count"] == 410
+        assert sorted(name for name in os.listdir(tmp_path) if name.startswith("ivf_")) == [
+            f"ivf_assignments-{version - 1:06d}.npy", f"ivf_assignments-{version:06d}.npy",
+            f"ivf_centroids-{version - 1:06d}.npy", f"ivf_centroids-{version:06d}.npy", "ivf_state.json"
+        ]
+    
+    def test_only_writer_retrains_and_stale_training_is_skipped(self, tmp_path, monkeypatch):
+        from app.config.settings import settings
+        from app.services.ivf_vector_store import IVFVectorStore
+        
+        monkeypatch.setattr(settings, "ivf_min_train_size", 100)
+        monkeypatch.setattr(settings, "ivf_nlist", 8)
+        writer = IVFVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        documents, vectors = make_corpus(400)
+        writer.insert_documents(documents, vectors)
+        stale = IVFVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        writer.train()
+        wait_for_training(writer)
+        version = json.loads((tmp_path / "ivf_state.json").read_text())["version"]
+        
+        # 只读实例刷新时不启动重新训练；重新训练前先加载其他进程提交的结果，已不需要时跳过
+        stale.similarity_search(vectors[0].tolist(), top_k=1)
+        assert not stale.get_index_stats()["training"]
+        stale.train(only_if_needed=True)
+        assert json.loads((tmp_path / "ivf_state.json").read_text())["version"] == version
+        assert stale.get_index_stats()["version"] == version
+
+
+class TestHNSWVectorStore:
+    """HNSW图索引测试"""
+    
+    def test_incremental_insert_and_persistence(self, tmp_path, monkeypatch):
+        from app.config.settings import settings
+        from app.services.hnsw_vector_store import HNSWVectorStore
+        
+        # 只在测试显式调用时保存图
+        monkeypatch.setattr(settings, "hnsw_save_interval", 10 ** 9)
+        store = HNSWVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        documents, vectors = make_corpus(300)
+        store.insert_documents(documents[:200], vectors[:200])
+        store.save_graph()
+        store.insert_documents(documents[200:], vectors[200:])
+        
+        results = store.similarity_search(vectors[250].tolist(), top_k=1, recall_hint="accurate")
+        assert results[0].content == "文档 250"
+        
+        # 重新打开时映射已保存的图，保存之后追加的节点暴力搜索
+        reopened = HNSWVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        assert reopened.get_index_stats()["nodes"] == 200
+        results = reopened.similarity_search(vectors[120].tolist(), top_k=1)
+        assert results[0].content == "文档 120"
+        results = reopened.similarity_search(vectors[280].tolist(), top_k=1)
+        assert results[0].content == "文档 280"
+        
+        # 写入进程再次保存后，读取方加载新的图，只保留当前和上一版本的图文件
+        store.save_graph()
+        reopened.similarity_search(vectors[0].tolist(), top_k=1)
+        assert reopened.get_index_stats()["nodes"] == 300
+        assert sorted(name for name in os.listdir(tmp_path) if name.startswith("hnsw_layer0")) == [
+            "hnsw_layer0-000001.npy", "hnsw_layer0-000002.npy"
+        ]
+
+
+class TestBinaryVectorStore:
+    """二值量化索引测试"""
+    
+    def test_prefilter_rerank_and_persistence(self, tmp_path):
+        from app.services.binary_vector_store import BinaryVectorStore
+        
+        store = BinaryVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        documents, vectors = make_corpus(300)
+        store.insert_documents(documents[:200], vectors[:200])
+        store.insert_documents(documents[200:], vectors[200:])
+        assert store.get_index_stats()["code_bytes"] == 8
+        
+        results = store.similarity_search(vectors[250].tolist(), top_k=3, rerank_candidates=20)
+        assert results[0].content == "文档 250"
+        
+        # 重新打开时读取已保存的比特码，缺失的行由float向量补算
+        os.truncate(tmp_path / BinaryVectorStore.CODES_FILE, 100 * 8)
+        reopened = BinaryVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        assert reopened.get_index_stats()["codes_memory_bytes"] == 300 * 8
+        # 补算的比特码与写入时相同，预筛选和重排结果一致
+        for query in vectors[[5, 120, 260]]:
+            expected = store.similarity_search(query.tolist(), top_k=5, rerank_candidates=20)
+            results = reopened.similarity_search(query.tolist(), top_k=5, rerank_candidates=20)
+            assert [(doc.id, doc.score) for doc in results] == [(doc.id, doc.score) for doc in expected]
+        assert reopened.similarity_search(vectors[120].tolist(), top_k=1)[0].content == "文档 120"
+
+
+class TestShardedVectorStore:
+    """分片向量存储测试"""
+    
+    @staticmethod
+    def open_sharded(root, shard_count, routing="hash"):
+        from app.services.sharded_vector_store import ShardedVectorStore
+        return ShardedVectorStore.open(
+            str(root), shard_count, routing,
+            lambda path: NumpyVectorStore(index_path=path, dimension=DIMENSION)
+        )
+    
+    def test_scatter_gather_matches_single_store(self, tmp_path):
+        single = NumpyVectorStore(index_path=str(tmp_path / "single"), dimension=DIMENSION)
+        sharded = self.open_sharded(tmp_path / "sharded", 3)
+        documents, vectors = make_corpus(90)
+        ids = sharded.insert_documents(documents, vectors).ids
+        single.insert_documents(documents, vectors, ids=ids)
+        
+        assert sharded.get_document_count() == 90
+        assert all(shard.get_document_count() > 0 for shard in sharded.shards)
+        for query in vectors[[5, 33, 71]]:
+            expected = single.similarity_search(query.tolist(), top_k=5)
+            results = sharded.similarity_search(query.tolist(), top_k=5)
+            assert [doc.id for doc in results] == [doc.id for doc in expected]
+        assert sharded.get_document(ids[10]).content == "文档 10"
+        
+        seen = []
+        cursor = None
+        while True:
+            page = sharded.list_documents(cursor=cursor, limit=25)
+            seen.extend(item.id for item in page.items)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        assert sorted(seen) == sorted(ids)
+    
+    def test_source_file_routing_and_rebalance(self, tmp_path):
+        from app.services.sharded_vector_store import copy_records
+        
+        sharded = self.open_sharded(tmp_path / "old", 2, routing="source_file")
+        documents, vectors = make_corpus(30)
+        ids = sharded.insert_documents(documents, vectors).ids
+        # 同一文件的块落在同一分片
+        for shard in sharded.shards:
+            files = {doc.metadata["source_file"] for doc in shard.get_all_documents(limit=30)}
+            assert all(sharded.shard_for("", DocumentCreate(content="", metadata={"source_file": name})) == sharded.shards.index(shard) for name in files)
+        
+        with pytest.raises(ValueError):
+            self.open_sharded(tmp_path / "old", 4, routing="source_file")
+        
+        rebalanced = self.open_sharded(tmp_path / "new", 4)
+        assert copy_records(sharded, rebalanced, batch_size=7) == (30, 0)
+        assert rebalanced.get_document_count() == 30
+        assert rebalanced.get_document(ids[12]).content == "文档 12"
+        assert rebalanced.similarity_search(vectors[12].tolist(), top_k=1)[0].id == ids[12]
+
+
+class TestDeleteAndCompaction:
+    """墓碑删除与索引压缩测试"""
+    
+    def test_tombstones_hide_rows_in_every_reader(self, tmp_path):
+        writer = NumpyVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        reader = NumpyVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        documents, vectors = make_corpus(30)
+        ids = writer.insert_documents(documents, vectors).ids
+        
+        source_ids = writer.get_source_file_ids("file_1.txt")
+        assert len(source_ids) == 10
+        assert writer.delete_documents(source_ids + [ids[0], "missing"]) == 11
+        assert writer.delete_documents([ids[0]]) == 0
+        
+        # 其他实例（模拟其他worker进程）刷新后同样跳过已删除的行
+        assert reader.get_document_count() == 19
+        assert reader.get_document(ids[0]) is None
+        assert reader.similarity_search(vectors[1].tolist(), top_k=1)[0].id != ids[1]
+        assert reader.similarity_search(vectors[0].tolist(), top_k=30).__len__() == 19
+        assert reader.similarity_search(vectors[4].tolist(), top_k=5, filters={"source_file": "file_1.txt"}) == []
+        assert all(doc.id != ids[7] for doc in reader.batch_similarity_search(vectors[[7]], top_k=3)[0])
+        page = reader.list_documents(limit=5)
+        assert [item.id for item in page.items] == [ids[i] for i in (2, 3, 5, 6, 8)]
+        assert sum(len(batch[0]) for batch in reader.iter_records(batch_size=7)) == 19
+    
+    @pytest.mark.parametrize("backend", ["numpy", "ivf", "hnsw", "binary"])
+    def test_compaction_rewrites_live_rows(self, tmp_path, monkeypatch, backend):
+        from app.config.settings import settings
+        from app.services.vector_store import create_backend
+        
+        monkeypatch.setattr(settings, "vector_dimension", DIMENSION)
+        monkeypatch.setattr(settings, "ivf_min_train_size", 100)
+        monkeypatch.setattr(settings, "ivf_nlist", 8)
+        # 关闭自动后台压缩，由测试显式压缩
+        monkeypatch.setattr(settings, "compaction_min_deleted", 10 ** 9)
+        store = create_backend(backend, str(tmp_path))
+        reader = create_backend(backend, str(tmp_path))
+        documents, vectors = make_corpus(300)
+        ids = store.insert_documents(documents, vectors).ids
+        if backend == "ivf":
+            store.train()
+        
+        deleted = ids[::3]
+        store.delete_documents(deleted)
+        assert store.compact() == 100
+        assert store.compact() == 0
+        assert not os.path.exists(tmp_path / NumpyVectorStore.TOMBSTONES_FILE)
+        
+        for instance in (store, reader, create_backend(backend, str(tmp_path))):
+            assert instance.get_document_count() == 200
+            assert instance.get_document(ids[0]) is None
+            assert instance.get_document(ids[1]).content == "文档 1"
+            hit = instance.similarity_search(vectors[200].tolist(), top_k=1, recall_hint="accurate")[0]
+            assert hit.id == ids[200] and hit.content == "文档 200"
+        
+        # 压缩后仍可继续写入
+        new_id = store.insert_documents(documents[:1], vectors[:1]).ids[0]
+        assert reader.similarity_search(vectors[0].tolist(), top_k=1)[0].id == new_id
+
+    def test_compaction_keeps_in_flight_snapshot_readable(self, tmp_path):
+        store = NumpyVectorStore(index_path=str(tmp_path), dimension=DIMENSION)
+        documents, vectors = make_corpus(50)
+        ids = store.insert_documents(documents, vectors).ids
+        store.delete_documents(ids[:25])
+
+        # 压缩前开始的遍历（进行中的读取）继续读取旧文件，压缩只替换之后的读取使用的状态
+        records = store.iter_records(batch_size=10)
+        first = next(records)
+        assert store.compact() == 25
+        batches = [first] + list(records)
+        assert [doc_id for batch in batches for doc_id in batch[0]] == ids[25:]
+        assert [doc.content for batch in batches for doc in batch[1]] == [f"文档 {i}" for i in range(25, 50)]
+        np.testing.assert_allclose(np.concatenate([batch[2] for batch in batches]), vectors[25:], rtol=1e-5)
+        assert store.get_document_count() == 25
+        assert store.similarity_search(vectors[40].tolist(), top_k=1)[0].id == ids[40]